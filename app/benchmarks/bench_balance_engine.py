@@ -0,0 +1,65 @@
+# benchmarks/bench_balance_engine.py
+"""
+Свёртка балансов в процессе: цикл по словарю против numpy на разных размерах истории.
+Помогает выбрать порог BALANCE_NUMPY_MIN_ROWS.
+
+Запуск из каталога app/:
+    python -m benchmarks.bench_balance_engine [--sizes 1000,10000,50000,200000] [--url postgresql+psycopg2://...]
+
+На Postgres numpy-путь читает колонки через COPY (FORMAT binary); на других БД строки
+приходят Python-кортежами и numpy их только перекладывает в массивы — выигрыша там почти нет.
+"""
+from __future__ import annotations
+
+import argparse
+
+import numpy as np
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from benchmarks.bench_rebuild import CHAT_ID, seed, timed
+from repositories import TransactionsRepoSqlModel
+from services.balance_engine import fold_dict, fold_numpy, parse_copy_binary
+
+
+def numpy_path(txs: TransactionsRepoSqlModel):
+    if txs.supports_binary_copy():
+        return fold_numpy(*parse_copy_binary(txs.copy_share_rows_binary(chat_id=CHAT_ID)))
+    rows = txs.share_rows(chat_id=CHAT_ID)
+    return fold_numpy(*(np.array(col, dtype=np.int64) for col in zip(*rows)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,50000,200000")
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    if args.url.startswith("sqlite"):
+        engine = create_engine(args.url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.url)
+
+    print(f"url={args.url} members={args.members}")
+    print(f"{'rows':>9} {'dict ms':>9} {'numpy ms':>9} {'speedup':>8}")
+    for txs_count in (int(s) for s in args.sizes.split(",")):
+        SQLModel.metadata.drop_all(engine)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            seed(session, txs=txs_count, members=args.members)
+            txs = TransactionsRepoSqlModel(session)
+
+            dict_s, dict_res = timed(lambda: fold_dict(txs.share_rows(chat_id=CHAT_ID)), args.repeat)
+            numpy_s, numpy_res = timed(lambda: numpy_path(txs), args.repeat)
+            assert dict_res == numpy_res
+
+            rows = txs.count_share_rows(chat_id=CHAT_ID)
+        print(f"{rows:>9} {dict_s * 1000:>9.1f} {numpy_s * 1000:>9.1f} {dict_s / numpy_s:>7.1f}x")
+
+    SQLModel.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
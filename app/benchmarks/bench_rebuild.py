@@ -0,0 +1,128 @@
+# benchmarks/bench_rebuild.py
+"""
+Сравнение подсчёта балансов: исходный цикл (1 + N SELECT), потоковый проход по истории (keyset-страницы)
+и один GROUP BY-запрос.
+
+Запуск из каталога app/:
+    python -m benchmarks.bench_rebuild [--txs 10000] [--members 20] [--url sqlite:///bench.db]
+
+По умолчанию используется SQLite в памяти; для Postgres передай --url с DSN.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict
+
+from sqlalchemy import insert
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from models.users import User
+from models.chats import Chat
+from models.transactions import Transaction
+from models.transaction_participants import TransactionParticipant
+from models.debts import Debt
+from repositories import (
+    UsersRepoSqlModel,
+    TransactionsRepoSqlModel,
+    TransactionParticipantsRepoSqlModel,
+    DebtsRepoSqlModel,
+)
+from services.debts_service import DebtsService
+
+CHAT_ID = -100500
+
+
+def seed(session: Session, *, txs: int, members: int, parts_per_tx: int = 3) -> None:
+    """Заливаем историю чата пачками, минуя CRUD (иначе сидинг займёт дольше замера)."""
+    rnd = random.Random(42)
+    user_ids = list(range(1, members + 1))
+    session.execute(insert(User), [{"id": uid, "username": f"u{uid}", "first_name": None} for uid in user_ids])
+    session.execute(insert(Chat), [{"id": CHAT_ID, "title": "bench"}])
+    session.execute(
+        insert(Transaction),
+        [
+            {"id": i, "chat_id": CHAT_ID, "creator_id": rnd.choice(user_ids), "amount": 30000, "title": "bench"}
+            for i in range(1, txs + 1)
+        ],
+    )
+    session.execute(
+        insert(TransactionParticipant),
+        [
+            {"transaction_id": i, "user_id": uid, "share_amount": 10000, "tag": "bench"}
+            for i in range(1, txs + 1)
+            for uid in rnd.sample(user_ids, parts_per_tx)
+        ],
+    )
+    session.commit()
+
+
+def balances_per_transaction(service: DebtsService, chat_id: int) -> Dict[int, int]:
+    """
+    Исходный подсчёт балансов: обход транзакций и отдельный SELECT участников на каждую (1 + N запросов).
+    Из сервиса он ушёл, здесь оставлен как точка отсчёта.
+    """
+    balances: Dict[int, int] = {}
+    for tx in service.txs.list_by_chat(chat_id=chat_id, limit=2 ** 31 - 1, offset=0):
+        creator_id = tx.creator_id
+        balances.setdefault(creator_id, 0)
+        for p in service.parts.list_by_transaction(transaction_id=tx.id):
+            balances[p.user_id] = balances.get(p.user_id, 0) - p.share_amount
+            balances[creator_id] += p.share_amount
+    return balances
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--txs", type=int, default=10_000)
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    if args.url.startswith("sqlite"):
+        engine = create_engine(args.url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        seed(session, txs=args.txs, members=args.members)
+        service = DebtsService(
+            session=session,
+            debts_repo=DebtsRepoSqlModel(session),
+            tx_repo=TransactionsRepoSqlModel(session),
+            parts_repo=TransactionParticipantsRepoSqlModel(session),
+            users_repo=UsersRepoSqlModel(session),
+        )
+
+        loop_s, loop_res = timed(lambda: balances_per_transaction(service, CHAT_ID), args.repeat)
+        stream_s, stream_res = timed(lambda: service._balances_streamed(CHAT_ID), args.repeat)
+        agg_s, agg_res = timed(lambda: service.txs.balances_by_chat(chat_id=CHAT_ID), args.repeat)
+
+        assert loop_res == stream_res == agg_res
+
+    print(f"transactions={args.txs} members={args.members} url={args.url}")
+    print(f"  loop (1+N SELECT):     {loop_s * 1000:9.1f} ms")
+    print(f"  stream (keyset pages): {stream_s * 1000:9.1f} ms  (x{loop_s / stream_s:.1f} к циклу)")
+    print(f"  GROUP BY (1 SELECT):   {agg_s * 1000:9.1f} ms  (x{loop_s / agg_s:.1f} к циклу, "
+          f"x{stream_s / agg_s:.1f} к потоку)")
+
+    SQLModel.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
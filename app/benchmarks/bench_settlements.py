@@ -0,0 +1,67 @@
+# benchmarks/bench_settlements.py
+"""
+Сравнение планов взаиморасчётов на группах 5–40 человек: число переводов и время.
+
+Запуск из каталога app/:
+    python -m benchmarks.bench_settlements [--sizes 5,10,15,20,25,30,40] [--budget-ms 500] [--seeds 5]
+
+Балансы генерируются «как в жизни»: несколько общих трат, каждая делится между случайной подгруппой.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict
+
+from services.settlement import greedy_settlements, exact_settlements, SettlementBudgetExceeded
+
+
+def random_balances(rnd: random.Random, members: int) -> Dict[int, int]:
+    cents = {uid: 0 for uid in range(1, members + 1)}
+    for _ in range(members * 2):
+        payer = rnd.randint(1, members)
+        group = rnd.sample(range(1, members + 1), rnd.randint(2, min(6, members)))
+        share = rnd.randint(1, 50) * 100
+        for uid in group:
+            cents[uid] -= share
+            cents[payer] += share
+    return cents
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="5,10,15,20,25,30,40")
+    parser.add_argument("--budget-ms", type=int, default=500)
+    parser.add_argument("--seeds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'members':>7} {'greedy':>7} {'exact':>7} {'greedy ms':>10} {'exact ms':>9} {'fallbacks':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        greedy_n = exact_n = fallbacks = 0
+        greedy_t = exact_t = 0.0
+        for seed in range(args.seeds):
+            balances = random_balances(random.Random(seed), size)
+
+            started = time.perf_counter()
+            greedy = greedy_settlements(balances)
+            greedy_t += time.perf_counter() - started
+            greedy_n += len(greedy)
+
+            started = time.perf_counter()
+            try:
+                exact = exact_settlements(balances, max_members=size, time_budget=args.budget_ms / 1000)
+            except SettlementBudgetExceeded:
+                exact = greedy
+                fallbacks += 1
+            exact_t += time.perf_counter() - started
+            exact_n += len(exact)
+
+        print(
+            f"{size:>7} {greedy_n / args.seeds:>7.1f} {exact_n / args.seeds:>7.1f} "
+            f"{greedy_t / args.seeds * 1000:>10.2f} {exact_t / args.seeds * 1000:>9.1f} {fallbacks:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_webhook.py
+"""
+Пропускная способность webhook-режима: фейковые апдейты Telegram POST-запросами в локальный aiohttp-сервер.
+
+Запуск из каталога app/:
+    python -m benchmarks.bench_webhook [--updates 5000] [--connections 40] [--concurrency 32] [--work-ms 0]
+
+Апдейты проходят настоящий хендлер авторегистрации (только буфер в памяти, БД не нужна).
+--work-ms — сколько миллисекунд хендлер «работает» после авторегистрации: видно, как max_concurrency
+ограничивает обработку, пока ответы 200 уходят сразу. --connections — параллельные соединения
+клиента (у Telegram max_connections по умолчанию 40).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiohttp import web
+
+from bot.handlers import autoregister
+from bot.webhook import WEBHOOK_HANDLER, build_webhook_app
+
+SECRET = "bench-secret"
+PATH = "/webhook"
+
+
+def fake_update(update_id: int, members: int) -> dict:
+    user_id = 1000 + update_id % members
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": -100 - update_id % 10, "type": "group", "title": "bench"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U", "username": f"u{user_id}"},
+            "text": "привет",
+        },
+    }
+
+
+def make_dispatcher(work_ms: float) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def handle(message) -> None:
+        await autoregister.auto_register(message)
+        if work_ms > 0:
+            await asyncio.sleep(work_ms / 1000)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def run(args: argparse.Namespace) -> None:
+    app = build_webhook_app(make_dispatcher(args.work_ms), Bot("42:BENCH"), path=PATH, secret_token=SECRET,
+                            max_concurrency=args.concurrency, max_pending=args.updates)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}{PATH}"
+    handler = app[WEBHOOK_HANDLER]
+
+    async def post(client: aiohttp.ClientSession, update_id: int) -> int:
+        async with client.post(url, json=fake_update(update_id, args.members),
+                               headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as resp:
+            return resp.status
+
+    try:
+        connector = aiohttp.TCPConnector(limit=args.connections)
+        async with aiohttp.ClientSession(connector=connector) as client:
+            started = time.perf_counter()
+            statuses = await asyncio.gather(*(post(client, i) for i in range(1, args.updates + 1)))
+            accepted_s = time.perf_counter() - started
+            await handler.drain()
+            processed_s = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+
+    stats = handler.stats()
+    print(f"updates={args.updates} connections={args.connections} concurrency={args.concurrency} "
+          f"work={args.work_ms}ms")
+    print(f"  200 OK:            {statuses.count(200):>9}")
+    print(f"  all accepted in:   {accepted_s * 1000:9.1f} ms  ({args.updates / accepted_s:,.0f} updates/s)")
+    print(f"  all processed in:  {processed_s * 1000:9.1f} ms  ({args.updates / processed_s:,.0f} updates/s)")
+    print(f"  max in flight:     {stats['max_in_flight']:>9}  (принято, ещё не обработано)")
+    print(f"  max running:       {stats['max_running']:>9}  (<= concurrency)")
+    print(f"  failed:            {stats['failed']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--work-ms", type=float, default=0.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ all_routers = [
     basic.router,
     help.router,
     adduser.router,
-    transactions.router
-    # autoregister.router
+    transactions.router,
+    # последним: ловит все сообщения, которые не разобрали команды выше
+    autoregister.router,
 ]
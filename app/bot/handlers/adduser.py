@@ -2,19 +2,16 @@
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from bot.utils.ensure_ctx import ensure_user_and_chat
-from repositories import (
-    UsersRepoSqlModel,
-    ChatsRepoSqlModel,
-)
+from bot.utils.ensure_ctx import ensure_user_and_chat_async
+from repositories import AsyncUsersRepo, AsyncChatsRepo
 
 router = Router()
 
 
 @router.message(Command("adduser"))
-async def cmd_adduser(message: Message, db_session: Session):
+async def cmd_adduser(message: Message, db_session: AsyncSession):
     """
     Использование: ответь на сообщение пользователя и введи /adduser
     Бот добавит (или обновит) этого пользователя в БД и зарегистрирует чат.
@@ -26,18 +23,18 @@ async def cmd_adduser(message: Message, db_session: Session):
     target = message.reply_to_message.from_user  # тот, кого добавляем
     chat = message.chat
 
-    users_repo = UsersRepoSqlModel(db_session)
-    chats_repo = ChatsRepoSqlModel(db_session)
+    users_repo = AsyncUsersRepo(db_session)
+    chats_repo = AsyncChatsRepo(db_session)
 
     # проверим, есть ли чат
-    chat_row = chats_repo.get(id=chat.id)
+    chat_row = await chats_repo.get(id=chat.id)
     if not chat_row:
         # создаём новый чат, если нет
-        ensure_user_and_chat(db_session, tg_user=target, tg_chat=chat)
-        chat_row = chats_repo.get(id=chat.id)
+        await ensure_user_and_chat_async(db_session, tg_user=target, tg_chat=chat)
+        chat_row = await chats_repo.get(id=chat.id)
 
     # проверим, есть ли юзер
-    user_row = users_repo.get(id=target.id)
+    user_row = await users_repo.get(id=target.id)
     if user_row:
         await message.answer(
             f"Пользователь уже есть в БД:\n"
@@ -48,8 +45,8 @@ async def cmd_adduser(message: Message, db_session: Session):
         return
 
     # если юзера ещё нет → добавим
-    ensure_user_and_chat(db_session, tg_user=target, tg_chat=chat)
-    user_row = users_repo.get(id=target.id)
+    await ensure_user_and_chat_async(db_session, tg_user=target, tg_chat=chat)
+    user_row = await users_repo.get(id=target.id)
 
     await message.answer(
         f"Ок! Пользователь добавлен в БД:\n"
@@ -1,10 +1,7 @@
 # bot/handlers/autoregister.py
-from pickle import FALSE
-
 from aiogram import Router
 from aiogram.types import Message
-from sqlmodel import Session
-from bot.utils.ensure_ctx import ensure_user_and_chat
+from services.autoregistration import autoregistration
 from logger.logging import get_logger
 
 logger = get_logger(logger_name=__name__)
@@ -13,10 +10,11 @@ router = Router()
 
 
 @router.message(flags={'block': False})  # реагирует на любое сообщение
-async def auto_register(message: Message, db_session: Session):
+async def auto_register(message: Message):
     """
-    Автоматически регистрируем юзера и чат в базе,
-    если их ещё не было.
+    Автоматически регистрируем юзера и чат в базе, если их ещё не было.
+    В БД не ходим: пара попадает в буфер services.autoregistration и пишется пачкой в фоне.
     """
-    ensure_user_and_chat(db_session, tg_user=message.from_user, tg_chat=message.chat)
-    logger.info("Пользователь проверен")
+    if message.from_user is None:  # посты каналов
+        return
+    autoregistration.add(message.from_user, message.chat)
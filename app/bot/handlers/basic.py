@@ -2,91 +2,125 @@ from aiogram import Router, F
 from aiogram.enums import MessageEntityType
 from aiogram.filters import Command
 from aiogram.types import Message
-from sqlmodel import Session
-from bot.utils.ensure_ctx import ensure_user_and_chat
-from bot.utils.formatting import format_user
+from sqlmodel.ext.asyncio.session import AsyncSession
+from bot.utils.ensure_ctx import ensure_user_and_chat_async
+from bot.utils.formatting import UserNames, format_user
 from logger.logging import get_logger
 
-# репозитории и сервисы из твоего проекта:
-from repositories import (
-    UsersRepoSqlModel,
-    ChatsRepoSqlModel,
-    TransactionsRepoSqlModel,
-    TransactionParticipantsRepoSqlModel,
-    DebtsRepoSqlModel,
-)
-from services.transactions_service import TransactionsService
-from services.debts_service import DebtsService
+from services.async_services import build_async_services
+from services.settlement import MODES
+from services.worker_pool import WorkerPoolBusy
+from services.rebuild_scheduler import rebuild_scheduler
+from services.money import parse_amount, format_amount, split_evenly
 
 router = Router()
 logger = get_logger(logger_name=__name__)
 
+# Ответ при переполненном пуле воркеров (см. services.worker_pool): лучше отказать сразу, чем копить очередь
+BUSY_TEXT = "Сейчас много тяжёлых расчётов, повтори команду через несколько секунд."
+# Фоновый /rebuild чата не закончился за REBUILD_WAIT_TIMEOUT (см. services.rebuild_scheduler)
+REBUILDING_NOTE = "⏳ Идёт пересчёт балансов — цифры могут обновиться, проверь /balance чуть позже."
+REBUILDING_TEXT = "Идёт пересчёт балансов чата, повтори команду через несколько секунд."
 
-def build_services(session: Session):
-    users = UsersRepoSqlModel(session)
-    chats = ChatsRepoSqlModel(session)
-    txs = TransactionsRepoSqlModel(session)
-    parts = TransactionParticipantsRepoSqlModel(session)
-    debts = DebtsRepoSqlModel(session)
 
-    tx_service = TransactionsService(
-        session=session,
-        tx_repo=txs,
-        parts_repo=parts,
-        debts_repo=debts,
-    )
-    debts_service = DebtsService(
-        session=session,
-        debts_repo=debts,
-        tx_repo=txs,
-        parts_repo=parts,
-        users_repo=users,
-    )
-    return users, chats, tx_service, debts_service
+def build_services(session: AsyncSession):
+    services = build_async_services(session)
+    return services.users, services.chats, services.tx_service, services.debts_service
 
 
 @router.message(Command('start'))
-async def cmd_start(message: Message, db_session: Session):
+async def cmd_start(message: Message, db_session: AsyncSession):
     await message.answer("Привет! Я помогу разделять расходы.\nКоманды: /addtx, /balance, /optimize, /settle_all, /help")
 
 
 @router.message(Command("balance"))
-async def cmd_balance(message: Message, db_session: Session):
-    users_repo, _, _, debts_service = build_services(db_session)
+async def cmd_balance(message: Message, db_session: AsyncSession):
+    _, _, _, debts_service = build_services(db_session)
     chat_id = message.chat.id
-    rows = debts_service.debts.list_by_chat(chat_id=chat_id, limit=1000, offset=0)
+    # Ждём только если по чату идёт /rebuild
+    rebuilt = await rebuild_scheduler.wait(chat_id)
+    rows = await debts_service.get_balances(chat_id, limit=1000)
     if not rows:
         await message.answer("Балансов пока нет. Добавь транзакцию: /addtx 100 Пицца @user1 @user2")
         return
-    lines = [f"user {format_user(d.user_id, users_repo)}: {d.amount:.2f}" for d in rows]
+    names = await UserNames.load_async(db_session, (user_id for user_id, _ in rows))
+    lines = [f"user {format_user(user_id, names)}: {format_amount(amount)}" for user_id, amount in rows]
+    if not rebuilt:
+        lines.append(REBUILDING_NOTE)
     await message.answer("Текущие балансы:\n" + "\n".join(lines))
 
 
 @router.message(Command("optimize"))
-async def cmd_optimize(message: Message, db_session: Session):
-    users_repo, _, _, debts_service = build_services(db_session)
+async def cmd_optimize(message: Message, db_session: AsyncSession):
+    """
+    /optimize [auto|exact|greedy] — план переводов; exact ищет минимум переводов (в пределах бюджета).
+    """
+    _, _, _, debts_service = build_services(db_session)
     chat_id = message.chat.id
-    plan = debts_service.optimize_settlements(chat_id)
+
+    args = (message.text or "").split()
+    mode = args[1].lower() if len(args) >= 2 else None
+    if mode is not None and mode not in MODES:
+        await message.answer("Режим: /optimize [auto|exact|greedy]")
+        return
+
+    if not await rebuild_scheduler.wait(chat_id):
+        await message.answer(REBUILDING_TEXT)
+        return
+    try:
+        plan = await debts_service.optimize_settlements(chat_id, mode=mode)
+    except WorkerPoolBusy:
+        await message.answer(BUSY_TEXT)
+        return
     if not plan:
         await message.answer("Долгов нет — всё по нулям!")
         return
-    lines = [f"{format_user(frm, users_repo)} → {format_user(to, users_repo)}: {amount:.2f}" for frm, to, amount in plan]
+    names = await UserNames.load_async(db_session, (uid for frm, to, _ in plan for uid in (frm, to)))
+    lines = [
+        f"{format_user(frm, names)} → {format_user(to, names)}: {format_amount(amount)}"
+        for frm, to, amount in plan
+    ]
     await message.answer("Минимальный план переводов:\n" + "\n".join(lines))
 
 
 @router.message(Command("settle_all"))
-async def cmd_settle_all(message: Message, db_session: Session):
+async def cmd_settle_all(message: Message, db_session: AsyncSession):
     _, _, _, debts_service = build_services(db_session)
     chat_id = message.chat.id
-    plan = debts_service.settle_all_debts_via_transactions(chat_id)
+    # Гасить по балансам, которые вот-вот перезапишет пересчёт, нельзя
+    if not await rebuild_scheduler.wait(chat_id):
+        await message.answer(REBUILDING_TEXT)
+        return
+    # Повторная доставка того же сообщения не создаст погашения второй раз
+    try:
+        plan = await debts_service.settle_all_debts_via_transactions(
+            chat_id, batch_id=f"{chat_id}:{message.message_id}"
+        )
+    except WorkerPoolBusy:
+        # План ещё не записан — повтор той же командой безопасен
+        await message.answer(BUSY_TEXT)
+        return
     if not plan:
         await message.answer("Нечего гасить — долги отсутствуют.")
         return
-    await message.answer("Создал транзакции погашения. Пересчитали балансы.\nВведи /balance чтобы посмотреть.")
+    await message.answer("Создал транзакции погашения, балансы обнулены.\nВведи /balance чтобы посмотреть.")
+
+
+@router.message(Command("rebuild"))
+async def cmd_rebuild(message: Message, db_session: AsyncSession):
+    """
+    Явная починка: полный пересчёт балансов чата по всей истории транзакций.
+    В обычном режиме балансы поддерживаются дельтами при /addtx и /del.
+    Пересчёт идёт в фоне (services.rebuild_scheduler): повторные /rebuild до его начала сливаются в один.
+    """
+    if rebuild_scheduler.request(message.chat.id):
+        await message.answer("Пересчитываю балансы по всей истории. /balance покажет результат, когда закончу.")
+    else:
+        await message.answer("Пересчёт балансов уже в очереди — этот запрос объединён с ним.")
 
 
 @router.message(F.text.startswith("/addtx"))
-async def cmd_addtx(message: Message, db_session: Session):
+async def cmd_addtx(message: Message, db_session: AsyncSession):
     """
     Формат: /addtx <сумма> <название...> [@username ...]
     - Если есть упоминания: доля будет поделена между УПОМИНУТЫМИ пользователями.
@@ -96,7 +130,7 @@ async def cmd_addtx(message: Message, db_session: Session):
     users_repo, _, tx_service, debts_service = build_services(db_session)
 
     # Убедимся, что текущий юзер и чат есть в БД
-    ensure_user_and_chat(db_session, tg_user=message.from_user, tg_chat=message.chat)
+    await ensure_user_and_chat_async(db_session, tg_user=message.from_user, tg_chat=message.chat)
 
     chat_id = message.chat.id
     creator_id = message.from_user.id
@@ -110,9 +144,9 @@ async def cmd_addtx(message: Message, db_session: Session):
         await message.answer("Формат: /addtx &lt;сумма&gt; &lt;название&gt; [@user ...]")
         return
 
-    # 1) сумма
+    # 1) сумма (в копейках)
     try:
-        amount = float(parts[1].replace(",", "."))
+        amount = parse_amount(parts[1])
     except ValueError:
         await message.answer("Сумма должна быть числом. Пример: /addtx 120.5 Ужин @vasya @petya")
         return
@@ -128,28 +162,8 @@ async def cmd_addtx(message: Message, db_session: Session):
         for ent in message.entities:
             if ent.type == MessageEntityType.TEXT_MENTION and ent.user:
                 typed_mentions.add(ent.user.id)
-                tg = ent.use
-
-                # upsert напрямую через сессию
-                db_user = users_repo.get(tg.id)
-                if db_user is None:
-                    db_user = users_repo.create(
-                        id=tg.id,
-                        username=tg.username,
-                        first_name=tg.first_name
-                    )
-                    db_session.add(db_user)
-                else:
-                    # обновим, если что-то поменялось
-                    changed = False
-                    if db_user.username != tg.username:
-                        db_user.username = tg.username
-                        changed = True
-                    if db_user.first_name != tg.first_name:
-                        db_user.first_name = tg.first_name
-                        changed = True
-                    if changed:
-                        db_session.add(db_user)
+                # upsert через репозиторий: он же сбрасывает кэш отображаемых имён
+                await users_repo.upsert(id=ent.user.id, username=ent.user.username, first_name=ent.user.first_name)
 
             elif ent.type == MessageEntityType.MENTION:
                 # вырезаем "@name" из текста по offsets
@@ -167,7 +181,7 @@ async def cmd_addtx(message: Message, db_session: Session):
     unknown_usernames = []
     if at_usernames:
         # Можно разом: users_repo.get_many_by_usernames
-        found_users = users_repo.get_many_by_usernames(at_usernames)
+        found_users = await users_repo.get_many_by_usernames(at_usernames)
         by_uname = {u.username.lower(): u for u in found_users if u.username}
 
         for uname in at_usernames:
@@ -188,20 +202,16 @@ async def cmd_addtx(message: Message, db_session: Session):
     # 5) формируем участников
     participants = []
     if resolved_ids:
-        # делим сумму поровну между упомянутыми
-        share = round(amount / len(resolved_ids), 2)
-        # чтобы суммарно совпало, последнему можно докинуть «хвостик»
-        ids_list = list(resolved_ids)
-        tail_fix = round(amount - share * len(ids_list), 2)
-        for idx, uid in enumerate(ids_list):
-            s = share + (tail_fix if idx == len(ids_list) - 1 else 0.0)
-            participants.append((uid, s, "ручной ввод"))
+        # делим сумму поровну между упомянутыми; остаток копеек — методом наибольших остатков
+        ids_list = sorted(resolved_ids)
+        for uid, share in zip(ids_list, split_evenly(amount, len(ids_list))):
+            participants.append((uid, share, "ручной ввод"))
     else:
         # нет упоминаний — участник = сам автор
         participants = [(creator_id, amount, "ручной ввод")]
 
     # 5) создаём транзакцию + добавляем участников
-    tx = tx_service.create_transaction_with_participants(
+    tx = await tx_service.create_transaction_with_participants(
         chat_id=chat_id,
         creator_id=creator_id,
         amount=amount,
@@ -209,7 +219,5 @@ async def cmd_addtx(message: Message, db_session: Session):
         participants=participants
     )
 
-    # 6) пересчитываем балансы
-    debts_service.rebuild(chat_id=chat_id)
-
-    await message.answer(f"Ок! Добавил транзакцию: {amount:.2f} — {title}")
+    # 6) балансы уже обновлены дельтами внутри create_transaction_with_participants
+    await message.answer(f"Ок! Добавил транзакцию: {format_amount(amount)} — {title}")
@@ -1,14 +1,14 @@
 from aiogram import Router, F
 from aiogram.types import Message
-from bot.utils.ensure_ctx import ensure_user_and_chat
-from sqlmodel import Session
+from bot.utils.ensure_ctx import ensure_user_and_chat_async
+from sqlmodel.ext.asyncio.session import AsyncSession
 from aiogram.filters import Command
 
 router = Router()
 
 
 @router.message(Command("help"))
-async def cmd_help(message: Message, db_session: Session):
+async def cmd_help(message: Message, db_session: AsyncSession):
     text = (
         "📖 <b>Справка по командам</b>\n\n"
         "➕ <b>/addtx</b> (сумма) (название) [@user ...]\n"
@@ -20,14 +20,24 @@ async def cmd_help(message: Message, db_session: Session):
         "  Показать текущие балансы пользователей в чате.\n"
         "  Пример: <code>/balance</code>\n\n"
 
-        "📉 <b>/optimize</b>\n"
+        "📉 <b>/optimize</b> [auto|exact|greedy]\n"
         "  Показать минимальный план переводов, чтобы все долги закрылись.\n"
-        "  Пример: <code>/optimize</code>\n\n"
+        "  exact — меньше всего переводов, greedy — быстрый жадный план.\n"
+        "  Пример: <code>/optimize exact</code>\n\n"
 
         "✅ <b>/settle_all</b>\n"
         "  Автоматически создать транзакции для погашения всех долгов и пересчитать баланс.\n"
         "  Пример: <code>/settle_all</code>\n\n"
 
+        "🗑 <b>/del</b> (id) [id ...] [от-до]\n"
+        "  Удалить одну или несколько транзакций чата, балансы откатятся сами.\n"
+        "  Пример: <code>/del 12 15 20-30</code>\n\n"
+
+        "🛠 <b>/rebuild</b>\n"
+        "  Пересчитать балансы с нуля по всей истории (если что-то разъехалось). Идёт в фоне,\n"
+        "  /balance дождётся результата.\n"
+        "  Пример: <code>/rebuild</code>\n\n"
+
         "🚀 <b>/start</b>\n"
         "  Начало работы и короткая инструкция.\n\n"
         
@@ -35,5 +45,5 @@ async def cmd_help(message: Message, db_session: Session):
         "Добавить пользователя в базу.\n"
         "Пример: <code>/adduser</code> [ответ на сообщение]\n\n"
     )
-    ensure_user_and_chat(db_session, tg_user=message.from_user, tg_chat=message.chat)
+    await ensure_user_and_chat_async(db_session, tg_user=message.from_user, tg_chat=message.chat)
     await message.answer(text, parse_mode="HTML")
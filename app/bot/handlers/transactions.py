@@ -2,125 +2,142 @@
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message
-from sqlmodel import Session
-
-from bot.utils.ensure_ctx import ensure_user_and_chat
-from repositories import (
-    UsersRepoSqlModel,
-    TransactionsRepoSqlModel,
-    TransactionParticipantsRepoSqlModel,
-    DebtsRepoSqlModel,
-)
-from services.transactions_service import TransactionsService
-from services.debts_service import DebtsService
-from bot.utils.formatting import format_user
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from bot.utils.ensure_ctx import ensure_user_and_chat_async
+from services.async_services import build_async_services
+from bot.utils.formatting import display_user
+from bot.utils.pagination import encode_cursor, decode_cursor
+from services.money import format_amount
 
 router = Router()
 
 
-def build_services(session: Session):
-    users = UsersRepoSqlModel(session)
-    txs = TransactionsRepoSqlModel(session)
-    parts = TransactionParticipantsRepoSqlModel(session)
-    debts = DebtsRepoSqlModel(session)
-
-    tx_service = TransactionsService(
-        session=session,
-        tx_repo=txs,
-        parts_repo=parts,
-        debts_repo=debts,
-    )
-    debts_service = DebtsService(
-        session=session,
-        debts_repo=debts,
-        tx_repo=txs,
-        parts_repo=parts,
-        users_repo=users,
-    )
-    return users, txs, parts, tx_service, debts_service
+def build_services(session: AsyncSession):
+    services = build_async_services(session)
+    return services.users, services.txs, services.tx_service, services.debts_service
 
 
 @router.message(Command("history"))
-async def cmd_history(message: Message, db_session: Session):
+async def cmd_history(message: Message, db_session: AsyncSession):
     """
-    /history [N] — показать последние N транзакций чата (по умолчанию 20).
+    /history [N] [курсор] — показать N транзакций чата (по умолчанию 20), новые первыми.
+    Если есть более старые, в конце ответа — команда со следующим курсором.
+    Страницы идут по keyset (id < курсора), поэтому десятая страница не дороже первой.
+    Транзакции, участники и имена загружаются одним набором запросов (list_with_participants),
+    отрисовка в БД больше не ходит.
     """
-    ensure_user_and_chat(db_session, tg_user=message.from_user, tg_chat=message.chat)
-    users_repo, txs_repo, parts_repo, _, _ = build_services(db_session)
+    await ensure_user_and_chat_async(db_session, tg_user=message.from_user, tg_chat=message.chat)
+    _, txs_repo, _, _ = build_services(db_session)
 
     chat_id = message.chat.id
 
-    # Попробуем вытащить лимит из команды: "/history 10"
+    # "/history 10" — лимит, "/history 10 aDEyMw" — лимит и курсор следующей страницы
     limit = 20
-    try:
-        parts = (message.text or "").split()
-        if len(parts) >= 2:
-            limit = max(1, min(100, int(parts[1])))
-    except Exception:
-        pass
-
-    tx_list = txs_repo.list_by_chat(chat_id=chat_id, limit=limit, offset=0)
+    before_id = None
+    for arg in (message.text or "").split()[1:]:
+        if arg.isdigit():
+            limit = max(1, min(100, int(arg)))
+            continue
+        try:
+            before_id = decode_cursor(arg)
+        except ValueError:
+            await message.answer("Непонятный курсор. Начните заново: /history")
+            return
+
+    # На одну строку больше, чтобы без COUNT узнать, есть ли следующая страница
+    tx_list = await txs_repo.list_with_participants(chat_id=chat_id, limit=limit + 1, before_id=before_id)
+    has_more = len(tx_list) > limit
+    tx_list = tx_list[:limit]
     if not tx_list:
-        await message.answer("В этом чате ещё нет транзакций.")
+        await message.answer("Больше транзакций нет." if before_id else "В этом чате ещё нет транзакций.")
         return
 
     lines = []
     for tx in tx_list:
-        creator = format_user(tx.creator_id, users_repo)
+        creator = display_user(tx.creator, tx.creator_id)
         title = tx.title or "Без названия"
-        lines.append(f"#{tx.id} • {title}\n  Сумма: {tx.amount:.2f}\n  Создатель: {creator}")
+        lines.append(f"#{tx.id} • {title}\n  Сумма: {format_amount(tx.amount)}\n  Создатель: {creator}")
 
-        parts = parts_repo.list_by_transaction(transaction_id=tx.id)
+        parts = sorted(tx.participants, key=lambda p: p.id)
         if parts:
             p_lines = []
             for p in parts:
-                who = format_user(p.user_id, users_repo)
-                p_lines.append(f"    — {who}: {p.share_amount:.2f} ({p.tag})")
+                who = display_user(p.user, p.user_id)
+                p_lines.append(f"    — {who}: {format_amount(p.share_amount)} ({p.tag})")
             lines.append("  Участники:\n" + "\n".join(p_lines))
         else:
             lines.append("  Участников нет")
 
-    text = "Последние транзакции:\n\n" + "\n\n".join(lines)
+    header = "Более ранние транзакции:" if before_id else "Последние транзакции:"
+    text = header + "\n\n" + "\n\n".join(lines)
+    if has_more:
+        text += f"\n\nДальше: /history {limit} {encode_cursor(tx_list[-1].id)}"
     # Без HTML/Markdown, чтобы не ловить ошибок парсинга
     await message.answer(text)
 
 
+# Верхняя граница на одну команду /del, чтобы "/del 1-1000000" не превратился в огромный запрос
+MAX_DELETE_IDS = 500
+
+
+def parse_transaction_ids(args: str) -> list[int]:
+    """
+    "12 15 20-30" -> [12, 15, 20, 21, ..., 30]. Разделители — пробелы и запятые.
+    Бросает ValueError на мусоре, перевёрнутом диапазоне и превышении MAX_DELETE_IDS.
+    """
+    ids: set[int] = set()
+    for token in args.replace(",", " ").split():
+        if "-" in token:
+            start, end = (int(x) for x in token.split("-", 1))
+            if start > end:
+                raise ValueError(f"Bad range: {token}")
+            if end - start + 1 > MAX_DELETE_IDS:
+                raise ValueError(f"Range too large: {token}")
+            ids.update(range(start, end + 1))
+        else:
+            ids.add(int(token))
+        if len(ids) > MAX_DELETE_IDS:
+            raise ValueError("Too many ids")
+    if not ids:
+        raise ValueError("No ids")
+    return sorted(ids)
+
+
 @router.message(Command("del"))
-async def cmd_delete(message: Message, db_session: Session):
+async def cmd_delete(message: Message, db_session: AsyncSession):
     """
-    /del <id> — удалить транзакцию по идентификатору.
-    Удаляет участников и саму транзакцию, затем пересчитывает балансы.
+    /del <id> [<id> ...] [<from>-<to> ...] — удалить одну или несколько транзакций чата.
+    Все перечисленные транзакции удаляются одним DELETE, участники — каскадом в БД;
+    балансы откатываются дельтами в том же сервисе.
     """
-    ensure_user_and_chat(db_session, tg_user=message.from_user, tg_chat=message.chat)
-    users_repo, txs_repo, parts_repo, tx_service, debts_service = build_services(db_session)
+    await ensure_user_and_chat_async(db_session, tg_user=message.from_user, tg_chat=message.chat)
+    _, _, tx_service, _ = build_services(db_session)
 
     chat_id = message.chat.id
 
     parts = (message.text or "").split(maxsplit=1)
     if len(parts) < 2:
-        await message.answer("Формат: /del &lt;id_транзакции&gt;")
+        await message.answer("Формат: /del &lt;id&gt; [&lt;id&gt; ...] [&lt;от&gt;-&lt;до&gt;]. Пример: /del 12 15 20-30")
         return
 
     try:
-        tx_id = int(parts[1])
+        tx_ids = parse_transaction_ids(parts[1])
     except ValueError:
-        await message.answer("ID транзакции должен быть числом. Пример: /del 42")
+        await message.answer(
+            f"ID транзакций — числа или диапазоны, не больше {MAX_DELETE_IDS} за раз. Пример: /del 12 15 20-30"
+        )
         return
 
-    tx = txs_repo.get(tx_id)
-    if not tx:
-        await message.answer(f"Транзакция #{tx_id} не найдена.")
-        return
-    if int(tx.chat_id) != int(chat_id):
-        await message.answer("Нельзя удалить транзакцию из другого чата.")
+    # Удаляются только транзакции этого чата: чужие id просто не найдутся
+    deleted = await tx_service.delete_transactions(chat_id=chat_id, transaction_ids=tx_ids)
+    if not deleted:
+        await message.answer("Транзакции не найдены в этом чате.")
         return
 
-    ok = tx_service.delete_transaction(transaction_id=tx_id)
-    if not ok:
-        await message.answer("Не удалось удалить транзакцию (внутренняя ошибка).")
-        return
-
-    # Пересчёт балансов
-    debts_service.rebuild(chat_id=chat_id)
-
-    await message.answer(f"Транзакция #{tx_id} удалена, балансы пересчитаны.")
\ No newline at end of file
+    missing = sorted(set(tx_ids) - set(deleted))
+    text = f"Удалено транзакций: {len(deleted)} ({', '.join(f'#{i}' for i in deleted[:20])}" + \
+        (", …)" if len(deleted) > 20 else ")") + ", балансы обновлены."
+    if missing and len(tx_ids) <= 20:
+        text += "\nНе найдены в этом чате: " + ", ".join(f"#{i}" for i in missing)
+    await message.answer(text)
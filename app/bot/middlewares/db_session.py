@@ -1,32 +1,50 @@
 from typing import Callable, Awaitable, Dict, Any
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from sqlmodel import Session
-from database.database import engine  # твой engine
+from database.database import engine, async_session_maker
+from models.crud.unit_of_work import unit_of_work, async_unit_of_work
 
 
 @contextmanager
 def session_scope():
+    """
+    Синхронная сессия с единицей работы — для скриптов и консоли.
+    Внутри unit_of_work репозитории только flush'ат, поэтому на весь блок приходится ровно один commit.
+    """
     session = Session(engine)
     try:
-        yield session
-        session.commit()
-    except:
-        session.rollback()
-        raise
+        with unit_of_work(session):
+            yield session
     finally:
         session.close()
 
 
+@asynccontextmanager
+async def async_session_scope(session_maker=async_session_maker):
+    """
+    AsyncSession на один апдейт (asyncpg). Один await commit() в конце или rollback при ошибке;
+    пока апдейт ждёт БД, event loop обслуживает остальные чаты.
+    Записи балансов под блокировкой чата коммитятся раньше — в конце вызова сервиса
+    (committing_unit_of_work), чтобы блокировка не держалась, пока хендлер отвечает в Telegram.
+    """
+    async with session_maker() as session:
+        async with async_unit_of_work(session):
+            yield session
+
+
 class DBSessionMiddleware(BaseMiddleware):
+    def __init__(self, session_maker=async_session_maker) -> None:
+        self.session_maker = session_maker
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        # кладём session в data — aiogram прокинет его в хендлер как аргумент
-        with session_scope() as session:
+        # кладём AsyncSession в data — aiogram прокинет его в хендлер как аргумент
+        async with async_session_scope(self.session_maker) as session:
             data["db_session"] = session
             return await handler(event, data)
@@ -1,28 +1,49 @@
 # bot/utils/ensure_ctx.py
+from cache.known_chats import is_known_chat, remember_chat
+from cache.user_display import UserDisplay, user_display_cache, remember_user
 from repositories import UsersRepoSqlModel, ChatsRepoSqlModel
 
 
+def _profile(tg_user) -> UserDisplay:
+    return UserDisplay(tg_user.id, tg_user.username, tg_user.first_name)
+
+
+def _is_known(tg_user, tg_chat) -> bool:
+    """Пользователь с таким же профилем и чат уже есть в БД — по кэшам процесса, без запросов."""
+    return user_display_cache.get(tg_user.id) == _profile(tg_user) and is_known_chat(tg_chat.id)
+
+
 def ensure_user_and_chat(session, *, tg_user, tg_chat):
     """
     tg_user: aiogram.types.User
     tg_chat: aiogram.types.Chat
+
+    Пользователь и чат, уже известные кэшам (cache.user_display, cache.known_chats), в БД не проверяются.
+    При промахе или сменённом в Telegram имени — upsert: отсутствующая строка создаётся,
+    username/first_name синхронизируются с профилем.
     """
-    users = UsersRepoSqlModel(session)
-    chats = ChatsRepoSqlModel(session)
-
-    # upsert user
-    u = users.get(tg_user.id)
-    if not u:
-        users.create(
-            id=tg_user.id,
-            username=tg_user.username,
-            first_name=tg_user.first_name,
-        )
-
-    # upsert chat
-    c = chats.get(tg_chat.id)
-    if not c:
-        chats.create(
-            id=tg_chat.id,
-            title=tg_chat.title or tg_chat.full_name if hasattr(tg_chat, "full_name") else tg_chat.title,
-        )
\ No newline at end of file
+    profile = _profile(tg_user)
+    user_known = user_display_cache.get(tg_user.id) == profile
+    if user_known and is_known_chat(tg_chat.id):
+        return
+
+    if not user_known:
+        users = UsersRepoSqlModel(session)
+        users.upsert(id=profile.id, username=profile.username, first_name=profile.first_name)
+        remember_user(session, profile)
+
+    if not is_known_chat(tg_chat.id):
+        chats = ChatsRepoSqlModel(session)
+        if not chats.get(tg_chat.id):
+            chats.create(
+                id=tg_chat.id,
+                title=tg_chat.title or tg_chat.full_name if hasattr(tg_chat, "full_name") else tg_chat.title,
+            )
+        remember_chat(session, tg_chat.id)
+
+
+async def ensure_user_and_chat_async(session, *, tg_user, tg_chat):
+    """ensure_user_and_chat для AsyncSession: все проверки и вставки — за один run_sync (или ни одного)."""
+    if _is_known(tg_user, tg_chat):
+        return
+    await session.run_sync(ensure_user_and_chat, tg_user=tg_user, tg_chat=tg_chat)
@@ -1,16 +1,72 @@
-from repositories import UsersRepoSqlModel
+from typing import Dict, Iterable, Mapping, Optional, Union
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models.users import User
+from cache.user_display import UserDisplay
+from repositories import UsersRepo, UsersRepoSqlModel
 
+_NAMES_KEY = "user_names"
 
-def format_user(user_id: int, users_repo: UsersRepoSqlModel) -> str:
+
+class UserNames(Mapping[int, Optional[UserDisplay]]):
     """
-    Возвращает удобное имя пользователя для отображения по user_id.
-    Использует репозиторий UsersRepoSqlModel для поиска в БД.
+    Карта user_id -> UserDisplay на время одного апдейта (identity map уровня запроса).
+    Хендлер сначала собирает все нужные id и грузит их через load(): что есть в общем кэше
+    процесса (cache.user_display) — берётся оттуда, остальное одним SELECT ... WHERE id IN (...).
+    Дальше повторные обращения обслуживаются из словаря без запросов.
+    Неизвестные id тоже запоминаются (как None), чтобы не искать их повторно.
     """
-    user = users_repo.get(user_id)
+
+    def __init__(self, users_repo: UsersRepo) -> None:
+        self.users_repo = users_repo
+        self._users: Dict[int, Optional[UserDisplay]] = {}
+
+    @classmethod
+    def for_session(cls, session: Session) -> "UserNames":
+        """Один резолвер на сессию — а сессия в боте живёт ровно один апдейт (DBSessionMiddleware)."""
+        names = session.info.get(_NAMES_KEY)
+        if names is None:
+            names = session.info[_NAMES_KEY] = cls(UsersRepoSqlModel(session))
+        return names
+
+    @classmethod
+    async def load_async(cls, session: AsyncSession, ids: Iterable[int]) -> "UserNames":
+        """for_session(...).load(ids) для AsyncSession: карта живёт на её sync_session."""
+        ids = list(ids)
+        return await session.run_sync(lambda s: cls.for_session(s).load(ids))
+
+    def load(self, ids: Iterable[int]) -> "UserNames":
+        missing = {int(i) for i in ids} - self._users.keys()
+        if missing:
+            found = self.users_repo.get_display_many(missing)
+            for user_id in missing:
+                self._users[user_id] = found.get(user_id)
+        return self
+
+    def __getitem__(self, user_id: int) -> Optional[UserDisplay]:
+        return self._users[user_id]
+
+    def __iter__(self):
+        return iter(self._users)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+def display_user(user: Optional[Union[User, UserDisplay]], user_id: int) -> str:
+    """Имя для отображения по уже загруженному пользователю (без запросов в БД)."""
     if not user:
         return f"❓{user_id}"
     if user.first_name:
         return f"<b>{user.first_name}</b>"
     elif user.username:
-        return f"@{user.username}<"
+        return f"@{user.username}"
     return str(user.id)
+
+
+def format_user(user_id: int, users: Mapping[int, Optional[Union[User, UserDisplay]]]) -> str:
+    """
+    Удобное имя пользователя по user_id из заранее загруженной карты (см. UserNames.load).
+    Чистая функция: в БД не ходит.
+    """
+    return display_user(users.get(user_id), user_id)
@@ -0,0 +1,30 @@
+# bot/utils/pagination.py
+"""
+Непрозрачные курсоры для постраничных команд бота (/history).
+
+Внутри курсора — id последней показанной строки (keyset, см. models.crud.pagination),
+но пользователю он виден только как короткий токен: формат можно поменять, не ломая
+уже отправленные сообщения с кнопкой/подсказкой «дальше».
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+
+_PREFIX = "h"
+
+
+def encode_cursor(before_id: int) -> str:
+    raw = f"{_PREFIX}{int(before_id)}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str) -> int:
+    """Бросает ValueError на чужом или испорченном курсоре."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"Bad cursor: {token!r}")
+    if not raw.startswith(_PREFIX) or not raw[len(_PREFIX):].isdigit():
+        raise ValueError(f"Bad cursor: {token!r}")
+    return int(raw[len(_PREFIX):])
@@ -0,0 +1,175 @@
+# bot/webhook.py
+"""
+Приём апдейтов через webhook (BOT_MODE="webhook") вместо long polling.
+
+Telegram присылает каждый апдейт POST-запросом на WEBHOOK_BASE_URL + WEBHOOK_PATH, aiohttp-сервер
+слушает WEBHOOK_HOST:WEBHOOK_PORT (в docker-compose опубликован 1234). Несколько реплик бота можно
+поставить за балансировщик — в отличие от одного потока getUpdates.
+
+BoundedRequestHandler — свой aiohttp-обработчик поверх публичного API aiogram
+(Dispatcher.feed_raw_update / silent_call_request), без внутренностей SimpleRequestHandler:
+- заголовок X-Telegram-Bot-Api-Secret-Token обязателен (без WEBHOOK_SECRET сервер не стартует);
+- ответ 200 уходит сразу, апдейт обрабатывается в фоне, но одновременно не больше max_concurrency;
+  ещё max_pending могут ждать. Сверх этого — 503: Telegram доставит апдейт повторно позже
+  (backpressure вместо очереди без дна, как в services.worker_pool). Место занимается до чтения тела,
+  так что запросы, тело которых ещё в пути, тоже считаются;
+- тело, которое не разбирается в JSON-объект, отбрасывается с 200: повтор его не исправит,
+  а на любой другой код Telegram будет доставлять его снова. Такие апдейты считаются в malformed.
+"""
+from __future__ import annotations
+
+import asyncio
+import secrets
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class BoundedRequestHandler:
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, *, secret_token: str, max_concurrency: int = 32,
+                 max_pending: int = 256, **data: Any) -> None:
+        if not secret_token:
+            raise ValueError("Webhook secret token is required")
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.data = data
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        # in_flight — принятые и ещё не обработанные (ждут слота или обрабатываются), running — в обработке
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.running = 0
+        self.max_running = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.unauthorized = 0
+        self.malformed = 0
+        self.processed = 0
+        self.failed = 0
+
+    def register(self, app: web.Application, path: str) -> None:
+        app.router.add_post(path, self.handle)
+        app.on_shutdown.append(self._close)
+
+    def verify_secret(self, token: str) -> bool:
+        return secrets.compare_digest(token.encode(), self.secret_token.encode())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.verify_secret(request.headers.get(SECRET_HEADER, "")):
+            self.unauthorized += 1
+            return web.Response(status=401, text="Unauthorized")
+        if self.in_flight >= self.max_concurrency + self.max_pending:
+            self.rejected += 1
+            return web.Response(status=503, text="Busy")
+        # Место занимаем до первого await: иначе параллельные запросы, ещё читающие тело, все пройдут проверку
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            update = await request.json(loads=self.bot.session.json_loads)
+        except ValueError:  # в т.ч. json.JSONDecodeError
+            update = None
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        if not isinstance(update, dict):
+            self.in_flight -= 1
+            self.malformed += 1
+            logger.warning("Webhook: тело запроса — не JSON-объект апдейта, апдейт отброшен")
+            return web.json_response({})
+        self.accepted += 1
+        task = asyncio.create_task(self._feed(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({})
+
+    async def _feed(self, update: Dict[str, Any]) -> None:
+        try:
+            async with self._slots:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+                try:
+                    result = await self.dispatcher.feed_raw_update(self.bot, update, **self.data)
+                    # Хендлер вернул метод вместо await (ответ «в webhook») — отправляем его сами
+                    if isinstance(result, TelegramMethod):
+                        await self.dispatcher.silent_call_request(self.bot, result)
+                finally:
+                    self.running -= 1
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Апдейт {update.get('update_id')} не обработан")
+        finally:
+            self.in_flight -= 1
+
+    async def drain(self) -> None:
+        """Дождаться апдейтов, которые уже приняты (200 ушёл) и ещё обрабатываются."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _close(self, app: web.Application) -> None:
+        await self.drain()
+        logger.info(f"Webhook остановлен: {self.stats()}")
+        await self.bot.session.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_running": self.max_running,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+            "malformed": self.malformed,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+WEBHOOK_HANDLER = web.AppKey("webhook_handler", BoundedRequestHandler)
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, *, path: str, secret_token: str, max_concurrency: int = 32,
+                      max_pending: int = 256) -> web.Application:
+    """aiohttp-приложение с обработчиком апдейтов на path; сам обработчик — в app[WEBHOOK_HANDLER]."""
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, secret_token=secret_token, max_concurrency=max_concurrency,
+                                    max_pending=max_pending)
+    # Перед закрытием сессии бота дорабатываем принятые апдейты (см. BoundedRequestHandler._close)
+    handler.register(app, path=path)
+    app[WEBHOOK_HANDLER] = handler
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, *, base_url: Optional[str], path: str, secret_token: str,
+                      host: str, port: int, max_concurrency: int, max_pending: int) -> None:
+    """Зарегистрировать webhook в Telegram и обслуживать его, пока задачу не отменят."""
+    if not base_url:
+        raise ValueError("WEBHOOK_BASE_URL is required in webhook mode")
+    app = build_webhook_app(dp, bot, path=path, secret_token=secret_token, max_concurrency=max_concurrency,
+                            max_pending=max_pending)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+        await bot.set_webhook(
+            url=base_url.rstrip("/") + path,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook слушает {host}:{port}{path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,57 @@
+# cache/known_chats.py
+"""
+Общий на процесс кэш id чатов, которые уже точно есть в БД (KNOWN_CHATS_CACHE_SIZE / _TTL).
+
+Чат попадает в кэш только после того, как его строка закоммичена: remember_chat внутри
+unit_of_work откладывает запись до after_commit, а rollback её отменяет — иначе после
+откатившегося апдейта кэш считал бы существующим чат, которого в БД нет.
+Удаление чата (ChatsRepo.delete) выбрасывает его из кэша через forget_chat.
+"""
+from __future__ import annotations
+
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache.lru import LRUCache
+from database.config import get_settings
+from models.crud.unit_of_work import is_deferred
+
+_REMEMBER_KEY = "known_chats_remember"
+
+_settings = get_settings()
+known_chats = LRUCache(maxsize=_settings.KNOWN_CHATS_CACHE_SIZE, ttl=_settings.KNOWN_CHATS_CACHE_TTL)
+
+
+def is_known_chat(chat_id: int, cache: LRUCache = known_chats) -> bool:
+    return cache.get(chat_id) is not None
+
+
+def remember_chat(session: Session, chat_id: int, cache: LRUCache = known_chats) -> None:
+    if is_deferred(session):
+        session.info.setdefault(_REMEMBER_KEY, set()).add((cache, chat_id))
+    else:
+        cache.set(chat_id, True)
+
+
+def forget_chat(session: Session, chat_id: int, cache: LRUCache = known_chats) -> None:
+    cache.invalidate(chat_id)
+    pending = session.info.get(_REMEMBER_KEY)
+    if pending:
+        pending.discard((cache, chat_id))
+
+
+def known_chats_stats(cache: LRUCache = known_chats) -> Dict[str, float]:
+    return cache.stats()
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_after_commit(session: Session) -> None:
+    for cache, chat_id in session.info.pop(_REMEMBER_KEY, ()):
+        cache.set(chat_id, True)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_REMEMBER_KEY, None)
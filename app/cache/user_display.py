@@ -0,0 +1,73 @@
+# cache/user_display.py
+"""
+Кэш отображаемых данных пользователей (id, username, first_name), общий для всех апдейтов процесса.
+
+Имена меняются редко, а нужны почти в каждом ответе бота, поэтому держим их в LRU с TTL
+(USER_CACHE_SIZE / USER_CACHE_TTL). В кэше лежат неизменяемые UserDisplay, а не ORM-объекты:
+те привязаны к сессии конкретного апдейта.
+
+Любая запись пользователя (UsersRepo.create / update / upsert / delete) вызывает
+invalidate_user(session, user_id): запись выбрасывается сразу и ещё раз после commit сессии —
+чтобы параллельный апдейт не успел положить обратно старое имя до коммита.
+
+remember_user(session, display) кладёт в кэш то, что записано в БД (ensure_user_and_chat):
+сразу, если изменений в этой сессии нет, иначе — после commit, и ничего при rollback.
+"""
+from __future__ import annotations
+
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache.lru import LRUCache
+from database.config import get_settings
+
+_DIRTY_KEY = "user_display_dirty_ids"
+_REMEMBER_KEY = "user_display_remember"
+
+
+class UserDisplay(NamedTuple):
+    id: int
+    username: Optional[str]
+    first_name: Optional[str]
+
+
+_settings = get_settings()
+user_display_cache = LRUCache(maxsize=_settings.USER_CACHE_SIZE, ttl=_settings.USER_CACHE_TTL)
+
+
+def invalidate_user(session: Session, user_id: int, cache: LRUCache = user_display_cache) -> None:
+    cache.invalidate(user_id)
+    session.info.setdefault(_DIRTY_KEY, set()).add((cache, user_id))
+
+
+def is_pending(session: Session, user_id: int, cache: LRUCache = user_display_cache) -> bool:
+    """Пользователь изменён в этой сессии, но ещё не закоммичен."""
+    return (cache, user_id) in session.info.get(_DIRTY_KEY, ())
+
+
+def remember_user(session: Session, display: UserDisplay, cache: LRUCache = user_display_cache) -> None:
+    if is_pending(session, display.id, cache):
+        session.info.setdefault(_REMEMBER_KEY, {})[(cache, display.id)] = display
+    else:
+        cache.set(display.id, display)
+
+
+def user_cache_stats(cache: LRUCache = user_display_cache) -> Dict[str, float]:
+    """size, hits, misses, hit_ratio, evictions, expirations."""
+    return cache.stats()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    for cache, user_id in session.info.pop(_DIRTY_KEY, ()):
+        cache.invalidate(user_id)
+    for (cache, user_id), display in session.info.pop(_REMEMBER_KEY, {}).items():
+        cache.set(user_id, display)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_DIRTY_KEY, None)
+    session.info.pop(_REMEMBER_KEY, None)
@@ -10,6 +10,63 @@ class Settings(BaseSettings):
     DB_PORT: Optional[str] = None
     DB_NAME: Optional[str] = None
     BOT_TOKEN: Optional[str] = None
+    # Откуда rebuild берёт балансы: "sql" — один GROUP BY в БД, "stream" — потоковый проход по истории,
+    # "engine" — свёртка в процессе (dict / numpy, см. services.balance_engine)
+    BALANCE_SOURCE: str = "sql"
+    # Для BALANCE_SOURCE="engine": с какого числа строк истории считать через numpy
+    BALANCE_NUMPY_MIN_ROWS: int = 1000
+    # Чекпоинты балансов: писать каждые N транзакций чата (0 — выключено) и сколько последних хранить
+    BALANCE_CHECKPOINT_EVERY: int = 500
+    BALANCE_CHECKPOINT_KEEP: int = 3
+    # Размер страницы keyset-пагинации при потоковом чтении истории
+    STREAM_BATCH_SIZE: int = 1000
+    # Взаиморасчёты: режим по умолчанию (auto|exact|greedy) и лимиты точного поиска
+    SETTLE_MODE: str = "auto"
+    SETTLE_EXACT_MAX_MEMBERS: int = 18
+    SETTLE_TIME_BUDGET_MS: int = 500
+    # In-process кэш балансов/планов по (chat_id, version)
+    BALANCE_CACHE_SIZE: int = 1024
+    BALANCE_CACHE_TTL: float = 300.0
+    # Общий на процесс кэш отображаемых данных пользователей (first_name, username)
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL: float = 3600.0
+    # Чаты, которые точно есть в БД: ensure_user_and_chat не ходит за ними в базу
+    KNOWN_CHATS_CACHE_SIZE: int = 10_000
+    KNOWN_CHATS_CACHE_TTL: float = 3600.0
+    # Пул для CPU-тяжёлых расчётов (поиск взаиморасчётов, свёртка балансов): "thread" | "process" | "off"
+    WORKER_POOL_KIND: str = "thread"
+    WORKER_POOL_SIZE: int = 2
+    # Сколько задач может ждать свободного воркера; сверх этого хендлер отвечает «занят, повтори позже»
+    WORKER_POOL_QUEUE: int = 16
+    # С какого размера задачи уходить в пул: меньшие дешевле посчитать на месте
+    WORKER_MIN_MEMBERS: int = 12
+    WORKER_MIN_ROWS: int = 20_000
+    # Авторегистрация участников: сброс буфера раз в N секунд или при BATCH записях
+    AUTOREGISTER_FLUSH_INTERVAL: float = 5.0
+    AUTOREGISTER_BATCH_SIZE: int = 500
+    # Потолок буфера, если БД недоступна: новые пары сверх него отбрасываются
+    AUTOREGISTER_MAX_PENDING: int = 10_000
+    # Уже записанные пары с тем же профилем повторно в буфер не попадают
+    AUTOREGISTER_KNOWN_SIZE: int = 50_000
+    AUTOREGISTER_KNOWN_TTL: float = 3600.0
+    # /rebuild идёт в фоне: сколько /balance ждёт незаконченный пересчёт, прежде чем ответить как есть
+    REBUILD_WAIT_TIMEOUT: float = 10.0
+    # Пауза перед повтором пересчёта, если пул воркеров был занят; каждый следующий повтор ждёт вдвое дольше
+    REBUILD_RETRY_DELAY: float = 1.0
+    # Сколько раз подряд повторять пересчёт при занятом пуле, прежде чем снять его (1 + 2 + 4 с < REBUILD_WAIT_TIMEOUT)
+    REBUILD_MAX_RETRIES: int = 3
+    # Приём апдейтов: "polling" — getUpdates, "webhook" — aiohttp-сервер (см. bot.webhook)
+    BOT_MODE: str = "polling"
+    # Публичный https-адрес, по которому Telegram достучится до WEBHOOK_HOST:WEBHOOK_PORT
+    WEBHOOK_BASE_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    # X-Telegram-Bot-Api-Secret-Token: обязателен в режиме webhook
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 1234
+    # Одновременно обрабатываемые апдейты и сколько ещё может ждать; сверх — 503, Telegram повторит
+    WEBHOOK_MAX_CONCURRENCY: int = 32
+    WEBHOOK_MAX_PENDING: int = 256
 
     @property
     def DATABASE_URL_asyncpg(self) -> str:
@@ -1,6 +1,8 @@
 from sqlmodel import SQLModel, Session, create_engine
-
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from .config import get_settings
+from .migrations import run_migrations
 from logger.logging import get_logger
 
 logger = get_logger(logger_name=__name__)
@@ -15,6 +17,18 @@ engine = create_engine(
 )
 logger.info("Создан движок")
 
+# Асинхронный движок на asyncpg — для хендлеров бота: запросы не блокируют event loop aiogram.
+# Синхронный engine остаётся для миграций на старте, скриптов и бенчмарков.
+async_engine = create_async_engine(
+    url=get_settings().DATABASE_URL_asyncpg,
+    echo=False,
+    pool_size=5,
+    max_overflow=10,
+)
+# expire_on_commit=False: после commit хендлер ещё читает атрибуты объектов, а ленивая
+# догрузка вне greenlet AsyncSession невозможна
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
 
 # Функция-генератор для получения сессии. Используем with-контекст, чтобы автоматически закрыть сессию.
 def get_session():
@@ -22,6 +36,11 @@ def get_session():
         yield session
 
 
+async def get_async_session():
+    async with async_session_maker() as session:
+        yield session
+
+
 # Инициализация базы данных: дропаем существующие таблицы и создаём заново
 def init_db():
     SQLModel.metadata.drop_all(engine)
@@ -29,11 +48,14 @@ def init_db():
 
 
 def ensure_schema() -> None:
-    """Создаёт недостающие таблицы (ничего не дропает)."""
+    """Создаёт недостающие таблицы и применяет миграции из database.migrations (ничего не дропает)."""
     from models.users import User
     from models.chats import Chat
     from models.transactions import Transaction
     from models.transaction_participants import TransactionParticipant
     from models.debts import Debt
+    from models.balance_checkpoints import BalanceCheckpoint
+    from models.chat_members import ChatMember
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
     logger.info("Проверил/создал схему БД")
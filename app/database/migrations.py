@@ -0,0 +1,202 @@
+# database/migrations.py
+"""
+Версионные миграции схемы поверх create_all.
+
+create_all создаёт только отсутствующие таблицы (вместе с индексами из моделей), а существующие
+не трогает — поэтому всё, что меняется в уже развёрнутых базах, оформляется миграцией:
+
+    @migration(5, "hot_path_indexes")
+    def _hot_path_indexes(conn): ...
+
+Применённые версии записываются в таблицу schema_migrations. run_migrations(engine) прогоняет
+недостающие по возрастанию версии, каждую в своей транзакции вместе с записью о ней.
+Миграции идемпотентны (IF NOT EXISTS / проверка через inspect): на свежей базе create_all
+уже создал всё из моделей, и миграция просто отмечается применённой.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import Integer, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Регистрирует функцию upgrade(conn) как миграцию с номером version."""
+    def register(upgrade: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, upgrade))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return upgrade
+    return register
+
+
+def _ensure_migrations_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version INTEGER PRIMARY KEY,"
+            " name VARCHAR NOT NULL,"
+            " applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def applied_versions(conn: Connection) -> Dict[int, str]:
+    return dict(conn.execute(text("SELECT version, name FROM schema_migrations")).all())
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Применяет недостающие миграции. Возвращает список применённых сейчас версий."""
+    _ensure_migrations_table(engine)
+    applied: List[int] = []
+    for m in MIGRATIONS:
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                # Два процесса бота стартуют одновременно — второй ждёт и видит уже применённую версию
+                conn.execute(text("LOCK TABLE schema_migrations IN EXCLUSIVE MODE"))
+            if m.version in applied_versions(conn):
+                continue
+            m.upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": m.version, "n": m.name, "t": datetime.utcnow()},
+            )
+        logger.info(f"Применена миграция {m.version}: {m.name}")
+        applied.append(m.version)
+    return applied
+
+
+@migration(1, "debts_unique_key")
+def _debts_unique_key(conn: Connection) -> None:
+    """
+    Уникальный ключ debts(chat_id, user_id) для ON CONFLICT: чистим дубли
+    (оставляем самую свежую строку) и создаём уникальный индекс.
+    """
+    conn.execute(text(
+        "DELETE FROM debts WHERE id NOT IN (SELECT MAX(id) FROM debts GROUP BY chat_id, user_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_debts_chat_user ON debts (chat_id, user_id)"
+    ))
+
+
+# Денежные колонки, которые раньше были float (рубли), а теперь BIGINT (копейки)
+_MONEY_COLUMNS = (
+    ("transactions", "amount"),
+    ("transaction_participants", "share_amount"),
+    ("debts", "amount"),
+)
+
+
+@migration(2, "minor_units")
+def _minor_units(conn: Connection) -> None:
+    """
+    Переводим денежные колонки старых баз из float в BIGINT копеек: amount * 100 с округлением.
+    Колонки, которые уже целочисленные, не трогаем. Postgres меняет тип на месте, SQLite — через
+    новую колонку (см. _sqlite_to_minor_units). Прочие диалекты на непустой таблице не конвертируем
+    и падаем: иначе миграция отметится применённой, а код будет читать рубли как копейки.
+    """
+    insp = inspect(conn)
+    for table, column in _MONEY_COLUMNS:
+        col = next(c for c in insp.get_columns(table) if c["name"] == column)
+        if isinstance(col["type"], Integer):
+            continue
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT USING round({column} * 100)::bigint"
+            ))
+        elif conn.dialect.name == "sqlite":
+            _sqlite_to_minor_units(conn, table, column)
+        elif conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is not None:
+            raise RuntimeError(f"Cannot convert {table}.{column} to minor units on {conn.dialect.name}")
+        logger.info(f"{table}.{column} переведена в копейки")
+
+
+def _sqlite_to_minor_units(conn: Connection, table: str, column: str) -> None:
+    """
+    SQLite не умеет ALTER COLUMN TYPE: добавляем BIGINT-колонку, переносим round(x * 100),
+    старую удаляем и переименовываем новую на её место (DROP/RENAME COLUMN — SQLite 3.35+).
+    Таблица переписывается целиком, внешние ключи и индексы на других колонках остаются.
+    """
+    minor = f"{column}_minor"
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {minor} BIGINT NOT NULL DEFAULT 0"))
+    conn.execute(text(f"UPDATE {table} SET {minor} = CAST(round({column} * 100) AS INTEGER)"))
+    conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+    conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {minor} TO {column}"))
+
+
+@migration(3, "settlement_batch_id")
+def _settlement_batch_id(conn: Connection) -> None:
+    """transactions.settlement_batch_id появилась позже таблицы — на старых базах добавляем колонку и индекс."""
+    if not any(c["name"] == "settlement_batch_id" for c in inspect(conn).get_columns("transactions")):
+        conn.execute(text("ALTER TABLE transactions ADD COLUMN settlement_batch_id VARCHAR"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_settlement_batch_id ON transactions (settlement_batch_id)"
+    ))
+
+
+# Индексы горячих запросов; те же имена объявлены в моделях (__table_args__)
+_HOT_PATH_INDEXES = (
+    # /history, чекпоинты, max/count по чату: WHERE chat_id = ? [AND id < ?] ORDER BY id DESC
+    "CREATE INDEX IF NOT EXISTS ix_transactions_chat_id_id ON transactions (chat_id, id DESC)",
+    # selectinload участников, JOIN в балансах, удаление по транзакции
+    "CREATE INDEX IF NOT EXISTS ix_transaction_participants_transaction_id"
+    " ON transaction_participants (transaction_id)",
+    # FK на users: участия пользователя, удаление пользователя
+    "CREATE INDEX IF NOT EXISTS ix_transaction_participants_user_id ON transaction_participants (user_id)",
+    # get_users_by_username(s): WHERE lower(username) IN (...)
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))",
+)
+
+
+@migration(4, "hot_path_indexes")
+def _hot_path_indexes(conn: Connection) -> None:
+    """
+    Индексы под горячие запросы. debts(chat_id, user_id) уже покрыт uq_debts_chat_user (миграция 1).
+    Строятся обычным CREATE INDEX внутри транзакции (не CONCURRENTLY): таблицы бота небольшие.
+    """
+    for ddl in _HOT_PATH_INDEXES:
+        conn.execute(text(ddl))
+
+
+@migration(5, "debts_chat_id_id")
+def _debts_chat_id_id(conn: Connection) -> None:
+    """Keyset-страницы долгов чата: WHERE chat_id = ? AND id > ? ORDER BY id."""
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_debts_chat_id_id ON debts (chat_id, id)"))
+
+
+@migration(6, "chat_members")
+def _chat_members(conn: Connection) -> None:
+    """Участники чатов для авторегистрации (models.chat_members): таблица и обратный индекс по user_id."""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS chat_members ("
+        " chat_id BIGINT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,"
+        " user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,"
+        " joined_at TIMESTAMP NOT NULL,"
+        " PRIMARY KEY (chat_id, user_id))"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_members_user_id ON chat_members (user_id)"))
+
+
+@migration(7, "debts_version")
+def _debts_version(conn: Connection) -> None:
+    """debts.version — счётчик записей строки (отпечаток долгов чата для кэша); существующие строки начинают с 0."""
+    if not any(c["name"] == "version" for c in inspect(conn).get_columns("debts")):
+        conn.execute(text("ALTER TABLE debts ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
@@ -4,8 +4,13 @@ from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from bot.handlers import all_routers
 from bot.middlewares.db_session import DBSessionMiddleware
+from bot.webhook import run_webhook
 from database.config import get_settings
-from database.database import ensure_schema
+from database.database import ensure_schema, async_engine, async_session_maker
+from services.worker_pool import worker_pool
+from services.autoregistration import autoregistration
+from services.rebuild_scheduler import rebuild_scheduler
+from services.balance_cache import balance_cache_listener
 
 
 async def run():
@@ -26,7 +31,32 @@ async def run():
 
     for router in all_routers:
         dp.include_router(router)
-    await dp.start_polling(bot)
+    # фоновый сброс буфера авторегистрации в БД
+    autoregistration.start(async_session_maker)
+    # фоновые /rebuild с очередью по чатам
+    rebuild_scheduler.start(async_session_maker, worker_pool)
+    # записи других реплик сбрасывают кэш балансов этого процесса (LISTEN/NOTIFY)
+    await balance_cache_listener.start(settings.DATABASE_URL_asyncpg)
+    try:
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(
+                dp, bot,
+                base_url=settings.WEBHOOK_BASE_URL,
+                path=settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET,
+                host=settings.WEBHOOK_HOST,
+                port=settings.WEBHOOK_PORT,
+                max_concurrency=settings.WEBHOOK_MAX_CONCURRENCY,
+                max_pending=settings.WEBHOOK_MAX_PENDING,
+            )
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await autoregistration.stop()
+        await rebuild_scheduler.stop()
+        await balance_cache_listener.stop()
+        worker_pool.shutdown()
+        await async_engine.dispose()
 
 if __name__ == "__main__":
     asyncio.run(run())
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from sqlalchemy import BigInteger, Index
+
+
+class BalanceCheckpoint(SQLModel, table=True):
+    """
+    Снимок баланса пользователя в чате по состоянию «после транзакции as_of_tx_id включительно».
+    Один чекпоинт = все строки чата с одинаковым as_of_tx_id.
+    """
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (Index("ix_balance_checkpoints_chat_as_of", "chat_id", "as_of_tx_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chat_id: int = Field(foreign_key="chats.id", sa_type=BigInteger)
+    user_id: int = Field(foreign_key="users.id", sa_type=BigInteger)
+    as_of_tx_id: int = Field(sa_type=BigInteger)
+    amount: int = Field(default=0, sa_type=BigInteger)  # в копейках, >0 — ему должны
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return (
+            f"BalanceCheckpoint(chat_id={self.chat_id}, user_id={self.user_id}, "
+            f"as_of_tx_id={self.as_of_tx_id}, amount={self.amount})"
+        )
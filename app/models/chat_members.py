@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlmodel import Field, SQLModel
+from sqlalchemy import BigInteger, Index
+
+
+class ChatMember(SQLModel, table=True):
+    """Пользователь писал в чате (заполняется авторегистрацией, см. services.autoregistration)."""
+    __tablename__ = "chat_members"
+    # PK (chat_id, user_id) покрывает участников чата; обратный индекс — чаты пользователя
+    __table_args__ = (Index("ix_chat_members_user_id", "user_id"),)
+
+    chat_id: int = Field(foreign_key="chats.id", primary_key=True, sa_type=BigInteger, ondelete="CASCADE")
+    user_id: int = Field(foreign_key="users.id", primary_key=True, sa_type=BigInteger, ondelete="CASCADE")
+    joined_at: datetime = Field(default_factory=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"ChatMember(chat_id={self.chat_id}, user_id={self.user_id})"
+
+
+class SeenMember(NamedTuple):
+    """Профиль пользователя и чат из одного сообщения — единица буфера авторегистрации."""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    chat_id: int
+    chat_title: Optional[str]
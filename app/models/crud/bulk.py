@@ -0,0 +1,34 @@
+"""Многострочные INSERT ... RETURNING с результатом в порядке входных строк и INSERT ... ON CONFLICT."""
+from typing import Any, Dict, List, Sequence
+from sqlmodel import Session
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def upsert_insert(session: Session):
+    """insert() с on_conflict_do_update/do_nothing для диалекта сессии; None — диалект без ON CONFLICT."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return pg_insert
+    if dialect == "sqlite":
+        return sqlite_insert
+    return None
+
+
+def insert_returning(session: Session, model, rows: Sequence[Dict[str, Any]], column=None) -> List[Any]:
+    """
+    Вставить rows одним пакетным INSERT и вернуть созданные объекты model (или значения column)
+    в порядке rows.
+    Postgres гарантирует порядок через sort_by_parameter_order в одном запросе. SQLite с этим
+    флагом переходит на INSERT по строке, поэтому там один INSERT без флага и сортировка по id:
+    rowid внутри одного INSERT выдаются по порядку VALUES.
+    """
+    if not rows:
+        return []
+    ordered = session.get_bind().dialect.name == "postgresql"
+    stmt = insert(model).returning(column if column is not None else model, sort_by_parameter_order=ordered)
+    result = list(session.scalars(stmt, list(rows)))
+    if ordered:
+        return result
+    return sorted(result) if column is not None else sorted(result, key=lambda obj: obj.id)
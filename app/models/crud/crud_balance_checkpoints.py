@@ -0,0 +1,69 @@
+from datetime import datetime
+from sqlmodel import Session, select
+from sqlalchemy import delete, func, insert
+from models.balance_checkpoints import BalanceCheckpoint
+from models.crud.unit_of_work import commit_or_flush
+from typing import Optional, Dict, List
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+
+def latest_checkpoint_id(session: Session, *, chat_id: int) -> Optional[int]:
+    """as_of_tx_id самого свежего чекпоинта чата (None — чекпоинтов нет)."""
+    stmt = select(func.max(BalanceCheckpoint.as_of_tx_id)).where(BalanceCheckpoint.chat_id == chat_id)
+    return session.exec(stmt).one()
+
+
+def get_checkpoint(session: Session, *, chat_id: int, as_of_tx_id: int) -> Dict[int, int]:
+    stmt = select(BalanceCheckpoint.user_id, BalanceCheckpoint.amount).where(
+        BalanceCheckpoint.chat_id == chat_id,
+        BalanceCheckpoint.as_of_tx_id == as_of_tx_id,
+    )
+    return {int(user_id): int(amount) for user_id, amount in session.exec(stmt)}
+
+
+def write_checkpoint(session: Session, *, chat_id: int, as_of_tx_id: int, balances: Dict[int, int]) -> None:
+    """Все строки чекпоинта одним INSERT (executemany)."""
+    if not balances:
+        return
+    now = datetime.utcnow()
+    session.execute(
+        insert(BalanceCheckpoint),
+        [
+            {"chat_id": chat_id, "user_id": user_id, "as_of_tx_id": as_of_tx_id, "amount": amount, "created_at": now}
+            for user_id, amount in balances.items()
+        ],
+    )
+    logger.info(f'Чекпоинт балансов чата {chat_id} на транзакции {as_of_tx_id}')
+    commit_or_flush(session)
+
+
+def delete_checkpoints_from(session: Session, *, chat_id: int, tx_id: int) -> int:
+    """
+    Удалить чекпоинты, которые уже учитывают транзакцию tx_id (as_of_tx_id >= tx_id).
+    Только flush-уровень, без commit: коммитит вызывающий вместе с изменением истории.
+    """
+    result = session.execute(
+        delete(BalanceCheckpoint).where(
+            BalanceCheckpoint.chat_id == chat_id,
+            BalanceCheckpoint.as_of_tx_id >= tx_id,
+        )
+    )
+    return result.rowcount or 0
+
+
+def prune_checkpoints(session: Session, *, chat_id: int, keep: int) -> None:
+    """Оставить только `keep` последних чекпоинтов чата (старые нужны лишь как запасные после /del)."""
+    kept = select(BalanceCheckpoint.as_of_tx_id).where(BalanceCheckpoint.chat_id == chat_id) \
+        .group_by(BalanceCheckpoint.as_of_tx_id).order_by(BalanceCheckpoint.as_of_tx_id.desc()).limit(keep)
+    kept_ids: List[int] = list(session.exec(kept))
+    if len(kept_ids) < keep:
+        return
+    session.execute(
+        delete(BalanceCheckpoint).where(
+            BalanceCheckpoint.chat_id == chat_id,
+            BalanceCheckpoint.as_of_tx_id < kept_ids[-1],
+        )
+    )
+    commit_or_flush(session)
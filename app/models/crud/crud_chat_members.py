@@ -0,0 +1,64 @@
+from datetime import datetime
+from sqlmodel import Session, select
+from sqlalchemy import func
+from models.users import User
+from models.chats import Chat
+from models.chat_members import ChatMember, SeenMember
+from models.crud.unit_of_work import commit_or_flush
+from models.crud.bulk import upsert_insert
+from typing import List, Sequence
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+
+def register_members(session: Session, entries: Sequence[SeenMember]) -> None:
+    """
+    Пачка «пользователь писал в чате» тремя INSERT ... ON CONFLICT на всю пачку:
+    users (username/first_name обновляются), chats (title обновляется, если известен),
+    chat_members (существующие пары не трогаем). Для прочих диалектов — построчный путь.
+    """
+    if not entries:
+        return
+    users = {e.user_id: {"id": e.user_id, "username": e.username, "first_name": e.first_name} for e in entries}
+    chats = {e.chat_id: {"id": e.chat_id, "title": e.chat_title} for e in entries}
+    now = datetime.utcnow()
+    members = {
+        (e.chat_id, e.user_id): {"chat_id": e.chat_id, "user_id": e.user_id, "joined_at": now} for e in entries
+    }
+
+    insert = upsert_insert(session)
+    if insert is None:
+        for row in users.values():
+            session.merge(User(**row))
+        for row in chats.values():
+            chat = session.get(Chat, row["id"])
+            if chat is None:
+                session.add(Chat(**row))
+            elif row["title"] is not None:
+                chat.title = row["title"]
+        session.flush()
+        for key, row in members.items():
+            if session.get(ChatMember, key) is None:
+                session.add(ChatMember(**row))
+    else:
+        stmt = insert(User).values(list(users.values()))
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[User.id],
+            set_={"username": stmt.excluded.username, "first_name": stmt.excluded.first_name},
+        ))
+        stmt = insert(Chat).values(list(chats.values()))
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[Chat.id],
+            set_={"title": func.coalesce(stmt.excluded.title, Chat.title)},
+        ))
+        stmt = insert(ChatMember).values(list(members.values()))
+        session.execute(stmt.on_conflict_do_nothing(index_elements=[ChatMember.chat_id, ChatMember.user_id]))
+
+    logger.info(f'Авторегистрация: {len(users)} пользователей, {len(chats)} чатов, {len(members)} участий')
+    commit_or_flush(session)
+
+
+def list_member_ids(session: Session, *, chat_id: int) -> List[int]:
+    stmt = select(ChatMember.user_id).where(ChatMember.chat_id == chat_id).order_by(ChatMember.user_id)
+    return list(session.exec(stmt))
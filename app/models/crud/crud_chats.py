@@ -1,5 +1,6 @@
 from sqlmodel import Session, select
 from models.chats import Chat
+from models.crud.unit_of_work import commit_or_flush
 from typing import Optional, List
 from logger.logging import get_logger
 
@@ -10,8 +11,7 @@ def create_chat(session: Session, id: int, title: Optional[str] = None) -> Chat:
     logger.info('Чат создан')
     chat = Chat(id=id, title=title)
     session.add(chat)
-    session.commit()
-    session.refresh(chat)
+    commit_or_flush(session, chat)
     return chat
 
 
@@ -27,8 +27,7 @@ def update_chat(session: Session, id: int, title: Optional[str] = None) -> Optio
     if title is not None:
         chat.title = title
     session.add(chat)
-    session.commit()
-    session.refresh(chat)
+    commit_or_flush(session, chat)
     return chat
 
 
@@ -37,7 +36,7 @@ def delete_chat(session: Session, id: int) -> bool:
     if not chat:
         return False
     session.delete(chat)
-    session.commit()
+    commit_or_flush(session)
     return True
 
 
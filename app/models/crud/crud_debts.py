@@ -1,18 +1,21 @@
 from datetime import datetime
 from sqlmodel import Session, select
+from sqlalchemy import delete, func
 from models.debts import Debt
-from typing import Optional, List
+from models.crud.unit_of_work import commit_or_flush
+from models.crud.pagination import keyset
+from models.crud.bulk import upsert_insert
+from typing import Optional, List, Dict, Iterator, Tuple
 from logger.logging import get_logger
 
 logger = get_logger(logger_name=__name__)
 
 
-def create_debt(session: Session, chat_id: int, user_id: int, amount: float = 0.0) -> Debt:
+def create_debt(session: Session, chat_id: int, user_id: int, amount: int = 0) -> Debt:
     logger.info('Создан долг')
     debt = Debt(chat_id=chat_id, user_id=user_id, amount=amount)
     session.add(debt)
-    session.commit()
-    session.refresh(debt)
+    commit_or_flush(session, debt)
     return debt
 
 
@@ -20,25 +23,30 @@ def get_debt(session: Session, id: int) -> Optional[Debt]:
     return session.get(Debt, id)
 
 
-def update_debt(session: Session, id: int, amount: Optional[float] = None) -> Optional[Debt]:
+def update_debt(session: Session, id: int, amount: Optional[int] = None) -> Optional[Debt]:
     debt = get_debt(session, id)
     if not debt:
         return None
     if amount is not None:
         debt.amount = amount
         debt.updated_at = datetime.utcnow()
+        debt.version += 1
     session.add(debt)
-    session.commit()
-    session.refresh(debt)
+    commit_or_flush(session, debt)
     return debt
 
 
+def get_debt_by_chat_user(session: Session, chat_id: int, user_id: int) -> Optional[Debt]:
+    stmt = select(Debt).where(Debt.chat_id == chat_id, Debt.user_id == user_id)
+    return session.exec(stmt).first()
+
+
 def delete_debt(session: Session, id: int) -> bool:
     debt = get_debt(session, id)
     if not debt:
         return False
     session.delete(debt)
-    session.commit()
+    commit_or_flush(session)
     return True
 
 
@@ -51,3 +59,120 @@ def list_debts(session: Session, chat_id: int, limit: int = 100, offset: int = 0
         .offset(offset)
     )
     return list(session.exec(stmt))
+
+
+def get_debt_amounts(session: Session, chat_id: int) -> Dict[int, int]:
+    """{user_id: amount} по всем строкам чата — только две колонки, объекты Debt не загружаются."""
+    return dict(session.exec(select(Debt.user_id, Debt.amount).where(Debt.chat_id == chat_id)).all())
+
+
+def get_debts_stamp(session: Session, chat_id: int) -> Tuple[int, int, Optional[datetime]]:
+    """
+    Отпечаток долгов чата в БД: (число строк, сумма version, последний updated_at).
+    Любая запись строки увеличивает её version и двигает updated_at, вставка и удаление меняют
+    число строк — отпечаток меняется от записи любой реплики. Один агрегат по индексу debts(chat_id, ...).
+    """
+    stmt = select(func.count(), func.coalesce(func.sum(Debt.version), 0), func.max(Debt.updated_at)) \
+        .where(Debt.chat_id == chat_id)
+    count, versions, last_update = session.exec(stmt).one()
+    return int(count), int(versions), last_update
+
+
+def list_debts_page(session: Session, chat_id: int, limit: int = 100, before_id: Optional[int] = None,
+                    after_id: Optional[int] = None, newest_first: bool = False) -> List[Debt]:
+    """Страница долгов чата по keyset (см. models.crud.pagination), индекс debts(chat_id, id)."""
+    stmt = keyset(select(Debt).where(Debt.chat_id == chat_id), Debt.id, limit=limit,
+                  before_id=before_id, after_id=after_id, newest_first=newest_first)
+    return list(session.exec(stmt))
+
+
+def iter_debts(session: Session, chat_id: int, batch_size: int = 1000) -> Iterator[Debt]:
+    """Все долги чата страницами по Debt.id (keyset, без OFFSET и без верхней границы)."""
+    last_id = 0
+    while True:
+        page = list(session.exec(
+            select(Debt)
+            .where(Debt.chat_id == chat_id, Debt.id > last_id)
+            .order_by(Debt.id)
+            .limit(batch_size)
+        ))
+        yield from page
+        if len(page) < batch_size:
+            return
+        last_id = page[-1].id
+
+
+def apply_debt_deltas(session: Session, chat_id: int, deltas: Dict[int, int]) -> None:
+    """
+    Прибавить дельты к балансам чата одним INSERT ... ON CONFLICT DO UPDATE SET amount = amount + delta
+    (version + 1 — строка изменилась, см. get_debts_stamp).
+    Только flush-уровень, без commit. Для прочих диалектов — построчный путь.
+    RETURNING + populate_existing обновляет уже загруженные в сессию объекты Debt.
+    """
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {"chat_id": chat_id, "user_id": user_id, "amount": delta, "updated_at": now}
+        for user_id, delta in deltas.items()
+    ]
+    insert = upsert_insert(session)
+    if insert is None:
+        existing = {d.user_id: d for d in session.exec(select(Debt).where(Debt.chat_id == chat_id))}
+        for row in rows:
+            debt = existing.get(row["user_id"]) or Debt(chat_id=chat_id, user_id=row["user_id"], amount=0)
+            debt.amount += row["amount"]
+            debt.updated_at = now
+            debt.version = (debt.version or 0) + 1
+            session.add(debt)
+        session.flush()
+        return
+    stmt = insert(Debt).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Debt.chat_id, Debt.user_id],
+        set_={"amount": Debt.amount + stmt.excluded.amount, "updated_at": stmt.excluded.updated_at,
+              "version": Debt.version + 1},
+    )
+    session.scalars(stmt.returning(Debt), execution_options={"populate_existing": True}).all()
+
+
+def bulk_upsert_debts(session: Session, chat_id: int, balances: Dict[int, int]) -> List[Debt]:
+    """
+    Записать балансы чата целиком: один INSERT ... ON CONFLICT (chat_id, user_id) DO UPDATE
+    на все строки и один DELETE для пользователей, которых больше нет в `balances`.
+    Postgres и SQLite поддерживают одинаковый синтаксис; для прочих диалектов — построчный путь.
+    """
+    now = datetime.utcnow()
+    insert = upsert_insert(session)
+
+    if balances:
+        rows = [
+            {"chat_id": chat_id, "user_id": user_id, "amount": amount, "updated_at": now}
+            for user_id, amount in balances.items()
+        ]
+        if insert is not None:
+            stmt = insert(Debt).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Debt.chat_id, Debt.user_id],
+                set_={"amount": stmt.excluded.amount, "updated_at": stmt.excluded.updated_at,
+                      "version": Debt.version + 1},
+            )
+            session.execute(stmt)
+        else:
+            existing = {d.user_id: d for d in session.exec(select(Debt).where(Debt.chat_id == chat_id))}
+            for row in rows:
+                debt = existing.get(row["user_id"]) or Debt(chat_id=chat_id, user_id=row["user_id"])
+                debt.amount = row["amount"]
+                debt.updated_at = now
+                debt.version = (debt.version or 0) + 1
+                session.add(debt)
+
+    stale = delete(Debt).where(Debt.chat_id == chat_id)
+    if balances:
+        stale = stale.where(Debt.user_id.not_in(list(balances)))
+    session.execute(stale)
+
+    logger.info('Балансы чата перезаписаны')
+    commit_or_flush(session)
+    stmt = select(Debt).where(Debt.chat_id == chat_id).order_by(Debt.id).execution_options(populate_existing=True)
+    return list(session.exec(stmt))
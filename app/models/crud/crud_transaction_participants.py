@@ -1,27 +1,47 @@
 from sqlmodel import Session, select
+from sqlalchemy import delete
 from models.transaction_participants import TransactionParticipant
-from typing import Optional, List
+from models.crud.unit_of_work import commit_or_flush
+from models.crud.bulk import insert_returning
+from typing import Optional, List, Sequence, Tuple
 from logger.logging import get_logger
 
 logger = get_logger(logger_name=__name__)
 
 
-def create_participant(session: Session, transaction_id: int, user_id: int, share_amount: float,
+def create_participant(session: Session, transaction_id: int, user_id: int, share_amount: int,
                        tag: str = "без указания типа транзакции") -> TransactionParticipant:
     logger.info('Создан образ участника долга')
     participant = TransactionParticipant(transaction_id=transaction_id, user_id=user_id,
                                          share_amount=share_amount, tag=tag)
     session.add(participant)
-    session.commit()
-    session.refresh(participant)
+    commit_or_flush(session, participant)
     return participant
 
 
+def create_participants(session: Session, transaction_id: int,
+                        rows: Sequence[Tuple[int, int, str]]) -> List[TransactionParticipant]:
+    """
+    Все участники транзакции одним многострочным INSERT ... RETURNING — число запросов
+    не зависит от числа участников. rows: [(user_id, share_amount, tag), ...].
+    Объекты возвращаются в порядке rows; refresh по одному не делается.
+    """
+    if not rows:
+        return []
+    participants = insert_returning(session, TransactionParticipant, [
+        {"transaction_id": transaction_id, "user_id": user_id, "share_amount": share_amount, "tag": tag}
+        for user_id, share_amount, tag in rows
+    ])
+    logger.info(f'Созданы участники долга: {len(participants)}')
+    commit_or_flush(session)
+    return participants
+
+
 def get_participant(session: Session, id: int) -> Optional[TransactionParticipant]:
     return session.get(TransactionParticipant, id)
 
 
-def update_participant(session: Session, id: int, share_amount: Optional[float] = None, tag: Optional[str] = None) -> Optional[TransactionParticipant]:
+def update_participant(session: Session, id: int, share_amount: Optional[int] = None, tag: Optional[str] = None) -> Optional[TransactionParticipant]:
     participant = get_participant(session, id)
     if not participant:
         return None
@@ -30,8 +50,7 @@ def update_participant(session: Session, id: int, share_amount: Optional[float]
     if tag is not None:
         participant.tag = tag
     session.add(participant)
-    session.commit()
-    session.refresh(participant)
+    commit_or_flush(session, participant)
     return participant
 
 
@@ -40,10 +59,19 @@ def delete_participant(session: Session, id: int) -> bool:
     if not participant:
         return False
     session.delete(participant)
-    session.commit()
+    commit_or_flush(session)
     return True
 
 
+def delete_participants_by_transaction(session: Session, transaction_id: int) -> int:
+    """Все участники транзакции одним DELETE; возвращает число удалённых строк."""
+    result = session.execute(
+        delete(TransactionParticipant).where(TransactionParticipant.transaction_id == transaction_id)
+    )
+    commit_or_flush(session)
+    return result.rowcount or 0
+
+
 def list_participants(
     session: Session, transaction_id: int
 ) -> List[TransactionParticipant]:
@@ -1,27 +1,90 @@
+import io
 from datetime import datetime
 from sqlmodel import Session, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy import BigInteger, Integer, any_, bindparam, cast, delete, func, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.util import await_only
 from models.transactions import Transaction
-from typing import Optional, List
+from models.transaction_participants import TransactionParticipant
+from models.crud.unit_of_work import commit_or_flush
+from models.crud.bulk import insert_returning
+from models.crud.pagination import keyset
+from typing import Optional, List, Dict, Iterator, Sequence, Tuple
 from logger.logging import get_logger
 
 logger = get_logger(logger_name=__name__)
 
 
-def create_transaction(session: Session, chat_id: int, creator_id: int, amount: float,
+def create_transaction(session: Session, chat_id: int, creator_id: int, amount: int,
                        title: Optional[str] = None) -> Transaction:
     logger.info('Транзакция создана')
     transaction = Transaction(chat_id=chat_id, creator_id=creator_id, amount=amount, title=title)
     session.add(transaction)
-    session.commit()
-    session.refresh(transaction)
+    commit_or_flush(session, transaction)
     return transaction
 
 
+def create_transaction_with_participants(
+    session: Session, chat_id: int, creator_id: int, amount: int, title: Optional[str],
+    participants: Sequence[Tuple[int, int, str]],
+) -> Tuple[Transaction, List[TransactionParticipant]]:
+    """
+    Заголовок транзакции (один INSERT) и все её строки (один INSERT ... RETURNING) с одним commit.
+    participants: [(user_id, share_amount, tag), ...].
+    """
+    transaction = Transaction(chat_id=chat_id, creator_id=creator_id, amount=amount, title=title)
+    session.add(transaction)
+    session.flush()
+    parts = insert_returning(session, TransactionParticipant, [
+        {"transaction_id": transaction.id, "user_id": user_id, "share_amount": share_amount, "tag": tag}
+        for user_id, share_amount, tag in participants
+    ])
+    logger.info(f'Транзакция создана, участников: {len(parts)}')
+    commit_or_flush(session)
+    return transaction, parts
+
+
+def bulk_create_settlement(session: Session, *, chat_id: int, batch_id: str,
+                           transfers: Sequence[Tuple[int, int, int]]) -> List[int]:
+    """
+    Транзакции погашения (debtor -> creditor, amount) одним INSERT ... RETURNING id
+    и их участники одним INSERT. Только flush-уровень, без commit и refresh:
+    вызывающий коммитит всё вместе с обновлением балансов.
+    """
+    if not transfers:
+        return []
+    now = datetime.utcnow()
+    tx_ids = insert_returning(session, Transaction, [
+        {"chat_id": chat_id, "creator_id": debtor_id, "amount": amount, "title": "Погашение долга",
+         "created_at": now, "settlement_batch_id": batch_id}
+        for debtor_id, _, amount in transfers
+    ], column=Transaction.id)
+    insert_returning(session, TransactionParticipant, [
+        {"transaction_id": tx_id, "user_id": creditor_id, "share_amount": amount, "tag": "погашение"}
+        for tx_id, (_, creditor_id, amount) in zip(tx_ids, transfers)
+    ], column=TransactionParticipant.id)
+    logger.info(f'Создано транзакций погашения: {len(tx_ids)}')
+    return tx_ids
+
+
+def list_settlement_transfers(session: Session, *, chat_id: int, batch_id: str) -> List[Tuple[int, int, int]]:
+    """Переводы уже записанного батча погашения: [(debtor_id, creditor_id, amount), ...] в порядке создания."""
+    tp = TransactionParticipant
+    stmt = (
+        select(Transaction.creator_id, tp.user_id, tp.share_amount)
+        .join(tp, tp.transaction_id == Transaction.id)
+        .where(Transaction.chat_id == chat_id, Transaction.settlement_batch_id == batch_id)
+        .order_by(Transaction.id)
+    )
+    return [(int(d), int(c), int(a)) for d, c, a in session.exec(stmt)]
+
+
 def get_transaction(session: Session, id: int) -> Optional[Transaction]:
     return session.get(Transaction, id)
 
 
-def update_transaction(session: Session, id: int, amount: Optional[float] = None, title: Optional[str] = None) -> Optional[Transaction]:
+def update_transaction(session: Session, id: int, amount: Optional[int] = None, title: Optional[str] = None) -> Optional[Transaction]:
     transaction = get_transaction(session, id)
     if not transaction:
         return None
@@ -30,19 +93,41 @@ def update_transaction(session: Session, id: int, amount: Optional[float] = None
     if title is not None:
         transaction.title = title
     session.add(transaction)
-    session.commit()
-    session.refresh(transaction)
+    commit_or_flush(session, transaction)
     return transaction
 
 
-def delete_transaction(session: Session, id: int, deleted_at: Optional[datetime] = None) -> bool:
+def _ids_condition(session: Session, ids: Sequence[int]):
+    """id = ANY(:ids) одним массивом-параметром на Postgres, IN (...) на остальных диалектах."""
+    if session.get_bind().dialect.name == "postgresql":
+        return Transaction.id == any_(bindparam("ids", value=list(ids), type_=ARRAY(Integer)))
+    return Transaction.id.in_(list(ids))
+
+
+def delete_transactions(session: Session, *, chat_id: int, ids: Sequence[int]) -> List[int]:
+    """
+    Удалить транзакции чата одним DELETE ... WHERE id = ANY(:ids) RETURNING id.
+    Участников удаляет сама БД (transaction_participants.transaction_id ON DELETE CASCADE).
+    Возвращает id реально удалённых транзакций (чужие и несуществующие пропускаются).
+    """
+    if not ids:
+        return []
+    stmt = (
+        delete(Transaction)
+        .where(Transaction.chat_id == chat_id, _ids_condition(session, ids))
+        .returning(Transaction.id)
+    )
+    deleted = sorted(session.scalars(stmt))
+    logger.info(f'Удалено транзакций: {len(deleted)}')
+    commit_or_flush(session)
+    return deleted
+
+
+def delete_transaction(session: Session, id: int) -> bool:
     transaction = get_transaction(session, id)
     if not transaction:
         return False
-    transaction.deleted_at = deleted_at or datetime.utcnow()
-    session.delete(transaction)
-    session.commit()
-    return True
+    return bool(delete_transactions(session, chat_id=transaction.chat_id, ids=[id]))
 
 
 def list_transactions(session: Session, *, chat_id: Optional[int] = None, limit: Optional[int] = None, offset: int = 0) \
@@ -53,4 +138,206 @@ def list_transactions(session: Session, *, chat_id: Optional[int] = None, limit:
     stmt = stmt.order_by(Transaction.id).offset(offset)
     if limit is not None:
         stmt = stmt.limit(limit)
-    return session.exec(stmt).all()
\ No newline at end of file
+    return session.exec(stmt).all()
+
+
+def list_transactions_page(session: Session, *, chat_id: int, limit: int = 100, before_id: Optional[int] = None,
+                           after_id: Optional[int] = None, newest_first: bool = False) -> List[Transaction]:
+    """Страница транзакций чата по keyset (см. models.crud.pagination), индекс transactions(chat_id, id DESC)."""
+    stmt = keyset(select(Transaction).where(Transaction.chat_id == chat_id), Transaction.id, limit=limit,
+                  before_id=before_id, after_id=after_id, newest_first=newest_first)
+    return list(session.exec(stmt))
+
+
+def list_transactions_with_participants(session: Session, *, chat_id: int, limit: int = 20,
+                                        before_id: Optional[int] = None) -> List[Transaction]:
+    """
+    Последние транзакции чата (новые первыми, id < before_id) вместе с создателем, участниками
+    и их пользователями. selectinload догружает связи пакетными SELECT ... WHERE id IN (...),
+    поэтому число запросов не зависит ни от limit, ни от числа участников.
+    """
+    stmt = keyset(select(Transaction).where(Transaction.chat_id == chat_id), Transaction.id, limit=limit,
+                  before_id=before_id, newest_first=True)
+    stmt = stmt.options(
+        selectinload(Transaction.creator),
+        selectinload(Transaction.participants).selectinload(TransactionParticipant.user),
+    )
+    return list(session.exec(stmt))
+
+
+def _history_filter(chat_id: int, after_id: Optional[int] = None, up_to_id: Optional[int] = None,
+                    ids: Optional[Sequence[int]] = None) -> list:
+    """
+    Условия на транзакции чата в диапазоне (after_id, up_to_id] — для повтора истории после чекпоинта;
+    ids — только перечисленные транзакции (вклад удаляемых транзакций в балансы).
+    """
+    conditions = [Transaction.chat_id == chat_id]
+    if ids is not None:
+        conditions.append(Transaction.id.in_(list(ids)))
+    if after_id is not None:
+        conditions.append(Transaction.id > after_id)
+    if up_to_id is not None:
+        conditions.append(Transaction.id <= up_to_id)
+    return conditions
+
+
+def _balance_sides(chat_id: int, after_id: Optional[int], up_to_id: Optional[int], ids: Optional[Sequence[int]]):
+    """
+    Подзапрос (transaction_id, user_id, delta) по истории чата.
+    Кредит: создатель получает сумму долей своих транзакций (LEFT JOIN, чтобы
+    создатель транзакции без участников тоже попал в результат с нулём).
+    Дебет: каждый участник уходит в минус на свою долю. Обе стороны — через UNION ALL.
+    """
+    tp = TransactionParticipant
+    credit = (
+        select(
+            Transaction.id.label("transaction_id"),
+            Transaction.creator_id.label("user_id"),
+            func.coalesce(tp.share_amount, 0).label("delta"),
+        )
+        .select_from(Transaction)
+        .outerjoin(tp, tp.transaction_id == Transaction.id)
+        .where(*_history_filter(chat_id, after_id, up_to_id, ids))
+    )
+    debit = (
+        select(
+            Transaction.id.label("transaction_id"),
+            tp.user_id.label("user_id"),
+            (-tp.share_amount).label("delta"),
+        )
+        .select_from(Transaction)
+        .join(tp, tp.transaction_id == Transaction.id)
+        .where(*_history_filter(chat_id, after_id, up_to_id, ids))
+    )
+    return union_all(credit, debit).subquery()
+
+
+def aggregate_balances(session: Session, *, chat_id: int, after_id: Optional[int] = None,
+                       up_to_id: Optional[int] = None, ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+    """
+    Чистые балансы всех пользователей чата одним запросом.
+    after_id / up_to_id ограничивают историю диапазоном id транзакций (after_id, up_to_id],
+    ids — конкретным набором транзакций. Суммирование — GROUP BY на стороне БД (см. _balance_sides).
+    """
+    sides = _balance_sides(chat_id, after_id, up_to_id, ids)
+    stmt = select(sides.c.user_id, func.sum(sides.c.delta)).group_by(sides.c.user_id)
+    return {int(user_id): int(total or 0) for user_id, total in session.execute(stmt)}
+
+
+def aggregate_balances_by_transaction(session: Session, *, chat_id: int, ids: Sequence[int]) \
+        -> Dict[int, Dict[int, int]]:
+    """Вклад каждой из транзакций ids в балансы: {transaction_id: {user_id: delta}}, один GROUP BY."""
+    if not ids:
+        return {}
+    sides = _balance_sides(chat_id, None, None, ids)
+    stmt = (
+        select(sides.c.transaction_id, sides.c.user_id, func.sum(sides.c.delta))
+        .group_by(sides.c.transaction_id, sides.c.user_id)
+    )
+    result: Dict[int, Dict[int, int]] = {}
+    for transaction_id, user_id, total in session.execute(stmt):
+        result.setdefault(int(transaction_id), {})[int(user_id)] = int(total or 0)
+    return result
+
+
+def iter_share_rows(session: Session, *, chat_id: int, after_id: Optional[int] = None, batch_size: int = 1000) \
+        -> Iterator[Tuple[int, int, Optional[int], int]]:
+    """
+    Потоково отдаёт строки (transaction_id, creator_id, user_id, share_amount) всей истории чата.
+    Keyset-пагинация по Transaction.id: страница — это batch_size транзакций с id > последнего,
+    их участники читаются серверным курсором (stream_results + yield_per).
+    Память не растёт с длиной истории, ограничения на количество строк нет.
+    Транзакция без участников отдаётся одной строкой с user_id=None и нулевой долей.
+    """
+    tp = TransactionParticipant
+    last_id = after_id or 0
+    while True:
+        page_ids = session.exec(
+            select(Transaction.id)
+            .where(Transaction.chat_id == chat_id, Transaction.id > last_id)
+            .order_by(Transaction.id)
+            .limit(batch_size)
+        ).all()
+        if not page_ids:
+            return
+
+        stmt = (
+            select(Transaction.id, Transaction.creator_id, tp.user_id, func.coalesce(tp.share_amount, 0))
+            .select_from(Transaction)
+            .outerjoin(tp, tp.transaction_id == Transaction.id)
+            .where(
+                Transaction.chat_id == chat_id,
+                Transaction.id > last_id,
+                Transaction.id <= page_ids[-1],
+            )
+            .order_by(Transaction.id, tp.id)
+            .execution_options(stream_results=True, yield_per=batch_size)
+        )
+        for tx_id, creator_id, user_id, share in session.execute(stmt):
+            yield tx_id, creator_id, user_id, int(share)
+
+        if len(page_ids) < batch_size:
+            return
+        last_id = page_ids[-1]
+
+
+def max_transaction_id(session: Session, *, chat_id: int) -> Optional[int]:
+    return session.exec(select(func.max(Transaction.id)).where(Transaction.chat_id == chat_id)).one()
+
+
+def count_transactions(session: Session, *, chat_id: int, after_id: Optional[int] = None) -> int:
+    stmt = select(func.count()).select_from(Transaction).where(*_history_filter(chat_id, after_id))
+    return int(session.exec(stmt).one())
+
+
+def _share_rows_select(chat_id: int, after_id: Optional[int] = None):
+    """
+    Плоские строки (creator_id, user_id, share) по чату без NULL: у транзакции без участников
+    user_id = creator_id и доля 0 — на балансы это не влияет, зато все три колонки BIGINT.
+    """
+    tp = TransactionParticipant
+    return (
+        select(
+            cast(Transaction.creator_id, BigInteger),
+            cast(func.coalesce(tp.user_id, Transaction.creator_id), BigInteger),
+            cast(func.coalesce(tp.share_amount, 0), BigInteger),
+        )
+        .select_from(Transaction)
+        .outerjoin(tp, tp.transaction_id == Transaction.id)
+        .where(*_history_filter(chat_id, after_id))
+    )
+
+
+def count_share_rows(session: Session, *, chat_id: int, after_id: Optional[int] = None) -> int:
+    sub = _share_rows_select(chat_id, after_id).subquery()
+    return int(session.execute(select(func.count()).select_from(sub)).scalar_one())
+
+
+def share_rows(session: Session, *, chat_id: int, after_id: Optional[int] = None) -> List[Tuple[int, int, int]]:
+    """Все строки истории чата (после транзакции after_id) одним запросом — для свёртки в Python."""
+    return [tuple(row) for row in session.execute(_share_rows_select(chat_id, after_id))]
+
+
+def copy_share_rows_binary(session: Session, *, chat_id: int, after_id: Optional[int] = None) -> bytes:
+    """
+    Только Postgres: те же строки через COPY ... TO STDOUT (FORMAT binary).
+    Данные приходят колонками int64 без создания Python-объектов на каждую строку —
+    их разбирает numpy (services.balance_engine.parse_copy_binary).
+    psycopg2 — copy_expert; asyncpg (sync-сессия внутри AsyncSession.run_sync) — copy_from_query через await_only.
+    """
+    dialect = session.get_bind().dialect
+    query = _share_rows_select(chat_id, after_id).compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    buf = io.BytesIO()
+    if dialect.driver == "asyncpg":
+        async def write(chunk: bytes) -> None:
+            buf.write(chunk)
+        driver_connection = session.connection().connection.driver_connection
+        await_only(driver_connection.copy_from_query(str(query), output=write, format="binary"))
+        return buf.getvalue()
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buf)
+    finally:
+        cursor.close()
+    return buf.getvalue()
+
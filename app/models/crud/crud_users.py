@@ -1,6 +1,8 @@
 from sqlmodel import Session, select
 from models.users import User
-from typing import Optional, List, Sequence
+from models.crud.unit_of_work import commit_or_flush
+from models.crud.pagination import keyset
+from typing import Optional, List, Sequence, Iterable
 from logger.logging import get_logger
 from sqlalchemy import func
 
@@ -11,8 +13,7 @@ def create_user(session: Session, id: int, username: Optional[str] = None, first
     logger.info('Пользователь создан')
     user = User(id=id, username=username, first_name=first_name)
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    commit_or_flush(session, user)
     return user
 
 
@@ -29,8 +30,7 @@ def update_user(session: Session, id: int, username: Optional[str] = None, first
     if first_name is not None:
         user.first_name = first_name
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    commit_or_flush(session, user)
     return user
 
 
@@ -39,7 +39,7 @@ def delete_user(session: Session, id: int) -> bool:
     if not user:
         return False
     session.delete(user)
-    session.commit()
+    commit_or_flush(session)
     return True
 
 
@@ -47,6 +47,14 @@ def list_users(session: Session, limit: int = 100, offset: int = 0) -> List[User
     return session.exec(select(User).offset(offset).limit(limit)).all()
 
 
+def list_users_page(session: Session, limit: int = 100, before_id: Optional[int] = None,
+                    after_id: Optional[int] = None, newest_first: bool = False) -> List[User]:
+    """Страница пользователей по keyset по первичному ключу (см. models.crud.pagination)."""
+    stmt = keyset(select(User), User.id, limit=limit, before_id=before_id, after_id=after_id,
+                  newest_first=newest_first)
+    return list(session.exec(stmt))
+
+
 def get_user_by_username(session: Session, username: str) -> Optional[User]:
     """Найти пользователя по username (без @), регистронезависимо."""
     uname = username.lstrip("@").lower()
@@ -61,3 +69,12 @@ def get_users_by_usernames(session: Session, usernames: Sequence[str]) -> List[U
         return []
     stmt = select(User).where(func.lower(User.username).in_(usernames_clean))
     return list(session.exec(stmt).all())
+
+
+def get_users_by_ids(session: Session, ids: Iterable[int]) -> List[User]:
+    """Пользователи по набору id одним SELECT ... WHERE id IN (...)."""
+    ids = list(set(ids))
+    if not ids:
+        return []
+    return list(session.exec(select(User).where(User.id.in_(ids))).all())
+
@@ -0,0 +1,64 @@
+"""
+Блокировка чата на время изменения балансов — между процессами (несколько реплик бота).
+
+lock_chat(session, chat_id) на Postgres берёт pg_advisory_xact_lock(chat_id): блокировка живёт до
+commit/rollback текущей транзакции. Сервисы берут её внутри committing_unit_of_work (models.crud.unit_of_work),
+поэтому она отпускается сразу после записи, а не в конце апдейта.
+Ключ — сам chat_id, так что разные чаты друг друга не ждут. Повторный вызов в той же транзакции
+в БД не ходит. SQLite и прочие диалекты — no-op: SQLite и так пускает одного писателя за раз.
+
+chat_lock_stats() — сколько раз брали блокировку и сколько ждали (ожидание = конкуренция реплик).
+"""
+import threading
+import time
+from typing import Dict
+from sqlalchemy import event, text
+from sqlmodel import Session
+
+_HELD_KEY = "chat_advisory_locks"
+
+_stats_lock = threading.Lock()
+_stats = {"acquired": 0, "reentrant": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+
+def lock_chat(session: Session, chat_id: int) -> bool:
+    """Взять блокировку чата до конца транзакции. False — диалект без advisory-блокировок."""
+    if session.get_bind().dialect.name != "postgresql":
+        return False
+    held = session.info.setdefault(_HELD_KEY, set())
+    if chat_id in held:
+        with _stats_lock:
+            _stats["reentrant"] += 1
+        return True
+    started = time.perf_counter()
+    session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": chat_id})
+    waited = time.perf_counter() - started
+    held.add(chat_id)
+    with _stats_lock:
+        _stats["acquired"] += 1
+        _stats["wait_total"] += waited
+        _stats["wait_max"] = max(_stats["wait_max"], waited)
+    return True
+
+
+def chat_lock_stats() -> Dict[str, float]:
+    with _stats_lock:
+        acquired = _stats["acquired"]
+        return {
+            "acquired": acquired,
+            "reentrant": _stats["reentrant"],
+            "avg_wait_ms": round(_stats["wait_total"] / acquired * 1000, 3) if acquired else 0.0,
+            "max_wait_ms": round(_stats["wait_max"] * 1000, 3),
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _release_after_commit(session: Session) -> None:
+    session.info.pop(_HELD_KEY, None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _release_after_rollback(session: Session, previous_transaction) -> None:
+    # Откат SAVEPOINT блокировку транзакции не снимает
+    if not previous_transaction.nested:
+        session.info.pop(_HELD_KEY, None)
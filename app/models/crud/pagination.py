@@ -0,0 +1,28 @@
+# models/crud/pagination.py
+"""
+Keyset-пагинация по целочисленному id вместо OFFSET.
+
+OFFSET заставляет БД прочитать и выбросить все строки предыдущих страниц, поэтому глубокие
+страницы дорожают линейно. Здесь следующая страница начинается с условия id < before_id
+(или id > after_id), а по индексу (..., id) это один спуск по B-дереву: страница тысячная
+стоит столько же, сколько первая.
+
+Курсор для следующей страницы — id последней строки текущей:
+before_id для newest_first=True, after_id для обычного порядка.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+
+def keyset(stmt, id_column, *, limit: Optional[int], before_id: Optional[int] = None,
+           after_id: Optional[int] = None, newest_first: bool = False):
+    """Добавить к select окно по id (after_id < id < before_id), сортировку по id и limit."""
+    if before_id is not None:
+        stmt = stmt.where(id_column < before_id)
+    if after_id is not None:
+        stmt = stmt.where(id_column > after_id)
+    stmt = stmt.order_by(id_column.desc() if newest_first else id_column)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
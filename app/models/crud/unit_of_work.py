@@ -0,0 +1,85 @@
+"""
+Единица работы поверх Session.
+
+По умолчанию CRUD-функции коммитят каждую операцию сами (удобно для скриптов и консоли).
+Внутри unit_of_work(session) они только flush'ат: id и значения по умолчанию уже есть,
+а один commit в конце делает владелец единицы работы (DBSessionMiddleware или вызывающий код).
+async_unit_of_work — то же для AsyncSession: флаг ставится на её sync_session, где и работают CRUD.
+committing_unit_of_work — для записей под блокировкой чата: коммитит в конце своего блока даже внутри внешней.
+"""
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+_DEFERRED_KEY = "uow_deferred_commit"
+
+
+def is_deferred(session: Session) -> bool:
+    return bool(session.info.get(_DEFERRED_KEY))
+
+
+def commit_or_flush(session: Session, *objects) -> None:
+    """commit + refresh объектов в обычном режиме, только flush внутри unit_of_work."""
+    if is_deferred(session):
+        session.flush()
+        return
+    session.commit()
+    for obj in objects:
+        session.refresh(obj)
+
+
+@contextmanager
+def unit_of_work(session: Session) -> Iterator[Session]:
+    """
+    Все записи внутри блока — одна транзакция и один commit в конце; при исключении — rollback.
+    Вложенный unit_of_work ничего не коммитит: коммит остаётся за внешним.
+    """
+    if is_deferred(session):
+        yield session
+        return
+
+    session.info[_DEFERRED_KEY] = True
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(_DEFERRED_KEY, None)
+
+
+@contextmanager
+def committing_unit_of_work(session: Session) -> Iterator[Session]:
+    """
+    unit_of_work, который коммитит в конце блока и внутри внешней единицы работы — вместе со всем,
+    что внешняя успела записать до него. Нужен записям под блокировкой чата (models.crud.locks):
+    она живёт до commit, а внешняя единица работы апдейта коммитит уже после ответа в Telegram —
+    все записи чата ждали бы сетевой round trip. Исключение обрабатывается как во вложенном unit_of_work.
+    """
+    if not is_deferred(session):
+        with unit_of_work(session):
+            yield session
+        return
+
+    yield session
+    session.commit()
+
+
+@asynccontextmanager
+async def async_unit_of_work(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """unit_of_work для AsyncSession: один await commit() в конце, rollback при исключении."""
+    if is_deferred(session.sync_session):
+        yield session
+        return
+
+    session.sync_session.info[_DEFERRED_KEY] = True
+    try:
+        yield session
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        session.sync_session.info.pop(_DEFERRED_KEY, None)
@@ -1,20 +1,27 @@
 from datetime import datetime
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import BigInteger
+from sqlalchemy import BigInteger, UniqueConstraint, Index
 
 
 class Debt(SQLModel, table=True):
     __tablename__ = "debts"
+    # Один актуальный баланс на пользователя в чате — на этом ключе работает ON CONFLICT в bulk_upsert
+    __table_args__ = (
+        UniqueConstraint("chat_id", "user_id", name="uq_debts_chat_user"),
+        Index("ix_debts_chat_id_id", "chat_id", "id"),  # keyset-страницы (page_by_chat)
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     chat_id: int = Field(foreign_key="chats.id", sa_type=BigInteger)
     user_id: int = Field(foreign_key="users.id", sa_type=BigInteger)
-    amount: float = Field(default=0.0)
+    amount: int = Field(default=0, sa_type=BigInteger)  # в копейках, >0 — ему должны
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Растёт на каждой записи строки: по сумме версий кэш плана видит записи других реплик (crud_debts.get_debts_stamp)
+    version: int = Field(default=0)
 
     chat: "Chat" = Relationship(back_populates="debts")
     user: "User" = Relationship(back_populates="debts")
     
     def __repr__(self) -> str:
-        return f"Debt(id={self.id}, chat_id={self.chat_id}, user_id={self.user_id}, amount={self.amount})"
+        return f"Debt(id={self.id}, chat_id={self.chat_id}, user_id={self.user_id}, amount={self.amount}, version={self.version})"
@@ -1,11 +1,15 @@
 from typing import Optional
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index
 from sqlalchemy import BigInteger
 
 
 class TransactionParticipant(SQLModel, table=True):
     __tablename__ = "transaction_participants"
+    __table_args__ = (
+        Index("ix_transaction_participants_transaction_id", "transaction_id"),
+        Index("ix_transaction_participants_user_id", "user_id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     transaction_id: int = Field(
@@ -16,7 +20,7 @@ class TransactionParticipant(SQLModel, table=True):
         )
     )
     user_id: int = Field(foreign_key="users.id", sa_type=BigInteger)
-    share_amount: float
+    share_amount: int = Field(sa_type=BigInteger)  # в копейках
     tag: str = Field(default="без указания типа транзакции")
 
     transaction: Optional["Transaction"] = Relationship(
@@ -1,19 +1,23 @@
 from datetime import datetime
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import BigInteger
+from sqlalchemy import BigInteger, Index, text
 
 
 class Transaction(SQLModel, table=True):
     __tablename__ = "transactions"
+    # История чата идёт от новых к старым: WHERE chat_id = ? ORDER BY id DESC (см. миграцию hot_path_indexes)
+    __table_args__ = (Index("ix_transactions_chat_id_id", "chat_id", text("id DESC")),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     chat_id: int = Field(foreign_key="chats.id", sa_type=BigInteger)
     creator_id: int = Field(foreign_key="users.id", sa_type=BigInteger)
-    amount: float
+    amount: int = Field(sa_type=BigInteger)  # в минимальных единицах (копейках)
     title: Optional[str] = Field(default=None)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     deleted_at: Optional[datetime] = Field(default=None)
+    # Транзакции погашения, созданные одним /settle_all, помечены общим id — по нему повтор не пишет их заново
+    settlement_batch_id: Optional[str] = Field(default=None, index=True)
 
     chat: "Chat" = Relationship(back_populates="transactions")
     creator: "User" = Relationship(back_populates="transactions_created")
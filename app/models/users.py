@@ -1,10 +1,12 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import BigInteger
+from sqlalchemy import BigInteger, Index, func, column
 
 
 class User(SQLModel, table=True):
     __tablename__ = "users"
+    # Поиск по @username регистронезависимый: WHERE lower(username) IN (...)
+    __table_args__ = (Index("ix_users_username_lower", func.lower(column("username"))),)
 
     id: int = Field(primary_key=True, index=True, sa_type=BigInteger)  # Telegram ID
     username: Optional[str] = Field(default=None)
@@ -1,13 +1,22 @@
 # app/repositories/__init__.py
-from .base import (UsersRepo, ChatsRepo, TransactionsRepo, TransactionParticipantsRepo, DebtsRepo, RepositoryError)
+from .base import (UsersRepo, ChatsRepo, ChatMembersRepo, TransactionsRepo, TransactionParticipantsRepo,
+                   DebtsRepo, BalanceCheckpointsRepo, RepositoryError)
 from .users_repo import UsersRepoSqlModel
 from .chats_repo import ChatsRepoSqlModel
+from .chat_members_repo import ChatMembersRepoSqlModel
 from .transactions_repo import TransactionsRepoSqlModel
 from .transaction_participants_repo import TransactionParticipantsRepoSqlModel
 from .debts_repo import DebtsRepoSqlModel
+from .balance_checkpoints_repo import BalanceCheckpointsRepoSqlModel
+from .async_repos import (AsyncBridge, AsyncUsersRepo, AsyncChatsRepo, AsyncChatMembersRepo,
+                          AsyncTransactionsRepo, AsyncTransactionParticipantsRepo, AsyncDebtsRepo,
+                          AsyncBalanceCheckpointsRepo)
 
 __all__ = [
-    "RepositoryError", "UsersRepo", "ChatsRepo", "TransactionsRepo", "TransactionParticipantsRepo", "DebtsRepo",
-    "UsersRepoSqlModel", "ChatsRepoSqlModel", "TransactionsRepoSqlModel", "TransactionParticipantsRepoSqlModel",
-    "DebtsRepoSqlModel",
+    "RepositoryError", "UsersRepo", "ChatsRepo", "ChatMembersRepo", "TransactionsRepo", "TransactionParticipantsRepo",
+    "DebtsRepo", "BalanceCheckpointsRepo",
+    "UsersRepoSqlModel", "ChatsRepoSqlModel", "ChatMembersRepoSqlModel", "TransactionsRepoSqlModel",
+    "TransactionParticipantsRepoSqlModel", "DebtsRepoSqlModel", "BalanceCheckpointsRepoSqlModel",
+    "AsyncBridge", "AsyncUsersRepo", "AsyncChatsRepo", "AsyncChatMembersRepo", "AsyncTransactionsRepo",
+    "AsyncTransactionParticipantsRepo", "AsyncDebtsRepo", "AsyncBalanceCheckpointsRepo",
 ]
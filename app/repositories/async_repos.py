@@ -0,0 +1,97 @@
+# app/repositories/async_repos.py
+"""
+Асинхронные репозитории поверх AsyncSession (asyncpg / aiosqlite).
+
+Вся логика запросов остаётся в синхронных CRUD и *RepoSqlModel: AsyncBridge вызывает метод
+синхронного репозитория через AsyncSession.run_sync. Код CRUD выполняется в greenlet, а каждый
+поход в БД превращается в await драйвера — event loop в это время обслуживает другие апдейты.
+
+    users = AsyncUsersRepo(async_session)
+    user = await users.get(42)
+
+Методы, возвращающие итераторы (iter_by_chat, iter_share_rows), дочитываются до списка внутри
+run_sync: вне greenlet ленивые запросы выполнить нельзя.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Generic, Iterator, TypeVar
+
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from repositories.users_repo import UsersRepoSqlModel
+from repositories.chats_repo import ChatsRepoSqlModel
+from repositories.chat_members_repo import ChatMembersRepoSqlModel
+from repositories.transactions_repo import TransactionsRepoSqlModel
+from repositories.transaction_participants_repo import TransactionParticipantsRepoSqlModel
+from repositories.debts_repo import DebtsRepoSqlModel
+from repositories.balance_checkpoints_repo import BalanceCheckpointsRepoSqlModel
+
+T = TypeVar("T")
+
+
+def _call_sync(session: Session, factory: Callable[[Session], Any], name: str, args: tuple, kwargs: dict) -> Any:
+    result = getattr(factory(session), name)(*args, **kwargs)
+    if isinstance(result, Iterator):
+        return list(result)
+    return result
+
+
+class AsyncBridge(Generic[T]):
+    """
+    Асинхронный фасад над синхронным объектом, который строится из Session (репозиторий, сервис).
+    Любой публичный метод объекта доступен как корутина с теми же аргументами.
+    """
+
+    def __init__(self, session: AsyncSession, factory: Callable[[Session], T]) -> None:
+        self.session = session
+        self.factory = factory
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return await self.session.run_sync(_call_sync, self.factory, name, args, kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def run(self, fn: Callable[[T], Any]) -> Any:
+        """Несколько вызовов за один переход в greenlet: await repo.run(lambda r: ...)."""
+        return await self.session.run_sync(lambda s: fn(self.factory(s)))
+
+
+class AsyncUsersRepo(AsyncBridge[UsersRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, UsersRepoSqlModel)
+
+
+class AsyncChatsRepo(AsyncBridge[ChatsRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, ChatsRepoSqlModel)
+
+
+class AsyncChatMembersRepo(AsyncBridge[ChatMembersRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, ChatMembersRepoSqlModel)
+
+
+class AsyncTransactionsRepo(AsyncBridge[TransactionsRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, TransactionsRepoSqlModel)
+
+
+class AsyncTransactionParticipantsRepo(AsyncBridge[TransactionParticipantsRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, TransactionParticipantsRepoSqlModel)
+
+
+class AsyncDebtsRepo(AsyncBridge[DebtsRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, DebtsRepoSqlModel)
+
+
+class AsyncBalanceCheckpointsRepo(AsyncBridge[BalanceCheckpointsRepoSqlModel]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, BalanceCheckpointsRepoSqlModel)
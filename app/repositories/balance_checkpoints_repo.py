@@ -0,0 +1,28 @@
+# app/repositories/balance_checkpoints_repo.py
+from __future__ import annotations
+from typing import Optional, Dict
+from sqlmodel import Session
+from repositories.base import BalanceCheckpointsRepo
+from models.crud.crud_balance_checkpoints import (
+    latest_checkpoint_id, get_checkpoint, write_checkpoint, delete_checkpoints_from, prune_checkpoints,
+)
+
+
+class BalanceCheckpointsRepoSqlModel(BalanceCheckpointsRepo):
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def latest_id(self, *, chat_id: int) -> Optional[int]:
+        return latest_checkpoint_id(self.session, chat_id=chat_id)
+
+    def get(self, *, chat_id: int, as_of_tx_id: int) -> Dict[int, int]:
+        return get_checkpoint(self.session, chat_id=chat_id, as_of_tx_id=as_of_tx_id)
+
+    def write(self, *, chat_id: int, as_of_tx_id: int, balances: Dict[int, int]) -> None:
+        write_checkpoint(self.session, chat_id=chat_id, as_of_tx_id=as_of_tx_id, balances=balances)
+
+    def delete_from(self, *, chat_id: int, tx_id: int) -> int:
+        return delete_checkpoints_from(self.session, chat_id=chat_id, tx_id=tx_id)
+
+    def prune(self, *, chat_id: int, keep: int) -> None:
+        prune_checkpoints(self.session, chat_id=chat_id, keep=keep)
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing import Protocol, Optional, Iterable, List, Sequence
+from datetime import datetime
+from typing import Protocol, Optional, Iterable, List, Sequence, Dict, Iterator, Tuple
 from models.users import User
+from cache.user_display import UserDisplay
 from models.chats import Chat
 from models.transactions import Transaction
 from models.transaction_participants import TransactionParticipant
 from models.debts import Debt
+from models.chat_members import SeenMember
 
 
 class RepositoryError(RuntimeError):
@@ -17,10 +20,15 @@ class UsersRepo(Protocol):
     def create(self, *, id: int, username: Optional[str], first_name: Optional[str]) -> User: ...
     def get(self, id: int) -> Optional[User]: ...
     def list(self, *, limit: int = 100, offset: int = 0) -> List[User]: ...
+    def page(self, *, limit: int = 100, before_id: Optional[int] = None, after_id: Optional[int] = None,
+             newest_first: bool = False) -> List[User]: ...
     def update(self, *, id: int, username: Optional[str] = None, first_name: Optional[str] = None) -> Optional[User]: ...
     def delete(self, *, id: int) -> bool: ...
     def get_by_username(self, username: str) -> Optional[User]: ...
     def get_many_by_usernames(self, usernames: Sequence[str]) -> List[User]: ...
+    def get_many(self, ids: Iterable[int]) -> List[User]: ...
+    def upsert(self, *, id: int, username: Optional[str], first_name: Optional[str]) -> User: ...
+    def get_display_many(self, ids: Iterable[int]) -> Dict[int, UserDisplay]: ...
 
 
 class ChatsRepo(Protocol):
@@ -31,15 +39,45 @@ class ChatsRepo(Protocol):
     def delete(self, *, id: int) -> bool: ...
 
 
+class ChatMembersRepo(Protocol):
+    def register_many(self, entries: Sequence[SeenMember]) -> None: ...
+    def member_ids(self, *, chat_id: int) -> List[int]: ...
+
+
 class TransactionsRepo(Protocol):
-    def create(self, *, chat_id: int, creator_id: int, amount: float, title: Optional[str]) -> Transaction: ...
+    def create(self, *, chat_id: int, creator_id: int, amount: int, title: Optional[str]) -> Transaction: ...
+    def create_with_participants(
+        self, *, chat_id: int, creator_id: int, amount: int, title: Optional[str],
+        participants: Sequence[Tuple[int, int, str]],
+    ) -> Tuple[Transaction, List[TransactionParticipant]]: ...
+    def bulk_create_settlement(self, *, chat_id: int, batch_id: str,
+                               transfers: Sequence[Tuple[int, int, int]]) -> List[int]: ...
+    def list_settlement_transfers(self, *, chat_id: int, batch_id: str) -> List[Tuple[int, int, int]]: ...
     def get(self, id: int) -> Optional[Transaction]: ...
     def list_by_chat(self, *, chat_id: int, limit: int = 100, offset: int = 0) -> List[Transaction]: ...
+    def page_by_chat(self, *, chat_id: int, limit: int = 100, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None, newest_first: bool = False) -> List[Transaction]: ...
     def delete(self, *, id: int) -> bool: ...
+    def list_with_participants(self, *, chat_id: int, limit: int = 20,
+                               before_id: Optional[int] = None) -> List[Transaction]: ...
+    def delete_many(self, *, chat_id: int, ids: Sequence[int]) -> List[int]: ...
+    def balances_by_chat(self, *, chat_id: int, after_id: Optional[int] = None,
+                         up_to_id: Optional[int] = None, ids: Optional[Sequence[int]] = None) -> Dict[int, int]: ...
+    def balances_by_transaction(self, *, chat_id: int, ids: Sequence[int]) -> Dict[int, Dict[int, int]]: ...
+    def max_id_by_chat(self, *, chat_id: int) -> Optional[int]: ...
+    def count_by_chat(self, *, chat_id: int, after_id: Optional[int] = None) -> int: ...
+    def iter_share_rows(self, *, chat_id: int, after_id: Optional[int] = None, batch_size: int = 1000) \
+            -> Iterator[Tuple[int, int, Optional[int], int]]: ...
+    def count_share_rows(self, *, chat_id: int, after_id: Optional[int] = None) -> int: ...
+    def share_rows(self, *, chat_id: int, after_id: Optional[int] = None) -> List[Tuple[int, int, int]]: ...
+    def supports_binary_copy(self) -> bool: ...
+    def copy_share_rows_binary(self, *, chat_id: int, after_id: Optional[int] = None) -> bytes: ...
 
 
 class TransactionParticipantsRepo(Protocol):
-    def create(self, *, transaction_id: int, user_id: int, share_amount: float, tag: str) -> TransactionParticipant: ...
+    def create(self, *, transaction_id: int, user_id: int, share_amount: int, tag: str) -> TransactionParticipant: ...
+    def create_many(self, *, transaction_id: int, rows: Sequence[Tuple[int, int, str]]) \
+            -> List[TransactionParticipant]: ...
     def get(self, id: int) -> Optional[TransactionParticipant]: ...
     def list_by_transaction(self, *, transaction_id: int) -> List[TransactionParticipant]: ...
     def delete(self, *, id: int) -> bool: ...
@@ -47,10 +85,26 @@ class TransactionParticipantsRepo(Protocol):
 
 
 class DebtsRepo(Protocol):
-    def create(self, *, chat_id: int, user_id: int, amount: float) -> Debt: ...
+    def create(self, *, chat_id: int, user_id: int, amount: int) -> Debt: ...
     def get(self, id: int) -> Optional[Debt]: ...
     def get_by_chat_user(self, *, chat_id: int, user_id: int) -> Optional[Debt]: ...
     def list_by_chat(self, *, chat_id: int, limit: int = 100, offset: int = 0) -> List[Debt]: ...
-    def update(self, *, id: int, amount: float) -> Optional[Debt]: ...
-    def upsert_delta(self, *, chat_id: int, user_id: int, delta: float) -> Debt: ...
+    def page_by_chat(self, *, chat_id: int, limit: int = 100, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None, newest_first: bool = False) -> List[Debt]: ...
+    def iter_by_chat(self, *, chat_id: int, batch_size: int = 1000) -> Iterator[Debt]: ...
+    def amounts_by_chat(self, *, chat_id: int) -> Dict[int, int]: ...
+    def stamp(self, *, chat_id: int) -> Tuple[int, int, Optional[datetime]]: ...
+    def update(self, *, id: int, amount: int) -> Optional[Debt]: ...
+    def upsert_delta(self, *, chat_id: int, user_id: int, delta: int) -> Debt: ...
+    def lock_chat(self, *, chat_id: int) -> bool: ...
+    def bulk_upsert(self, *, chat_id: int, balances: Dict[int, int]) -> List[Debt]: ...
+    def apply_deltas(self, *, chat_id: int, deltas: Dict[int, int]) -> None: ...
     def delete(self, *, id: int) -> bool: ...
+
+
+class BalanceCheckpointsRepo(Protocol):
+    def latest_id(self, *, chat_id: int) -> Optional[int]: ...
+    def get(self, *, chat_id: int, as_of_tx_id: int) -> Dict[int, int]: ...
+    def write(self, *, chat_id: int, as_of_tx_id: int, balances: Dict[int, int]) -> None: ...
+    def delete_from(self, *, chat_id: int, tx_id: int) -> int: ...
+    def prune(self, *, chat_id: int, keep: int) -> None: ...
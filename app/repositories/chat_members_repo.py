@@ -0,0 +1,31 @@
+# app/repositories/chat_members_repo.py
+from __future__ import annotations
+from typing import List, Sequence
+from sqlmodel import Session
+from repositories.base import ChatMembersRepo
+from models.chat_members import SeenMember
+from cache.lru import LRUCache
+from cache.user_display import UserDisplay, user_display_cache, invalidate_user, remember_user
+from cache.known_chats import remember_chat
+from models.crud.crud_chat_members import register_members, list_member_ids
+
+
+class ChatMembersRepoSqlModel(ChatMembersRepo):
+    def __init__(self, session: Session, cache: LRUCache = user_display_cache) -> None:
+        self.session = session
+        self.cache = cache
+
+    def register_many(self, entries: Sequence[SeenMember]) -> None:
+        """
+        Пакетная авторегистрация. Профили пользователей и чаты попадают в кэши процесса
+        (как после ensure_user_and_chat) только после commit.
+        """
+        for entry in entries:
+            invalidate_user(self.session, entry.user_id, self.cache)
+        register_members(self.session, entries)
+        for entry in entries:
+            remember_user(self.session, UserDisplay(entry.user_id, entry.username, entry.first_name), self.cache)
+            remember_chat(self.session, entry.chat_id)
+
+    def member_ids(self, *, chat_id: int) -> List[int]:
+        return list_member_ids(self.session, chat_id=chat_id)
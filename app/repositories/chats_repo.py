@@ -3,6 +3,7 @@ from typing import Optional, List
 from sqlmodel import Session
 from repositories.base import ChatsRepo
 from models.chats import Chat
+from cache.known_chats import forget_chat
 from models.crud.crud_chats import (
     create_chat, get_chat, list_chats, update_chat, delete_chat,
 )
@@ -25,4 +26,6 @@ class ChatsRepoSqlModel(ChatsRepo):
         return update_chat(self.session, id=id, title=title)
 
     def delete(self, *, id: int) -> bool:
-        return delete_chat(self.session, id=id)
+        deleted = delete_chat(self.session, id=id)
+        forget_chat(self.session, id)
+        return deleted
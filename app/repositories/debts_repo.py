@@ -1,11 +1,14 @@
 # app/repositories/debts_repo.py
 from __future__ import annotations
-from typing import Optional, List
-from sqlmodel import Session, select
+from datetime import datetime
+from typing import Optional, List, Dict, Iterator, Tuple
+from sqlmodel import Session
 from repositories.base import DebtsRepo
 from models.debts import Debt
+from models.crud.locks import lock_chat
 from models.crud.crud_debts import (
-    create_debt, get_debt, list_debts, update_debt, delete_debt,
+    create_debt, get_debt, list_debts, update_debt, delete_debt, bulk_upsert_debts, iter_debts, apply_debt_deltas,
+    list_debts_page, get_debt_amounts, get_debts_stamp, get_debt_by_chat_user,
 )
 
 
@@ -13,36 +16,55 @@ class DebtsRepoSqlModel(DebtsRepo):
     def __init__(self, session: Session) -> None:
         self.session = session
 
-    def create(self, *, chat_id: int, user_id: int, amount: float) -> Debt:
+    def create(self, *, chat_id: int, user_id: int, amount: int) -> Debt:
         return create_debt(self.session, chat_id=chat_id, user_id=user_id, amount=amount)
 
     def get(self, id: int) -> Optional[Debt]:
         return get_debt(self.session, id)
 
     def get_by_chat_user(self, *, chat_id: int, user_id: int) -> Optional[Debt]:
-        # если у тебя есть CRUD-функция, используй её; иначе — прямой запрос
-        stmt = select(Debt).where(Debt.chat_id == chat_id, Debt.user_id == user_id)
-        return self.session.exec(stmt).first()
+        return get_debt_by_chat_user(self.session, chat_id=chat_id, user_id=user_id)
 
     def list_by_chat(self, *, chat_id: int, limit: int = 100, offset: int = 0) -> List[Debt]:
         return list_debts(self.session, chat_id=chat_id, limit=limit, offset=offset)
 
-    def update(self, *, id: int, amount: float) -> Optional[Debt]:
+    def page_by_chat(self, *, chat_id: int, limit: int = 100, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None, newest_first: bool = False) -> List[Debt]:
+        return list_debts_page(self.session, chat_id=chat_id, limit=limit, before_id=before_id,
+                               after_id=after_id, newest_first=newest_first)
+
+    def amounts_by_chat(self, *, chat_id: int) -> Dict[int, int]:
+        return get_debt_amounts(self.session, chat_id=chat_id)
+
+    def stamp(self, *, chat_id: int) -> Tuple[int, int, Optional[datetime]]:
+        """Отпечаток состояния долгов чата в БД (см. crud_debts.get_debts_stamp) — часть ключа кэша плана."""
+        return get_debts_stamp(self.session, chat_id=chat_id)
+
+    def iter_by_chat(self, *, chat_id: int, batch_size: int = 1000) -> Iterator[Debt]:
+        return iter_debts(self.session, chat_id=chat_id, batch_size=batch_size)
+
+    def update(self, *, id: int, amount: int) -> Optional[Debt]:
         return update_debt(self.session, id=id, amount=amount)
 
-    def upsert_delta(self, *, chat_id: int, user_id: int, delta: float) -> Debt:
+    def upsert_delta(self, *, chat_id: int, user_id: int, delta: int) -> Debt:
         """
-        Удобный метод: найти долг по (chat_id, user_id) и изменить его на delta.
-        Если долга нет — создать с amount=delta.
+        Удобный метод: изменить долг по (chat_id, user_id) на delta, а если долга нет — создать
+        с amount=delta. Тот же атомарный upsert (amount = amount + delta), что и apply_deltas. Без commit.
         """
-        existing = self.get_by_chat_user(chat_id=chat_id, user_id=user_id)
-        if existing:
-            existing.amount = (existing.amount or 0.0) + float(delta)
-            self.session.add(existing)
-            # updated_at обновится, если в модели у тебя автозаполнение (или обнови вручную)
-            return existing
-        else:
-            return self.create(chat_id=chat_id, user_id=user_id, amount=float(delta))
+        apply_debt_deltas(self.session, chat_id=chat_id, deltas={user_id: int(delta)})
+        return get_debt_by_chat_user(self.session, chat_id=chat_id, user_id=user_id)
+
+    def lock_chat(self, *, chat_id: int) -> bool:
+        """Advisory-блокировка балансов чата до конца транзакции (см. models.crud.locks)."""
+        return lock_chat(self.session, chat_id)
+
+    def bulk_upsert(self, *, chat_id: int, balances: Dict[int, int]) -> List[Debt]:
+        """Перезаписать все балансы чата за один INSERT ... ON CONFLICT и один DELETE выбывших."""
+        return bulk_upsert_debts(self.session, chat_id=chat_id, balances=balances)
+
+    def apply_deltas(self, *, chat_id: int, deltas: Dict[int, int]) -> None:
+        """Все дельты чата одним upsert'ом (amount = amount + delta). Без commit."""
+        apply_debt_deltas(self.session, chat_id=chat_id, deltas=deltas)
 
     def delete(self, *, id: int) -> bool:
         return delete_debt(self.session, id=id)
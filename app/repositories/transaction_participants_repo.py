@@ -1,10 +1,11 @@
 from __future__ import annotations
-from typing import Optional, List
-from sqlmodel import Session, select
+from typing import Optional, List, Sequence, Tuple
+from sqlmodel import Session
 from repositories.base import TransactionParticipantsRepo
 from models.transaction_participants import TransactionParticipant
 from models.crud.crud_transaction_participants import (
-    create_participant, get_participant, list_participants, delete_participant,
+    create_participant, create_participants, get_participant, list_participants, delete_participant,
+    delete_participants_by_transaction,
 )
 
 
@@ -12,9 +13,13 @@ class TransactionParticipantsRepoSqlModel(TransactionParticipantsRepo):
     def __init__(self, session: Session) -> None:
         self.session = session
 
-    def create(self, *, transaction_id: int, user_id: int, share_amount: float, tag: str) -> TransactionParticipant:
+    def create(self, *, transaction_id: int, user_id: int, share_amount: int, tag: str) -> TransactionParticipant:
         return create_participant(self.session, transaction_id=transaction_id, user_id=user_id, share_amount=share_amount, tag=tag)
 
+    def create_many(self, *, transaction_id: int, rows: Sequence[Tuple[int, int, str]]) \
+            -> List[TransactionParticipant]:
+        return create_participants(self.session, transaction_id=transaction_id, rows=rows)
+
     def get(self, id: int) -> Optional[TransactionParticipant]:
         return get_participant(self.session, id)
 
@@ -26,11 +31,4 @@ class TransactionParticipantsRepoSqlModel(TransactionParticipantsRepo):
         return delete_participant(self.session, id=id)
 
     def delete_by_transaction(self, *, transaction_id: int) -> int:
-        # Быстрое удаление всех участников транзакции (если такого CRUD нет)
-        stmt = select(TransactionParticipant).where(TransactionParticipant.transaction_id == transaction_id)
-        to_delete = self.session.exec(stmt).all()
-        count = 0
-        for p in to_delete:
-            self.session.delete(p)
-            count += 1
-        return count
+        return delete_participants_by_transaction(self.session, transaction_id=transaction_id)
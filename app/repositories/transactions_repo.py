@@ -1,10 +1,16 @@
 from __future__ import annotations
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterator, Sequence, Tuple
 from sqlmodel import Session
 from repositories.base import TransactionsRepo
 from models.transactions import Transaction
+from models.transaction_participants import TransactionParticipant
 from models.crud.crud_transactions import (
-    create_transaction, get_transaction, list_transactions, delete_transaction,
+    create_transaction, create_transaction_with_participants, get_transaction, delete_transactions,
+    list_transactions_with_participants, list_transactions, delete_transaction, aggregate_balances,
+    aggregate_balances_by_transaction,
+    list_transactions_page,
+    iter_share_rows, count_share_rows, share_rows, copy_share_rows_binary, max_transaction_id, count_transactions,
+    bulk_create_settlement, list_settlement_transfers,
 )
 
 
@@ -12,14 +18,73 @@ class TransactionsRepoSqlModel(TransactionsRepo):
     def __init__(self, session: Session) -> None:
         self.session = session
 
-    def create(self, *, chat_id: int, creator_id: int, amount: float, title: Optional[str]) -> Transaction:
+    def create(self, *, chat_id: int, creator_id: int, amount: int, title: Optional[str]) -> Transaction:
         return create_transaction(self.session, chat_id=chat_id, creator_id=creator_id, amount=amount, title=title)
 
+    def create_with_participants(
+        self, *, chat_id: int, creator_id: int, amount: int, title: Optional[str],
+        participants: Sequence[Tuple[int, int, str]],
+    ) -> Tuple[Transaction, List[TransactionParticipant]]:
+        return create_transaction_with_participants(
+            self.session, chat_id=chat_id, creator_id=creator_id, amount=amount, title=title,
+            participants=participants,
+        )
+
+    def bulk_create_settlement(self, *, chat_id: int, batch_id: str,
+                               transfers: Sequence[Tuple[int, int, int]]) -> List[int]:
+        return bulk_create_settlement(self.session, chat_id=chat_id, batch_id=batch_id, transfers=transfers)
+
+    def list_settlement_transfers(self, *, chat_id: int, batch_id: str) -> List[Tuple[int, int, int]]:
+        return list_settlement_transfers(self.session, chat_id=chat_id, batch_id=batch_id)
+
     def get(self, id: int) -> Optional[Transaction]:
         return get_transaction(self.session, id)
 
     def list_by_chat(self, *, chat_id: int, limit: int = 100, offset: int = 0) -> List[Transaction]:
         return list_transactions(self.session, chat_id=chat_id, limit=limit, offset=offset)
 
+    def page_by_chat(self, *, chat_id: int, limit: int = 100, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None, newest_first: bool = False) -> List[Transaction]:
+        return list_transactions_page(self.session, chat_id=chat_id, limit=limit, before_id=before_id,
+                                      after_id=after_id, newest_first=newest_first)
+
     def delete(self, *, id: int) -> bool:
-        return delete_transaction(self.session, id=id)
\ No newline at end of file
+        return delete_transaction(self.session, id=id)
+
+    def list_with_participants(self, *, chat_id: int, limit: int = 20,
+                               before_id: Optional[int] = None) -> List[Transaction]:
+        return list_transactions_with_participants(self.session, chat_id=chat_id, limit=limit, before_id=before_id)
+
+    def delete_many(self, *, chat_id: int, ids: Sequence[int]) -> List[int]:
+        return delete_transactions(self.session, chat_id=chat_id, ids=ids)
+
+    def balances_by_chat(self, *, chat_id: int, after_id: Optional[int] = None,
+                         up_to_id: Optional[int] = None, ids: Optional[Sequence[int]] = None) -> Dict[int, int]:
+        return aggregate_balances(self.session, chat_id=chat_id, after_id=after_id, up_to_id=up_to_id, ids=ids)
+
+    def balances_by_transaction(self, *, chat_id: int, ids: Sequence[int]) -> Dict[int, Dict[int, int]]:
+        return aggregate_balances_by_transaction(self.session, chat_id=chat_id, ids=ids)
+
+    def max_id_by_chat(self, *, chat_id: int) -> Optional[int]:
+        return max_transaction_id(self.session, chat_id=chat_id)
+
+    def count_by_chat(self, *, chat_id: int, after_id: Optional[int] = None) -> int:
+        return count_transactions(self.session, chat_id=chat_id, after_id=after_id)
+
+    def iter_share_rows(self, *, chat_id: int, after_id: Optional[int] = None, batch_size: int = 1000) \
+            -> Iterator[Tuple[int, int, Optional[int], int]]:
+        return iter_share_rows(self.session, chat_id=chat_id, after_id=after_id, batch_size=batch_size)
+
+    def count_share_rows(self, *, chat_id: int, after_id: Optional[int] = None) -> int:
+        return count_share_rows(self.session, chat_id=chat_id, after_id=after_id)
+
+    def share_rows(self, *, chat_id: int, after_id: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        return share_rows(self.session, chat_id=chat_id, after_id=after_id)
+
+    def supports_binary_copy(self) -> bool:
+        dialect = self.session.get_bind().dialect
+        return dialect.name == "postgresql" and dialect.driver in ("psycopg2", "asyncpg")
+
+    def copy_share_rows_binary(self, *, chat_id: int, after_id: Optional[int] = None) -> bytes:
+        return copy_share_rows_binary(self.session, chat_id=chat_id, after_id=after_id)
+
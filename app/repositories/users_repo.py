@@ -1,18 +1,24 @@
 from __future__ import annotations
-from typing import Optional, List, Sequence
+from typing import Optional, List, Sequence, Iterable, Dict
 from sqlmodel import Session
 from repositories.base import UsersRepo, RepositoryError
 from models.users import User
+from cache.lru import LRUCache
+from cache.user_display import UserDisplay, user_display_cache, invalidate_user, is_pending
+from models.crud.unit_of_work import commit_or_flush
 from models.crud.crud_users import (
     create_user, get_user, list_users, update_user, delete_user, get_user_by_username, get_users_by_usernames,
+    get_users_by_ids, list_users_page,
 )
 
 
 class UsersRepoSqlModel(UsersRepo):
-    def __init__(self, session: Session) -> None:
+    def __init__(self, session: Session, cache: LRUCache = user_display_cache) -> None:
         self.session = session
+        self.cache = cache
 
     def create(self, *, id: int, username: Optional[str], first_name: Optional[str]) -> User:
+        invalidate_user(self.session, id, self.cache)
         return create_user(self.session, id=id, username=username, first_name=first_name)
 
     def get(self, id: int) -> Optional[User]:
@@ -21,10 +27,30 @@ class UsersRepoSqlModel(UsersRepo):
     def list(self, *, limit: int = 100, offset: int = 0) -> List[User]:
         return list_users(self.session, limit=limit, offset=offset)
 
+    def page(self, *, limit: int = 100, before_id: Optional[int] = None, after_id: Optional[int] = None,
+             newest_first: bool = False) -> List[User]:
+        return list_users_page(self.session, limit=limit, before_id=before_id, after_id=after_id,
+                               newest_first=newest_first)
+
     def update(self, *, id: int, username: Optional[str] = None, first_name: Optional[str] = None) -> Optional[User]:
+        invalidate_user(self.session, id, self.cache)
         return update_user(self.session, id=id, username=username, first_name=first_name)
 
+    def upsert(self, *, id: int, username: Optional[str], first_name: Optional[str]) -> User:
+        """Создать пользователя или обновить имя, если оно поменялось в Telegram."""
+        user = self.get(id)
+        if user is None:
+            return self.create(id=id, username=username, first_name=first_name)
+        if (user.username, user.first_name) != (username, first_name):
+            invalidate_user(self.session, id, self.cache)
+            user.username = username
+            user.first_name = first_name
+            self.session.add(user)
+            commit_or_flush(self.session, user)
+        return user
+
     def delete(self, *, id: int) -> bool:
+        invalidate_user(self.session, id, self.cache)
         return delete_user(self.session, id=id)
 
     def get_by_username(self, username: str) -> Optional[User]:
@@ -32,3 +58,30 @@ class UsersRepoSqlModel(UsersRepo):
 
     def get_many_by_usernames(self, usernames: Sequence[str]) -> List[User]:
         return get_users_by_usernames(self.session, usernames)
+
+    def get_many(self, ids: Iterable[int]) -> List[User]:
+        return get_users_by_ids(self.session, ids)
+
+    def get_display_many(self, ids: Iterable[int]) -> Dict[int, UserDisplay]:
+        """
+        Отображаемые данные пользователей: сначала из общего кэша процесса,
+        промахи — одним SELECT ... WHERE id IN (...). Отсутствующие в БД id не кэшируются.
+        """
+        found: Dict[int, UserDisplay] = {}
+        missing = []
+        for user_id in set(ids):
+            cached = self.cache.get(user_id)
+            if cached is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = cached
+        for user in get_users_by_ids(self.session, missing):
+            found[user.id] = self.cache_user(user)
+        return found
+
+    def cache_user(self, user: User) -> UserDisplay:
+        display = UserDisplay(user.id, user.username, user.first_name)
+        # Незакоммиченные изменения имени в кэш не кладём: их ещё может откатить rollback
+        if not is_pending(self.session, user.id, self.cache):
+            self.cache.set(user.id, display)
+        return display
@@ -0,0 +1,97 @@
+# services/async_services.py
+"""
+Сборка сервисов на сессию апдейта: синхронная (Session) и асинхронная (AsyncSession).
+
+Асинхронные сервисы — AsyncBridge над синхронными (см. repositories.async_repos): каждый вызов
+метода целиком выполняется в одном run_sync, поэтому внутренние unit_of_work, кэш балансов
+и чекпоинты работают так же, как в синхронном коде, а ожидание БД отдаёт управление event loop.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, NamedTuple, Optional
+
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from repositories import (
+    UsersRepoSqlModel,
+    ChatsRepoSqlModel,
+    TransactionsRepoSqlModel,
+    TransactionParticipantsRepoSqlModel,
+    DebtsRepoSqlModel,
+    BalanceCheckpointsRepoSqlModel,
+    AsyncBridge,
+    AsyncUsersRepo,
+    AsyncChatsRepo,
+    AsyncTransactionsRepo,
+)
+from services.transactions_service import TransactionsService
+from services.debts_service import DebtsService
+from services.checkpoints_service import CheckpointsService
+from services.worker_pool import WorkerPool, worker_pool
+
+
+class Services(NamedTuple):
+    users: UsersRepoSqlModel
+    chats: ChatsRepoSqlModel
+    txs: TransactionsRepoSqlModel
+    tx_service: TransactionsService
+    debts_service: DebtsService
+
+
+def build_services(session: Session, offload: Optional[Callable[..., Any]] = None) -> Services:
+    users = UsersRepoSqlModel(session)
+    chats = ChatsRepoSqlModel(session)
+    txs = TransactionsRepoSqlModel(session)
+    parts = TransactionParticipantsRepoSqlModel(session)
+    debts = DebtsRepoSqlModel(session)
+    checkpoints = CheckpointsService(BalanceCheckpointsRepoSqlModel(session), txs)
+
+    tx_service = TransactionsService(
+        session=session,
+        tx_repo=txs,
+        parts_repo=parts,
+        debts_repo=debts,
+        checkpoints=checkpoints,
+    )
+    debts_service = DebtsService(
+        session=session,
+        debts_repo=debts,
+        tx_repo=txs,
+        parts_repo=parts,
+        users_repo=users,
+        checkpoints=checkpoints,
+        offload=offload,
+    )
+    return Services(users, chats, txs, tx_service, debts_service)
+
+
+class AsyncTransactionsService(AsyncBridge[TransactionsService]):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session, lambda s: build_services(s).tx_service)
+
+
+class AsyncDebtsService(AsyncBridge[DebtsService]):
+    """Тяжёлые расчёты (план взаиморасчётов, свёртка балансов) уходят в pool."""
+
+    def __init__(self, session: AsyncSession, pool: Optional[WorkerPool] = None) -> None:
+        pool = pool or worker_pool
+        super().__init__(session, lambda s: build_services(s, offload=pool.call).debts_service)
+
+
+class AsyncServices(NamedTuple):
+    users: AsyncUsersRepo
+    chats: AsyncChatsRepo
+    txs: AsyncTransactionsRepo
+    tx_service: AsyncTransactionsService
+    debts_service: AsyncDebtsService
+
+
+def build_async_services(session: AsyncSession, pool: Optional[WorkerPool] = None) -> AsyncServices:
+    return AsyncServices(
+        users=AsyncUsersRepo(session),
+        chats=AsyncChatsRepo(session),
+        txs=AsyncTransactionsRepo(session),
+        tx_service=AsyncTransactionsService(session),
+        debts_service=AsyncDebtsService(session, pool),
+    )
@@ -0,0 +1,169 @@
+# services/autoregistration.py
+"""
+Авторегистрация участников чатов с отложенной пакетной записью (write-behind).
+
+Хендлер на каждое сообщение только кладёт пару (пользователь, чат) в буфер в памяти — без
+запросов к БД:
+
+    autoregistration.add(message.from_user, message.chat)
+
+Буфер — dict по (user_id, chat_id): повторные сообщения того же человека в том же чате до сброса
+схлопываются в одну запись (с последним профилем). Фоновая задача сбрасывает буфер раз в
+interval секунд или сразу, как только набралось batch_size пар: по одному
+INSERT ... ON CONFLICT на users, chats и chat_members (ChatMembersRepo.register_many).
+Пары, уже записанные с тем же профилем, в буфер больше не попадают (LRU known_size / known_ttl),
+поэтому в активной группе запись идёт только для новых людей и сменённых имён.
+
+Если запись не удалась, пачка возвращается в буфер и уйдёт при следующем сбросе. Буфер ограничен
+max_pending: сверх него новые пары отбрасываются (dropped в stats()) — их зарегистрирует следующее
+сообщение. stop() останавливает задачу и дописывает остаток.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cache.lru import LRUCache
+from database.config import get_settings
+from logger.logging import get_logger
+from models.chat_members import SeenMember
+from models.crud.unit_of_work import async_unit_of_work
+from repositories import AsyncChatMembersRepo
+
+logger = get_logger(logger_name=__name__)
+
+MemberKey = Tuple[int, int]
+
+
+def seen_member(tg_user, tg_chat) -> SeenMember:
+    """aiogram User + Chat -> SeenMember; у личного чата нет title — берём full_name."""
+    title = getattr(tg_chat, "title", None) or getattr(tg_chat, "full_name", None)
+    return SeenMember(tg_user.id, tg_user.username, tg_user.first_name, tg_chat.id, title)
+
+
+class AutoRegistration:
+    def __init__(self, *, interval: float = 5.0, batch_size: int = 500, max_pending: int = 10_000,
+                 known_size: int = 50_000, known_ttl: float = 3600.0) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._known = LRUCache(maxsize=known_size, ttl=known_ttl)
+        self._pending: Dict[MemberKey, SeenMember] = {}
+        self._session_maker: Optional[Callable[[], Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+        self.seen = 0
+        self.deduped = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, tg_user, tg_chat) -> None:
+        """Отметить, что tg_user писал в tg_chat. Только память: запись в БД — при сбросе."""
+        self.seen += 1
+        entry = seen_member(tg_user, tg_chat)
+        key = (entry.user_id, entry.chat_id)
+        if self._known.get(key) == entry:
+            self.skipped += 1
+            return
+        if key in self._pending:
+            self.deduped += 1
+        elif len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending[key] = entry
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Записать всё, что накопилось, одной транзакцией. Возвращает число записанных пар."""
+        if self._session_maker is None:
+            raise RuntimeError("AutoRegistration is not started")
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            entries = list(batch.values())
+            try:
+                async with self._session_maker() as session:
+                    async with async_unit_of_work(session):
+                        repo = AsyncChatMembersRepo(session)
+                        for start in range(0, len(entries), self.batch_size):
+                            await repo.register_many(entries[start:start + self.batch_size])
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except Exception:
+                self.failures += 1
+                self._requeue(batch)
+                logger.exception(f"Авторегистрация: не удалось записать {len(entries)} пар, повторю позже")
+                return 0
+            for key, entry in batch.items():
+                self._known.set(key, entry)
+            self.flushed += len(entries)
+            self.batches += 1
+            return len(entries)
+
+    def _requeue(self, batch: Dict[MemberKey, SeenMember]) -> None:
+        # Новые сообщения тех же людей, пришедшие во время записи, свежее — их не затираем
+        for key, entry in batch.items():
+            self._pending.setdefault(key, entry)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self, session_maker: Callable[[], Any]) -> asyncio.Task:
+        """Запустить фоновый сброс в текущем event loop; session_maker отдаёт AsyncSession."""
+        self._session_maker = session_maker
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="autoregistration")
+        return self._task
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и дописать остаток буфера."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._session_maker is not None:
+            await self.flush()
+        self._wakeup = None
+        logger.info(f"Авторегистрация остановлена: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "seen": self.seen,
+            "deduped": self.deduped,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+
+_settings = get_settings()
+autoregistration = AutoRegistration(
+    interval=_settings.AUTOREGISTER_FLUSH_INTERVAL,
+    batch_size=_settings.AUTOREGISTER_BATCH_SIZE,
+    max_pending=_settings.AUTOREGISTER_MAX_PENDING,
+    known_size=_settings.AUTOREGISTER_KNOWN_SIZE,
+    known_ttl=_settings.AUTOREGISTER_KNOWN_TTL,
+)
@@ -0,0 +1,200 @@
+# services/balance_cache.py
+"""
+Кэш балансов и планов взаиморасчётов по чатам.
+
+У каждого чата есть версия. Любая запись (TransactionsService, DebtsService) помечает чат
+грязным через mark_chat_dirty(session, chat_id): версия растёт сразу и ещё раз после commit
+сессии — так читатели не закэшируют незакоммиченное или уже устаревшее состояние.
+Ключ кэша — (chat_id, version, ...), поэтому старые записи просто перестают запрашиваться
+и уходят по LRU/TTL.
+Версии живут в процессе. О записях других реплик узнаём через Postgres NOTIFY: перед commit
+транзакция с грязными чатами шлёт pg_notify(NOTIFY_CHANNEL, chat_id) (доставляется только при commit),
+а BalanceCacheListener каждой реплики слушает канал и поднимает версии этих чатов у себя.
+Чтения кэша в БД не ходят; пока слушатель переподключается, устаревание ограничено TTL.
+Ключ плана взаиморасчётов DebtsService дополнительно страхует отпечатком debts (DebtsRepo.stamp) —
+пересчёт плана дороже одного запроса.
+Подписчики add_commit_listener(fn) узнают о закоммиченных записях: fn(session, chat_id)
+вызывается после commit (так services.rebuild_scheduler досчитывает чат, изменённый во время пересчёта).
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import event, make_url, text
+from sqlalchemy.orm import Session
+
+from cache.lru import LRUCache
+from database.config import get_settings
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+_DIRTY_KEY = "balance_cache_dirty_chats"
+# Канал Postgres LISTEN/NOTIFY: payload — id чата, запись по которому закоммитила какая-то реплика
+NOTIFY_CHANNEL = "balance_cache"
+
+
+class BalanceCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0) -> None:
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._versions: Dict[int, int] = {}
+        # Глобальный счётчик: версия чата никогда не повторяется в пределах процесса
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._commit_listeners: List[Callable[[Session, int], None]] = []
+
+    def add_commit_listener(self, listener: Callable[[Session, int], None]) -> None:
+        self._commit_listeners.append(listener)
+
+    def remove_commit_listener(self, listener: Callable[[Session, int], None]) -> None:
+        self._commit_listeners.remove(listener)
+
+    def committed(self, session: Session, chat_id: int) -> None:
+        """Запись по чату закоммичена: новая версия и уведомление подписчиков."""
+        self.bump(chat_id)
+        for listener in list(self._commit_listeners):
+            listener(session, chat_id)
+
+    def version(self, chat_id: int) -> int:
+        return self._versions.get(chat_id, 0)
+
+    def bump(self, chat_id: int) -> int:
+        with self._lock:
+            version = self._versions[chat_id] = next(self._counter)
+        return version
+
+    def get_or_compute(self, chat_id: int, kind: Hashable, compute: Callable[[], Any]) -> Any:
+        """Вернуть значение для текущей версии чата или посчитать и положить в кэш."""
+        key: Tuple[Hashable, ...] = (chat_id, self.version(chat_id), kind)
+        value = self.entries.get(key)
+        if value is None:
+            value = compute()
+            self.entries.set(key, value)
+        return value
+
+    @property
+    def hits(self) -> int:
+        return self.entries.hits
+
+    @property
+    def misses(self) -> int:
+        return self.entries.misses
+
+    def stats(self) -> Dict[str, float]:
+        return self.entries.stats()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._versions.clear()
+        self.entries.clear()
+
+
+_settings = get_settings()
+balance_cache = BalanceCache(maxsize=_settings.BALANCE_CACHE_SIZE, ttl=_settings.BALANCE_CACHE_TTL)
+
+
+def mark_chat_dirty(session: Session, chat_id: int, cache: BalanceCache = balance_cache) -> None:
+    """Записи по чату: сбросить версию сейчас и ещё раз после commit этой сессии."""
+    cache.bump(chat_id)
+    session.info.setdefault(_DIRTY_KEY, set()).add((cache, chat_id))
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_other_replicas(session: Session) -> None:
+    # NOTIFY транзакционный: при rollback уведомление не уйдёт
+    dirty = session.info.get(_DIRTY_KEY)
+    if not dirty or session.get_bind().dialect.name != "postgresql":
+        return
+    for chat_id in sorted({chat_id for _, chat_id in dirty}):
+        session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": NOTIFY_CHANNEL, "payload": str(chat_id)})
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    for cache, chat_id in session.info.pop(_DIRTY_KEY, ()):
+        cache.committed(session, chat_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_DIRTY_KEY, None)
+
+
+class BalanceCacheListener:
+    """
+    LISTEN на NOTIFY_CHANNEL в отдельном соединении asyncpg: записи других реплик поднимают
+    версии чатов в кэше этого процесса. Свои уведомления тоже приходят — лишний bump безвреден.
+    При обрыве соединения переподключается; пропущенные за это время уведомления не восстановить,
+    поэтому после переподключения кэш очищается целиком.
+    """
+
+    def __init__(self, cache: BalanceCache = balance_cache, channel: str = NOTIFY_CHANNEL,
+                 reconnect_delay: float = 1.0) -> None:
+        self.cache = cache
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._dsn: Optional[str] = None
+        self._conn: Any = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.reconnects = 0
+
+    async def start(self, url: str) -> None:
+        """url — адрес SQLAlchemy (postgresql+asyncpg://...) или обычный DSN Postgres."""
+        self._dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        await self._connect()
+
+    async def _connect(self) -> None:
+        import asyncpg  # только для Postgres; на SQLite слушатель не запускается
+
+        conn = await asyncpg.connect(self._dsn)
+        await conn.add_listener(self.channel, self._on_notify)
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+
+    def _on_notify(self, conn: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            chat_id = int(payload)
+        except ValueError:
+            logger.warning(f"Непонятное уведомление кэша балансов: {payload!r}")
+            return
+        self.received += 1
+        self.cache.bump(chat_id)
+
+    def _on_terminated(self, conn: Any) -> None:
+        if self._dsn is None:
+            return
+        logger.warning("Соединение LISTEN кэша балансов оборвалось, переподключаюсь")
+        self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while self._dsn is not None:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self._connect()
+            except Exception:
+                logger.exception("Не удалось переподключить LISTEN кэша балансов")
+                continue
+            self.reconnects += 1
+            self.cache.clear()
+            return
+
+    async def stop(self) -> None:
+        self._dsn = None
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        logger.info(f"Слушатель кэша балансов остановлен: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"received": self.received, "reconnects": self.reconnects}
+
+
+balance_cache_listener = BalanceCacheListener(balance_cache)
@@ -0,0 +1,64 @@
+# services/checkpoints_service.py
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+from repositories import BalanceCheckpointsRepo, TransactionsRepo
+from database.config import get_settings
+
+
+class CheckpointsService:
+    """
+    Чекпоинты балансов: снимок балансов чата на транзакции as_of_tx_id.
+    - DebtsService.rebuild берёт последний чекпоинт и досчитывает только транзакции после него;
+    - новый чекпоинт пишется автоматически, когда после последнего набралось `every` транзакций;
+    - изменение уже учтённой транзакции (удаление, правка участников) удаляет все чекпоинты,
+      которые её включают — rebuild откатывается на более ранний чекпоинт или на полную историю.
+    """
+
+    def __init__(
+        self,
+        checkpoints_repo: BalanceCheckpointsRepo,
+        tx_repo: TransactionsRepo,
+        every: Optional[int] = None,
+        keep: Optional[int] = None,
+    ) -> None:
+        self.checkpoints = checkpoints_repo
+        self.txs = tx_repo
+        settings = get_settings()
+        self.every = settings.BALANCE_CHECKPOINT_EVERY if every is None else every
+        self.keep = settings.BALANCE_CHECKPOINT_KEEP if keep is None else keep
+
+    def latest(self, chat_id: int) -> Tuple[Optional[int], Dict[int, int]]:
+        """(as_of_tx_id, балансы) последнего чекпоинта; (None, {}) — чекпоинтов нет."""
+        as_of = self.checkpoints.latest_id(chat_id=chat_id)
+        if as_of is None:
+            return None, {}
+        return as_of, self.checkpoints.get(chat_id=chat_id, as_of_tx_id=as_of)
+
+    def maybe_write(self, chat_id: int) -> Optional[int]:
+        """
+        Записать чекпоинт, если после последнего набралось не меньше `every` транзакций.
+        Балансы = последний чекпоинт + GROUP BY по транзакциям (as_of, max_id].
+        Вызывать под блокировкой чата (DebtsRepo.lock_chat): все записи истории берут её до вставки
+        строк, поэтому незакоммиченной транзакции с id меньше max_id здесь быть не может.
+        Возвращает as_of_tx_id нового чекпоинта или None.
+        """
+        if self.every <= 0:
+            return None
+        as_of, base = self.latest(chat_id)
+        if self.txs.count_by_chat(chat_id=chat_id, after_id=as_of) < self.every:
+            return None
+
+        up_to = self.txs.max_id_by_chat(chat_id=chat_id)
+        balances = dict(base)
+        for user_id, delta in self.txs.balances_by_chat(chat_id=chat_id, after_id=as_of, up_to_id=up_to).items():
+            balances[user_id] = balances.get(user_id, 0) + delta
+
+        self.checkpoints.write(chat_id=chat_id, as_of_tx_id=up_to, balances=balances)
+        if self.keep > 0:
+            self.checkpoints.prune(chat_id=chat_id, keep=self.keep)
+        return up_to
+
+    def invalidate_from(self, chat_id: int, tx_id: int) -> int:
+        """Транзакция tx_id изменилась: чекпоинты с as_of_tx_id >= tx_id больше не верны. Без commit."""
+        return self.checkpoints.delete_from(chat_id=chat_id, tx_id=tx_id)
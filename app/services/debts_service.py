@@ -1,18 +1,28 @@
 # services/debts_service.py
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from sqlmodel import Session
 from repositories import DebtsRepo, TransactionsRepo, TransactionParticipantsRepo, UsersRepo
 from models.debts import Debt
-from collections import deque
+from models.crud.unit_of_work import committing_unit_of_work
+from database.config import get_settings
+from services.settlement import solve_settlements
+from services.balance_cache import BalanceCache, balance_cache, mark_chat_dirty
+from services.balance_engine import BalanceEngine, fold_dict
+from services.checkpoints_service import CheckpointsService
+
+
+def _call(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return fn(*args, **kwargs)
 
 
 class DebtsService:
     """
     Всё, что связано с долгами:
     - полный пересчёт балансов по чату (на основе сырых транзакций и их участников),
-    - оптимизация взаиморасчётов (минимальный набор переводов).
+    - оптимизация взаиморасчётов (минимальный набор переводов, см. services.settlement).
     """
 
     def __init__(
@@ -22,12 +32,30 @@ class DebtsService:
         tx_repo: TransactionsRepo,
         parts_repo: TransactionParticipantsRepo,
         users_repo: UsersRepo,
+        balance_source: Optional[str] = None,
+        stream_batch_size: Optional[int] = None,
+        cache: Optional[BalanceCache] = None,
+        checkpoints: Optional[CheckpointsService] = None,
+        offload: Optional[Callable[..., Any]] = None,
     ) -> None:
         self.session = session
         self.debts = debts_repo
         self.txs = tx_repo
         self.parts = parts_repo
         self.users = users_repo
+        settings = get_settings()
+        self.balance_source = balance_source or settings.BALANCE_SOURCE
+        self.stream_batch_size = stream_batch_size or settings.STREAM_BATCH_SIZE
+        self.settle_mode = settings.SETTLE_MODE
+        self.settle_exact_max_members = settings.SETTLE_EXACT_MAX_MEMBERS
+        self.settle_time_budget_ms = settings.SETTLE_TIME_BUDGET_MS
+        self.cache = cache or balance_cache
+        # offload(fn, *args) — выполнить CPU-тяжёлую функцию вне event loop (WorkerPool.call); None — на месте
+        self.offload = offload
+        self.offload_min_members = settings.WORKER_MIN_MEMBERS
+        self.engine = BalanceEngine(numpy_min_rows=settings.BALANCE_NUMPY_MIN_ROWS, offload=offload,
+                                    offload_min_rows=settings.WORKER_MIN_ROWS)
+        self.checkpoints = checkpoints  # None — всегда считаем по всей истории
 
     # ---------- Пересчёт долгов ----------
 
@@ -35,125 +63,148 @@ class DebtsService:
         """
         Полный пересчёт таблицы `debts` для конкретного чата с нуля.
         Алгоритм:
-          1) Собираем все транзакции чата.
-          2) Для каждой смотрим её участников и их доли.
-          3) Считаем агрегированный баланс каждого пользователя (положит./отрицат.).
-          4) Перезаписываем таблицу debts для чата (upsert/обновление).
+          1) Считаем чистый баланс каждого пользователя (кредит создателя минус доли участников):
+             одним GROUP BY-запросом в БД или потоковым проходом по истории (см. compute_balances).
+             Если есть чекпоинт — берём его и досчитываем только транзакции после него.
+          2) Перезаписываем таблицу debts для чата одним INSERT ... ON CONFLICT.
+          3) Если с последнего чекпоинта набралось достаточно транзакций — пишем новый.
+        Блокировка чата (DebtsRepo.lock_chat) берётся до чтения истории: дельта другой реплики
+        не проскочит между расчётом и перезаписью. Всё — один commit в конце метода
+        (committing_unit_of_work), на нём блокировка и отпускается.
         """
-        # 1) Инициализируем агрегатор
-        balances: Dict[int, float] = {}
-
-        # 2) Проходим по транзакциям чата
-        tx_list = self.txs.list_by_chat(chat_id=chat_id, limit=10_000, offset=0)
-
-        for tx in tx_list:
-            # Создатель заплатил целиком -> ему должны на сумму долей
-            creator_id = tx.creator_id
-            if creator_id not in balances:
-                balances[creator_id] = 0.0
-
-            # Все участники этой транзакции
-            parts = self.parts.list_by_transaction(transaction_id=tx.id)
-            # Если участников нет — пропускаем
-            if not parts:
-                continue
-
-            # Каждый участник уменьшает свой баланс на свою долю,
-            # а баланс создателя увеличивается на эту долю
-            for p in parts:
-                balances[p.user_id] = balances.get(p.user_id, 0.0) - p.share_amount
-                balances[creator_id] = balances.get(creator_id, 0.0) + p.share_amount
-
-        # 3) Записываем агрегированные балансы в debts
-        #    Правило: запись на пользователя должна быть одна (актуальный баланс).
-        #    Если записи не было — создаём; если была — обновляем amount.
-        result: List[Debt] = []
-        for user_id, amount in balances.items():
-            existing = self.debts.get_by_chat_user(chat_id=chat_id, user_id=user_id)
-            if existing:
-                updated = self.debts.update(id=existing.id, amount=amount)
-                result.append(updated)
-            else:
-                created = self.debts.create(chat_id=chat_id, user_id=user_id, amount=amount)
-                result.append(created)
-
-        return result
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=chat_id)
+            balances = self.compute_balances(chat_id)
 
-    # ---------- Оптимизация взаиморасчётов ----------
+            # 2) Записываем агрегированные балансы в debts одним upsert'ом.
+            #    Правило: запись на пользователя одна (уникальный ключ chat_id, user_id);
+            #    строки пользователей, выпавших из истории, bulk_upsert удаляет.
+            mark_chat_dirty(self.session, chat_id, self.cache)
+            debts = self.debts.bulk_upsert(chat_id=chat_id, balances=balances)
 
-    def optimize_settlements(self, chat_id: int) -> List[Tuple[int, int, float]]:
+            if self.checkpoints:
+                self.checkpoints.maybe_write(chat_id)
+        return debts
+
+    def get_balances(self, chat_id: int, limit: int = 1000) -> List[Tuple[int, int]]:
         """
-        Возвращает минимальный набор переводов вида: (from_user_id, to_user_id, amount),
-        чтобы все балансы стали ~0 (с точностью до копеек).
-        Простой «жадный» алгоритм:
-          - делим людей на должников (amount < 0) и кредиторов (amount > 0),
-          - матчим самого «минусового» с самым «плюсовым» по очереди.
+        Текущие балансы чата [(user_id, amount), ...] для отображения.
+        Берутся из кэша, пока в чате ничего не менялось: попадание в кэш в БД не ходит.
+        Записи других реплик сбрасывают версию через NOTIFY (см. services.balance_cache).
         """
-        rows = self.debts.list_by_chat(chat_id=chat_id, limit=10_000, offset=0)
-
-        # Очереди «кто должен» и «кому должны»
-        debtors: deque[Tuple[int, float]] = deque()
-        creditors: deque[Tuple[int, float]] = deque()
-
-        for d in rows:
-            if d.amount < -1e-6:
-                debtors.append((d.user_id, -d.amount))  # храним положительную сумму долга
-            elif d.amount > 1e-6:
-                creditors.append((d.user_id, d.amount))
-
-        settlements: List[Tuple[int, int, float]] = []
-
-        while debtors and creditors:
-            debtor_id, need = debtors[0]
-            creditor_id, have = creditors[0]
-
-            pay = min(need, have)  # сколько «свести» в этой паре
-            settlements.append((debtor_id, creditor_id, round(pay, 2)))
-
-            # уменьшили остатки
-            need -= pay
-            have -= pay
+        rows = self.cache.get_or_compute(
+            chat_id,
+            ("balances", limit),
+            lambda: tuple((d.user_id, d.amount) for d in self.debts.list_by_chat(chat_id=chat_id, limit=limit)),
+        )
+        return list(rows)
+
+    def compute_balances(self, chat_id: int) -> Dict[int, int]:
+        """
+        Балансы чата по всей истории, без ограничения на количество транзакций.
+        balance_source="sql" — агрегация в БД, "stream" — keyset-поток строк с плоской памятью,
+        "engine" — свёртка в процессе (dict или numpy по размеру чата, см. services.balance_engine).
+        С чекпоинтами любой из источников читает только хвост истории после последнего чекпоинта.
+        """
+        as_of, balances = self.checkpoints.latest(chat_id) if self.checkpoints else (None, {})
 
-            debtors.popleft()
-            creditors.popleft()
+        if self.balance_source == "stream":
+            tail = self._balances_streamed(chat_id, after_id=as_of)
+        elif self.balance_source == "engine":
+            tail = self.engine.compute(self.txs, chat_id, after_id=as_of)
+        else:
+            tail = self.txs.balances_by_chat(chat_id=chat_id, after_id=as_of)
 
-            if need > 1e-6:
-                debtors.appendleft((debtor_id, need))
-            if have > 1e-6:
-                creditors.appendleft((creditor_id, have))
+        for user_id, delta in tail.items():
+            balances[user_id] = balances.get(user_id, 0) + delta
+        return balances
 
-        return settlements
+    def _balances_streamed(self, chat_id: int, after_id: Optional[int] = None) -> Dict[int, int]:
+        """
+        Проход по истории чата страницами (keyset по Transaction.id, серверный курсор).
+        В памяти держим только словарь балансов и текущую страницу строк.
+        """
+        rows = self.txs.iter_share_rows(chat_id=chat_id, after_id=after_id, batch_size=self.stream_batch_size)
+        return fold_dict((creator_id, user_id, share) for _, creator_id, user_id, share in rows)
 
-    # services/debts_service.py (добавь внутрь класса DebtsService)
+    # ---------- Оптимизация взаиморасчётов ----------
 
-    def settle_all_debts_via_transactions(self, chat_id: int) -> list[tuple[int, int, float]]:
+    def optimize_settlements(self, chat_id: int, mode: Optional[str] = None) -> List[Tuple[int, int, int]]:
+        """
+        Возвращает набор переводов вида: (from_user_id, to_user_id, amount в копейках),
+        чтобы все балансы стали ровно 0.
+        Поиск плана для групп от WORKER_MIN_MEMBERS человек уходит в пул воркеров (если он задан).
+        mode (см. services.settlement):
+          - "greedy" — самый крупный должник платит самому крупному кредитору (кучи, O(n log n));
+          - "exact"  — минимальное число переводов через разбиение на нулевые подмножества;
+          - "auto"   — exact для небольших групп, иначе greedy.
+        Точный поиск ограничен SETTLE_EXACT_MAX_MEMBERS и SETTLE_TIME_BUDGET_MS, при выходе — greedy.
+        План кэшируется по (chat_id, version, mode, отпечаток debts в БД): версия ловит записи этого процесса
+        и NOTIFY других реплик, а один дешёвый запрос отпечатка (DebtsRepo.stamp) страхует дорогой пересчёт
+        плана на случай, когда уведомление ещё не дошло или слушатель переподключается.
+        """
+        mode = mode or self.settle_mode
+
+        def compute() -> Tuple[Tuple[int, int, int], ...]:
+            balances = {
+                d.user_id: d.amount
+                for d in self.debts.iter_by_chat(chat_id=chat_id, batch_size=self.stream_batch_size)
+            }
+            return tuple(self._solve(balances, mode))
+
+        key = ("settlements", mode, self.debts.stamp(chat_id=chat_id))
+        return list(self.cache.get_or_compute(chat_id, key, compute))
+
+    def _solve(self, balances: Dict[int, int], mode: str) -> List[Tuple[int, int, int]]:
+        solve = self.offload if self.offload and len(balances) >= self.offload_min_members else _call
+        return list(solve(
+            solve_settlements,
+            balances,
+            mode=mode,
+            max_members=self.settle_exact_max_members,
+            time_budget=self.settle_time_budget_ms / 1000,
+        ))
+
+    def settle_all_debts_via_transactions(self, chat_id: int, batch_id: Optional[str] = None) \
+            -> list[tuple[int, int, int]]:
         """
-        Костыльно, но просто: берём план из optimize_settlements(),
-        и для каждой пары создаём транзакцию вида:
-          - creator_id = должник (from_user)
-          - единственный участник = кредитор (to_user) с share_amount = amount
-        Затем запускаем rebuild(chat_id).
-
-        Возвращает сам план [(debtor_id, creditor_id, amount), ...].
-        ВАЖНО: метод НЕ идемпотентный — повторный запуск создаст ещё такие же транзакции.
+        Гасим все долги чата транзакциями по плану взаиморасчётов (см. optimize_settlements):
+          - creator_id = должник (from_user),
+          - единственный участник = кредитор (to_user) с share_amount = amount.
+        Всё пишется одной единицей работы и одним commit в конце метода (committing_unit_of_work —
+        блокировка чата отпускается до ответа бота):
+          1) транзакции погашения — один INSERT ... RETURNING id, участники — один INSERT;
+          2) балансы сдвигаются на дельты плана напрямую (после погашения они нулевые),
+             без пересчёта истории.
+        Идемпотентно по batch_id: если транзакции с таким settlement_batch_id уже есть,
+        ничего не пишем и возвращаем уже записанный план. По умолчанию batch_id — новый uuid.
+
+        Под блокировкой чата: план считается и применяется к одним и тем же балансам, а повтор
+        того же batch_id на другой реплике дождётся первого и вернёт записанный план.
+        План считается по debts, прочитанным из БД уже под блокировкой, мимо кэша балансов.
+
+        Возвращает план [(debtor_id, creditor_id, amount), ...].
         """
-        plan = self.optimize_settlements(chat_id)
-
-        for debtor_id, creditor_id, amount in plan:
-            # создаём "платёжную" транзакцию
-            tx = self.txs.create(
-                chat_id=chat_id,
-                creator_id=debtor_id,
-                amount=amount,
-                title="Погашение долга",
-            )
-            self.parts.create(
-                transaction_id=tx.id,
-                user_id=creditor_id,
-                share_amount=amount,
-                tag="погашение",
-            )
-
-        # пересчитываем балансы с учётом этих транзакций
-        self.rebuild(chat_id)
+        batch_id = batch_id or uuid.uuid4().hex
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=chat_id)
+            done = self.txs.list_settlement_transfers(chat_id=chat_id, batch_id=batch_id)
+            if done:
+                return done
+
+            plan = self._solve(self.debts.amounts_by_chat(chat_id=chat_id), self.settle_mode)
+            if not plan:
+                return plan
+
+            deltas: Dict[int, int] = {}
+            for debtor_id, creditor_id, amount in plan:
+                deltas[debtor_id] = deltas.get(debtor_id, 0) + amount
+                deltas[creditor_id] = deltas.get(creditor_id, 0) - amount
+
+            mark_chat_dirty(self.session, chat_id, self.cache)
+            self.txs.bulk_create_settlement(chat_id=chat_id, batch_id=batch_id, transfers=plan)
+            self.debts.apply_deltas(chat_id=chat_id, deltas=deltas)
+
+            if self.checkpoints:
+                self.checkpoints.maybe_write(chat_id)
         return plan
@@ -0,0 +1,59 @@
+# services/money.py
+"""
+Деньги храним целыми числами в минимальных единицах (копейках): BIGINT в БД, int в коде.
+Так суммы и балансы считаются точно, без эпсилонов и round(..., 2).
+"""
+from __future__ import annotations
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import List, Sequence
+
+MINOR_UNITS = 100
+
+
+def parse_amount(text: str) -> int:
+    """
+    "120.5" / "120,50" / "120" -> 12050. Лишние знаки после копеек округляются half-up.
+    Бросает ValueError, если это не число.
+    """
+    try:
+        value = Decimal(text.strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Not a money amount: {text!r}")
+    if not value.is_finite():
+        raise ValueError(f"Not a money amount: {text!r}")
+    return int((value * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_amount(minor: int) -> str:
+    """12050 -> "120.50", -5 -> "-0.05"."""
+    sign = "-" if minor < 0 else ""
+    units, cents = divmod(abs(int(minor)), MINOR_UNITS)
+    return f"{sign}{units}.{cents:02d}"
+
+
+def allocate(total: int, weights: Sequence[int]) -> List[int]:
+    """
+    Делит total на доли пропорционально weights методом наибольших остатков.
+    Сумма долей всегда ровно total; остаток раздаётся по одной копейке тем, у кого
+    дробная часть квоты больше (при равенстве — по порядку).
+    allocate(1000, [1, 1, 1]) -> [334, 333, 333]
+    """
+    if not weights:
+        return []
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("Weights must sum to a positive number")
+
+    quotas = [divmod(total * w, weight_sum) for w in weights]
+    shares = [q for q, _ in quotas]
+    left = total - sum(shares)
+    by_remainder = sorted(range(len(weights)), key=lambda i: -quotas[i][1])
+    for i in by_remainder[:left]:
+        shares[i] += 1
+    return shares
+
+
+def split_evenly(total: int, n: int) -> List[int]:
+    """Поровну на n человек с точным остатком: split_evenly(1000, 3) -> [334, 333, 333]."""
+    return allocate(total, [1] * n)
@@ -0,0 +1,166 @@
+# services/rebuild_scheduler.py
+"""
+Фоновый полный пересчёт балансов (DebtsService.rebuild) с очередью по чатам.
+
+/rebuild не считает в хендлере: rebuild_scheduler.request(chat_id) помечает чат грязным и
+сразу возвращается. На каждый грязный чат работает одна asyncio-задача: она снимает пометку и
+делает один rebuild в своей сессии; если за это время чат снова пометили — ещё один, и так
+до чистого состояния. Поэтому пересчёты одного чата никогда не идут параллельно, а N запросов,
+пришедших до начала пересчёта, сливаются в один.
+
+/addtx и /del пересчёт не запускают — они пишут дельты в debts. Но дельта, закоммиченная, пока
+rebuild читал историю, перезаписалась бы его результатом. Поэтому планировщик подписан на
+коммиты записей (BalanceCache.add_commit_listener): запись в чат с идущим пересчётом
+ставит ещё один проход, который увидит её в истории.
+
+Читатели балансов (/balance, /optimize, /settle_all) ждут через wait(chat_id) только если их чат
+грязный, не дольше REBUILD_WAIT_TIMEOUT.
+
+Если пул воркеров занят, проход откладывается (deferred) и повторяется с паузой retry_delay, 2×, 4×...
+После max_retries отложенных проходов подряд пересчёт снимается (abandoned): чат снова чистый,
+и читатели не ждут пул, который не освобождается. Балансы остаются прежними — /rebuild можно повторить.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlmodel import Session
+
+from database.config import get_settings
+from logger.logging import get_logger
+from models.crud.unit_of_work import async_unit_of_work
+from services.async_services import AsyncDebtsService
+from services.balance_cache import BalanceCache, balance_cache
+from services.worker_pool import WorkerPool, WorkerPoolBusy
+
+logger = get_logger(logger_name=__name__)
+
+# Метка сессии самого планировщика: его rebuild не должен ставить следующий rebuild
+_OWN_SESSION_KEY = "rebuild_scheduler_session"
+
+
+class RebuildScheduler:
+    def __init__(self, *, wait_timeout: float = 10.0, retry_delay: float = 1.0, max_retries: int = 3,
+                 cache: BalanceCache = balance_cache) -> None:
+        self.wait_timeout = wait_timeout
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.cache = cache
+        self._session_maker: Optional[Callable[[], Any]] = None
+        self._pool: Optional[WorkerPool] = None
+        self._dirty: Set[int] = set()
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.requested = 0
+        self.coalesced = 0
+        self.runs = 0
+        self.failures = 0
+        self.deferred = 0
+        self.abandoned = 0
+
+    def start(self, session_maker: Callable[[], Any], pool: Optional[WorkerPool] = None) -> None:
+        """Пересчёты пойдут в сессиях session_maker (AsyncSession), тяжёлая свёртка — в pool."""
+        self._session_maker = session_maker
+        self._pool = pool
+        self.cache.add_commit_listener(self._on_commit)
+
+    def is_dirty(self, chat_id: int) -> bool:
+        """Есть запрошенный или идущий пересчёт чата."""
+        return chat_id in self._workers
+
+    def request(self, chat_id: int) -> bool:
+        """
+        Поставить пересчёт чата. Возвращает False, если запрос слился с уже ждущим
+        (пересчёт ещё не начался и учтёт всё, что закоммичено к его старту).
+        """
+        if self._session_maker is None:
+            raise RuntimeError("RebuildScheduler is not started")
+        self.requested += 1
+        if chat_id in self._dirty:
+            self.coalesced += 1
+            return False
+        self._dirty.add(chat_id)
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id), name=f"rebuild:{chat_id}")
+        return True
+
+    async def wait(self, chat_id: int, timeout: Optional[float] = None) -> bool:
+        """Дождаться чистого состояния чата. False — не дождались за timeout (по умолчанию wait_timeout)."""
+        task = self._workers.get(chat_id)
+        if task is None:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=self.wait_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _drain(self, chat_id: int) -> None:
+        retries = 0
+        try:
+            while chat_id in self._dirty:
+                self._dirty.discard(chat_id)
+                if await self._rebuild(chat_id):
+                    retries = 0
+                    continue
+                self.deferred += 1
+                if retries >= self.max_retries:
+                    self.abandoned += 1
+                    logger.warning(f"Пересчёт чата {chat_id} снят: пул воркеров занят {retries + 1} раз подряд")
+                    break
+                self._dirty.add(chat_id)
+                await asyncio.sleep(self.retry_delay * 2 ** retries)
+                retries += 1
+        finally:
+            # Пометка, оставшаяся после снятого пересчёта, заблокировала бы следующий request()
+            self._dirty.discard(chat_id)
+            self._workers.pop(chat_id, None)
+
+    async def _rebuild(self, chat_id: int) -> bool:
+        """Один пересчёт в своей транзакции. False — пул воркеров занят, нужно повторить."""
+        self.runs += 1
+        try:
+            async with self._session_maker() as session:
+                session.sync_session.info[_OWN_SESSION_KEY] = True
+                async with async_unit_of_work(session):
+                    await AsyncDebtsService(session, self._pool).rebuild(chat_id=chat_id)
+        except WorkerPoolBusy:
+            logger.info(f"Пересчёт чата {chat_id} отложен: пул воркеров занят")
+            return False
+        except Exception:
+            self.failures += 1
+            logger.exception(f"Пересчёт балансов чата {chat_id} не удался")
+        return True
+
+    def _on_commit(self, session: Session, chat_id: int) -> None:
+        # Коммиты AsyncSession приходят в потоке event loop, поэтому множества меняем без блокировок
+        if session.info.get(_OWN_SESSION_KEY):
+            return
+        if chat_id in self._workers and chat_id not in self._dirty:
+            self._dirty.add(chat_id)
+
+    async def stop(self) -> None:
+        """Дождаться идущих пересчётов и отписаться от коммитов."""
+        if self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        if self._session_maker is not None:
+            self.cache.remove_commit_listener(self._on_commit)
+        self._session_maker = None
+        logger.info(f"Планировщик пересчётов остановлен: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": len(self._workers),
+            "requested": self.requested,
+            "coalesced": self.coalesced,
+            "runs": self.runs,
+            "failures": self.failures,
+            "deferred": self.deferred,
+            "abandoned": self.abandoned,
+        }
+
+
+_settings = get_settings()
+rebuild_scheduler = RebuildScheduler(wait_timeout=_settings.REBUILD_WAIT_TIMEOUT,
+                                     retry_delay=_settings.REBUILD_RETRY_DELAY,
+                                     max_retries=_settings.REBUILD_MAX_RETRIES)
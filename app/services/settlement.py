@@ -0,0 +1,176 @@
+# services/settlement.py
+"""
+Алгоритмы взаиморасчётов: по балансам чата строим список переводов (from_user_id, to_user_id, amount).
+Все суммы — целые копейки (см. services.money), поэтому нулевые подмножества ищутся точно.
+
+- greedy: «самый большой должник платит самому большому кредитору» на двух кучах, O(n log n);
+- exact: минимальное число переводов. Балансы разбиваются на максимальное число
+  непересекающихся подмножеств с нулевой суммой (bitmask DP), каждое подмножество из k человек
+  гасится k-1 переводом. Экспоненциально по числу участников, поэтому ограничено
+  max_members и бюджетом времени — при выходе за них откатываемся на greedy.
+"""
+from __future__ import annotations
+
+import heapq
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+Settlement = Tuple[int, int, int]
+
+MODES = ("auto", "exact", "greedy")
+
+# Потолок для DP даже в режиме exact: таблицы на 2^n элементов дальше не помещаются в память
+EXACT_HARD_LIMIT = 22
+
+
+class SettlementBudgetExceeded(RuntimeError):
+    """Точный поиск не уложился в бюджет времени или по размеру группы."""
+    pass
+
+
+def _nonzero(balances: Dict[int, int]) -> List[Tuple[int, int]]:
+    return [(uid, amount) for uid, amount in balances.items() if amount != 0]
+
+
+def _greedy(items: Sequence[Tuple[int, int]]) -> List[Settlement]:
+    """Жадное сведение на кучах: каждый шаг обнуляет хотя бы одну из сторон."""
+    debtors = [(amount, uid) for uid, amount in items if amount < 0]       # min-heap по отрицательной сумме
+    creditors = [(-amount, uid) for uid, amount in items if amount > 0]    # max-heap через минус
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers: List[Settlement] = []
+    while debtors and creditors:
+        need, debtor_id = heapq.heappop(debtors)
+        have, creditor_id = heapq.heappop(creditors)
+        pay = min(-need, -have)
+        transfers.append((debtor_id, creditor_id, pay))
+        if -need > pay:
+            heapq.heappush(debtors, (need + pay, debtor_id))
+        if -have > pay:
+            heapq.heappush(creditors, (have + pay, creditor_id))
+    return transfers
+
+
+def _zero_sum_groups(values: Sequence[int], deadline: float) -> List[List[int]]:
+    """
+    Максимальное разбиение индексов `values` на группы с нулевой суммой.
+    dp[mask] — сколько нулевых групп можно выделить из mask, если снимать элементы по одному:
+    dp[mask] = max(dp[mask без i]) + (sum[mask] == 0).
+    """
+    n = len(values)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    dp = [0] * (full + 1)
+
+    for mask in range(1, full + 1):
+        if not mask & 0x3FF and time.perf_counter() > deadline:
+            raise SettlementBudgetExceeded(f"exact search over {n} members ran out of time")
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + values[low.bit_length() - 1]
+        best = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if dp[mask ^ bit] > best:
+                best = dp[mask ^ bit]
+            rest ^= bit
+        dp[mask] = best + (sums[mask] == 0)
+
+    # Восстанавливаем цепочку снятий: между соседними «нулевыми» масками лежит одна группа
+    groups: List[List[int]] = []
+    mask, current = full, []
+    while mask:
+        target = dp[mask] - (sums[mask] == 0)
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if dp[mask ^ bit] == target:
+                break
+            rest ^= bit
+        current.append(bit.bit_length() - 1)
+        mask ^= bit
+        if sums[mask] == 0:
+            groups.append(current)
+            current = []
+    return groups
+
+
+def _exact(items: Sequence[Tuple[int, int]], *, max_members: int, deadline: float) -> List[Settlement]:
+    if sum(amount for _, amount in items):
+        # Балансы разъехались (сумма не ноль) — нулевого разбиения не существует
+        raise SettlementBudgetExceeded("balances do not sum to zero")
+
+    # Пары с противоположными суммами — уже оптимальные группы из двух человек, снимаем их заранее
+    by_amount: Dict[int, List[int]] = {}
+    for idx, (_, amount) in enumerate(items):
+        by_amount.setdefault(amount, []).append(idx)
+    paired: List[List[int]] = []
+    used = set()
+    for idx, (_, amount) in enumerate(items):
+        if idx in used or amount <= 0:
+            continue
+        opposite = [j for j in by_amount.get(-amount, []) if j not in used]
+        if opposite:
+            used.update((idx, opposite[0]))
+            paired.append([idx, opposite[0]])
+
+    rest = [idx for idx in range(len(items)) if idx not in used]
+    if len(rest) > min(max_members, EXACT_HARD_LIMIT):
+        raise SettlementBudgetExceeded(f"{len(rest)} members exceed exact limit {max_members}")
+
+    groups = paired + [[rest[i] for i in group] for group in _zero_sum_groups([items[i][1] for i in rest], deadline)]
+
+    transfers: List[Settlement] = []
+    for group in groups:
+        transfers.extend(_greedy([items[i] for i in group]))
+    return transfers
+
+
+def greedy_settlements(balances: Dict[int, int]) -> List[Settlement]:
+    """Жадный план: не оптимален по числу переводов, зато O(n log n) на любом размере чата."""
+    return _greedy(_nonzero(balances))
+
+
+def exact_settlements(
+    balances: Dict[int, int],
+    *,
+    max_members: int = 18,
+    time_budget: float = 0.5,
+) -> List[Settlement]:
+    """
+    План с минимальным числом переводов.
+    Бросает SettlementBudgetExceeded, если группа больше max_members или не уложились в time_budget (сек).
+    """
+    deadline = time.perf_counter() + time_budget
+    return _exact(_nonzero(balances), max_members=max_members, deadline=deadline)
+
+
+def solve_settlements(
+    balances: Dict[int, int],
+    *,
+    mode: str = "auto",
+    max_members: int = 18,
+    time_budget: float = 0.5,
+) -> List[Settlement]:
+    """
+    mode="greedy" — только жадный план;
+    mode="auto"   — точный поиск для групп до max_members, иначе жадный;
+    mode="exact"  — точный поиск до EXACT_HARD_LIMIT участников, ограничен только бюджетом времени.
+    При выходе за лимиты откатываемся на жадный план.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown settlement mode: {mode}")
+    if mode == "greedy":
+        return greedy_settlements(balances)
+    if mode == "exact":
+        max_members = EXACT_HARD_LIMIT
+    try:
+        return exact_settlements(balances, max_members=max_members, time_budget=time_budget)
+    except SettlementBudgetExceeded as e:
+        logger.info(f"Точный взаиморасчёт недоступен ({e}), использую жадный")
+        return greedy_settlements(balances)
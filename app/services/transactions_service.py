@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Iterable, Optional, Sequence, Tuple
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 from sqlmodel import Session
 from repositories import (
     TransactionsRepo,
@@ -9,6 +9,10 @@ from repositories import (
 )
 from models.transactions import Transaction
 from models.transaction_participants import TransactionParticipant
+from services.balance_cache import BalanceCache, balance_cache, mark_chat_dirty
+from services.money import split_evenly
+from services.checkpoints_service import CheckpointsService
+from models.crud.unit_of_work import commit_or_flush, committing_unit_of_work
 from datetime import datetime
 
 
@@ -24,31 +28,38 @@ class TransactionsService:
         tx_repo: TransactionsRepo,
         parts_repo: TransactionParticipantsRepo,
         debts_repo: DebtsRepo,
+        cache: Optional[BalanceCache] = None,
+        checkpoints: Optional[CheckpointsService] = None,
     ) -> None:
         self.session = session
         self.txs = tx_repo
         self.parts = parts_repo
-        self.debts = debts_repo  # пригодится если нужно триггерить пересчёт
+        self.debts = debts_repo  # балансы поддерживаем инкрементально (см. _apply_deltas)
+        self.cache = cache or balance_cache
+        self.checkpoints = checkpoints
 
     def create_transaction(
         self,
         *,
         chat_id: int,
         creator_id: int,
-        amount: float,
+        amount: int,
         title: Optional[str],
     ) -> Transaction:
         """
         Создаём транзакцию и её участников одной «операцией».
         participants: список кортежей (user_id, share_amount, tag)
         """
-        tx = self.txs.create(
-            chat_id=chat_id,
-            creator_id=creator_id,
-            amount=amount,
-            title=title,
-        )
-
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=chat_id)
+            mark_chat_dirty(self.session, chat_id, self.cache)
+            tx = self.txs.create(
+                chat_id=chat_id,
+                creator_id=creator_id,
+                amount=amount,
+                title=title,
+            )
+            self._maybe_checkpoint(chat_id)
         return tx
 
     def create_transaction_with_participants(
@@ -56,33 +67,37 @@ class TransactionsService:
         *,
         chat_id: int,
         creator_id: int,
-        amount: float,
+        amount: int,
         title: Optional[str],
-        participants: Sequence[Tuple[int, float, Optional[str]]],
+        participants: Sequence[Tuple[int, Optional[int], Optional[str]]],
     ) -> tuple[Transaction, list[TransactionParticipant]]:
         """
         Создаём транзакцию и её участников одной «операцией».
-        participants: список кортежей (user_id, share_amount, tag)
+        participants: список кортежей (user_id, share_amount, tag), суммы в копейках.
+        Если доли заданы и в сумме дают amount — берём их как есть,
+        иначе делим amount поровну методом наибольших остатков (сумма долей == amount).
+        Число запросов не зависит от числа участников: заголовок, строки и дельты балансов —
+        по одному INSERT, и один commit на всё — сразу, даже внутри внешнего unit_of_work, чтобы
+        блокировка чата не ждала ответа бота (см. committing_unit_of_work).
+        Блокировка чата — до вставки строк (см. _apply_deltas).
         """
-        tx = self.txs.create(
-            chat_id=chat_id,
-            creator_id=creator_id,
-            amount=amount,
-            title=title,
-        )
-
-        created_parts: list[TransactionParticipant] = []
-        for user_id, _, _ in participants:
-            part = self.parts.create(
-                transaction_id=tx.id,
-                user_id=user_id,
-                share_amount=amount/(len(participants)),
-                tag=title or "без указания типа транзакции",
-            )
-            created_parts.append(part)
+        shares = [share for _, share, _ in participants]
+        if None in shares or sum(shares) != amount:
+            shares = split_evenly(amount, len(participants))
+        tag = title or "без указания типа транзакции"
 
-        # (опционально) сразу можно пересчитать долги по чату
-        # но чаще это делает DebtsService.rebuild(chat_id)
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=chat_id)
+            tx, created_parts = self.txs.create_with_participants(
+                chat_id=chat_id,
+                creator_id=creator_id,
+                amount=amount,
+                title=title,
+                participants=[(user_id, share, tag) for (user_id, _, _), share in zip(participants, shares)],
+            )
+            # Балансы меняются только у создателя и участников — O(участников), без пересчёта истории
+            self._apply_deltas(chat_id, self._transaction_deltas(creator_id, created_parts, sign=1))
+            self._maybe_checkpoint(chat_id)
         return tx, created_parts
 
     def add_participant(
@@ -90,7 +105,7 @@ class TransactionsService:
         *,
         transaction_id: int,
         user_id: int,
-        share_amount: float,
+        share_amount: int,
         tag: Optional[str] = None,
     ) -> TransactionParticipant:
         """
@@ -101,30 +116,116 @@ class TransactionsService:
         if not tx:
             raise ValueError(f"Transaction {transaction_id} not found")
 
-        return self.parts.create(
-            transaction_id=transaction_id,
-            user_id=user_id,
-            share_amount=share_amount,
-            tag=tag or "без указания типа транзакции",
-        )
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=tx.chat_id)
+            self._invalidate_checkpoints(tx.chat_id, tx.id)
+            part = self.parts.create(
+                transaction_id=transaction_id,
+                user_id=user_id,
+                share_amount=share_amount,
+                tag=tag or "без указания типа транзакции",
+            )
+            self._apply_deltas(tx.chat_id, self._transaction_deltas(tx.creator_id, [part], sign=1))
+        return part
 
     def remove_participant(self, *, participant_id: int) -> bool:
         """
         Удаляем участника транзакции.
         """
-        return self.parts.delete(id=participant_id)
+        part = self.parts.get(participant_id)
+        if not part:
+            return False
+        tx = self.txs.get(part.transaction_id)
+        if not tx:
+            return self.parts.delete(id=participant_id)
+
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=tx.chat_id)
+            deltas = self._transaction_deltas(tx.creator_id, [part], sign=-1)
+            self._invalidate_checkpoints(tx.chat_id, tx.id)
+            ok = self.parts.delete(id=participant_id)
+            if ok:
+                self._apply_deltas(tx.chat_id, deltas)
+        return ok
 
     def delete_transaction(self, *, transaction_id: int) -> bool:
+        """Удаляем одну транзакцию (см. delete_transactions)."""
+        tx = self.txs.get(transaction_id)
+        if not tx:
+            return False
+        return bool(self.delete_transactions(chat_id=tx.chat_id, transaction_ids=[transaction_id]))
+
+    def delete_transactions(self, *, chat_id: int, transaction_ids: Sequence[int]) -> list[int]:
+        """
+        Удаляем набор транзакций чата как множество, без загрузки строк:
+        1) вклад каждой из удаляемых транзакций в балансы — один GROUP BY по (транзакция, пользователь);
+        2) один DELETE ... WHERE id = ANY(:ids) RETURNING id, участников убирает ON DELETE CASCADE;
+        3) откатываем балансы одним upsert'ом — только вклад реально удалённых транзакций.
+        Блокировка чата берётся до первого чтения: параллельный /del с пересекающимися id ждёт
+        и не откатит ту же транзакцию второй раз, а порядок «блокировка → чекпоинты» тот же,
+        что у записи чекпоинтов (нет взаимной блокировки).
+        Чекпоинты, которые уже учитывают самую раннюю из реально удалённых транзакций, удаляются
+        в той же единице работы; чужие и несуществующие id на них не влияют.
+        Возвращает id удалённых транзакций; чужие и несуществующие id пропускаются.
         """
-        Удаляем транзакцию безопасно:
-        1) сначала удаляем участников (жёстко),
-        2) потом удаляем транзакцию.
-        Это избегает NOT NULL конфликтов по FK.
+        ids = sorted(set(transaction_ids))
+        if not ids:
+            return []
+
+        with committing_unit_of_work(self.session):
+            self.debts.lock_chat(chat_id=chat_id)
+            contributions = self.txs.balances_by_transaction(chat_id=chat_id, ids=ids)
+            deleted = self.txs.delete_many(chat_id=chat_id, ids=ids)
+            if deleted:
+                self._invalidate_checkpoints(chat_id, min(deleted))
+                deltas: Dict[int, int] = {}
+                for tx_id in deleted:
+                    for user_id, amount in contributions.get(tx_id, {}).items():
+                        deltas[user_id] = deltas.get(user_id, 0) - amount
+                self._apply_deltas(chat_id, deltas)
+        return deleted
+
+    # ---------- Инкрементальные балансы ----------
+
+    @staticmethod
+    def _transaction_deltas(
+        creator_id: int,
+        parts: Iterable[TransactionParticipant],
+        *,
+        sign: int,
+    ) -> Dict[int, int]:
         """
-        # Удаление участников
-        all_parts = self.parts.list_by_transaction(transaction_id=transaction_id)
-        for p in all_parts:
-            self.parts.delete(id=p.id)
+        Вклад транзакции в балансы: создатель +доля за каждого участника, участник −доля.
+        sign=1 — транзакция добавляется, sign=-1 — откатывается.
+        Создатель попадает в результат даже без участников (как и в DebtsService.rebuild).
+        """
+        deltas: Dict[int, int] = {creator_id: 0}
+        for p in parts:
+            deltas[creator_id] += sign * p.share_amount
+            deltas[p.user_id] = deltas.get(p.user_id, 0) - sign * p.share_amount
+        return deltas
+
+    def _apply_deltas(self, chat_id: int, deltas: Dict[int, int]) -> None:
+        """
+        Применяем дельты к `debts` одним flush'ем вместе с изменениями транзакции; commit делает
+        committing_unit_of_work вызывающего метода.
+        Полный пересчёт (DebtsService.rebuild) остаётся как явная операция починки.
+        Версия чата в кэше балансов сбрасывается сейчас и после commit.
+        Блокировку чата вызывающий берёт в начале единицы работы, до вставки строк истории: иначе
+        другая реплика может закоммитить транзакцию с большим id и записать чекпоинт, в который
+        наша (меньший id, ещё не закоммичена) не попадёт, — rebuild от такого чекпоинта её потеряет.
+        """
+        mark_chat_dirty(self.session, chat_id, self.cache)
+        self.debts.apply_deltas(chat_id=chat_id, deltas=deltas)
+        commit_or_flush(self.session)
+
+    # ---------- Чекпоинты балансов ----------
+
+    def _maybe_checkpoint(self, chat_id: int) -> None:
+        if self.checkpoints:
+            self.checkpoints.maybe_write(chat_id)
 
-        # Удаление самой транзакции
-        return self.txs.delete(id=transaction_id)
+    def _invalidate_checkpoints(self, chat_id: int, tx_id: int) -> None:
+        """Без commit: удаление уходит в БД вместе с первым изменением истории."""
+        if self.checkpoints:
+            self.checkpoints.invalidate_from(chat_id, tx_id)
@@ -0,0 +1,149 @@
+# services/worker_pool.py
+"""
+Пул воркеров для CPU-тяжёлой работы, чтобы она не стояла в event loop бота.
+
+Данные из БД загружаются как обычно (AsyncSession), а чистые вычисления над ними — поиск
+плана взаиморасчётов, свёртка истории в балансы — отправляются в пул:
+
+    plan = await worker_pool.submit(solve_settlements, balances, mode="exact")
+
+Синхронный код сервисов работает внутри AsyncSession.run_sync (в greenlet), поэтому для него есть
+worker_pool.call(fn, ...): тот же submit, но ожидание через await_only — greenlet засыпает,
+event loop обслуживает другие апдейты.
+
+Пул ограничен: не больше size задач выполняются и не больше queue ждут. Лишняя задача сразу
+получает WorkerPoolBusy, хендлер отвечает «занят, повтори позже» (backpressure вместо очереди
+без дна). stats() отдаёт время ожидания в очереди отдельно от времени работы.
+
+kind="thread" — ThreadPoolExecutor (numpy отпускает GIL, чистый Python делит его с event loop);
+kind="process" — ProcessPoolExecutor: функции и аргументы должны сериализоваться pickle;
+kind="off" — без пула, всё считается на месте.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.util import await_only
+
+from database.config import get_settings
+from logger.logging import get_logger
+
+logger = get_logger(logger_name=__name__)
+
+KINDS = ("thread", "process", "off")
+
+
+class WorkerPoolBusy(RuntimeError):
+    """Очередь пула заполнена — задачу не приняли."""
+    pass
+
+
+def _timed(fn: Callable[..., Any], args: tuple, kwargs: dict) -> Tuple[float, float, Any]:
+    # Выполняется в воркере (в том числе в другом процессе): время старта — по настенным часам,
+    # чтобы сравнить его с моментом постановки в очередь
+    started = time.time()
+    began = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return started, time.perf_counter() - began, result
+
+
+class WorkerPool:
+    def __init__(self, kind: str = "thread", size: int = 2, queue: int = 16) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown worker pool kind: {kind}")
+        self.kind = kind
+        self.size = size
+        self.queue = queue
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        # Создаём лениво: процессы не нужны, пока нет тяжёлых задач (и при импорте модуля)
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.size)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="worker")
+            return self._executor
+
+    def _reserve(self) -> None:
+        with self._lock:
+            if self.in_flight >= self.size + self.queue:
+                self.rejected += 1
+                raise WorkerPoolBusy(f"worker pool is full ({self.in_flight} tasks in flight)")
+            self.in_flight += 1
+            self.submitted += 1
+
+    def _record(self, wait: float, run: Optional[float]) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if run is None:
+                self.failed += 1
+                return
+            self.completed += 1
+            self.run_total += run
+            self.run_max = max(self.run_max, run)
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Выполнить fn(*args, **kwargs) в пуле. Бросает WorkerPoolBusy, если очередь заполнена."""
+        if self.kind == "off":
+            return fn(*args, **kwargs)
+        self._reserve()
+        queued = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            started, run, result = await loop.run_in_executor(self.executor, _timed, fn, args, kwargs)
+        except BaseException:
+            self._record(time.time() - queued, None)
+            raise
+        self._record(max(0.0, started - queued), run)
+        return result
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """submit для синхронного кода внутри AsyncSession.run_sync (greenlet SQLAlchemy)."""
+        return await_only(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "kind": self.kind,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_total / done * 1000, 3) if done else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+                "avg_run_ms": round(self.run_total / self.completed * 1000, 3) if self.completed else 0.0,
+                "max_run_ms": round(self.run_max * 1000, 3),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+            logger.info(f"Пул воркеров остановлен: {self.stats()}")
+
+
+_settings = get_settings()
+worker_pool = WorkerPool(kind=_settings.WORKER_POOL_KIND, size=_settings.WORKER_POOL_SIZE,
+                         queue=_settings.WORKER_POOL_QUEUE)
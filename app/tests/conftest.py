@@ -1,9 +1,15 @@
 # tests/conftest.py
 from __future__ import annotations
 
+import asyncio
+from types import SimpleNamespace
+
 import pytest
-from sqlalchemy.pool import StaticPool
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # модели
 from models.users import User
@@ -11,6 +17,8 @@ from models.chats import Chat
 from models.transactions import Transaction
 from models.transaction_participants import TransactionParticipant
 from models.debts import Debt
+from models.balance_checkpoints import BalanceCheckpoint
+from models.chat_members import ChatMember
 
 # репозитории (конкретные реализации)
 from repositories import (
@@ -24,24 +32,85 @@ from repositories import (
 # сервисы
 from services.transactions_service import TransactionsService
 from services.debts_service import DebtsService
+from services.balance_cache import balance_cache
+from cache.user_display import user_display_cache
+from cache.known_chats import known_chats
+from models.crud.unit_of_work import async_unit_of_work
+
+
+def _enable_foreign_keys(sync_engine):
+    """Внешние ключи в SQLite включаются на каждом соединении (нужны для ON DELETE CASCADE)."""
+    @event.listens_for(sync_engine, "connect")
+    def _fk_on(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 
-# ВАЖНО: SQLite in-memory на каждый тест => чистая БД
 @pytest.fixture
-def engine():
+def db_path(tmp_path):
+    # Файл SQLite на каждый тест => чистая БД. Файл, а не :memory:, чтобы синхронный engine
+    # (сиды и проверки) и aiosqlite (хендлеры на AsyncSession) видели одну и ту же базу
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def engine(db_path):
     engine = create_engine(
-        "sqlite:///:memory:",
+        f"sqlite:///{db_path}",
         connect_args={"check_same_thread": False},
         echo=False,
     )
+    _enable_foreign_keys(engine)
     # Создаем схему
     SQLModel.metadata.create_all(engine)
-    # Включаем внешние ключи в SQLite
-    with Session(engine) as s:
-        s.exec("PRAGMA foreign_keys=ON")
     yield engine
-    # Чистим схему (для in-memory не обязательно, но пусть будет)
     SQLModel.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def async_engine(engine, db_path):
+    """aiosqlite поверх той же базы; NullPool — каждый asyncio.run в тесте со своим event loop."""
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    _enable_foreign_keys(async_engine.sync_engine)
+    yield async_engine
+    asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def async_session(async_engine):
+    s = AsyncSession(async_engine, expire_on_commit=False)
+    yield s
+    asyncio.run(s.close())
+
+
+@pytest.fixture
+def run_handler(async_session, session):
+    """
+    Вызвать хендлер так же, как его вызывает DBSessionMiddleware: AsyncSession + одна единица работы.
+    После апдейта синхронная сессия теста перечитывает объекты из БД.
+    """
+    def run(handler, message):
+        async def scenario():
+            async with async_unit_of_work(async_session):
+                await handler(message, async_session)
+        asyncio.run(scenario())
+        session.expire_all()
+        return message.replies
+    return run
+
+
+@pytest.fixture(autouse=True)
+def clean_balance_cache():
+    """Кэш балансов живёт на уровне процесса — между тестами (и их in-memory БД) чистим."""
+    balance_cache.clear()
+    user_display_cache.clear()
+    known_chats.clear()
+    yield
+    balance_cache.clear()
+    user_display_cache.clear()
+    known_chats.clear()
 
 
 @pytest.fixture
@@ -54,7 +123,8 @@ def session(engine):
         try:
             yield s
         finally:
-            trans.rollback()
+            if trans.is_active:
+                trans.rollback()
 
 @pytest.fixture
 def users_repo(session):
@@ -121,3 +191,26 @@ def seed_users(users_repo):
 def seed_chat(chats_repo):
     ch = chats_repo.create(id=-1001, title="Test Chat")
     return ch.id
+
+
+# ---------- Заглушки Telegram для тестов хендлеров ----------
+
+class FakeMessage(SimpleNamespace):
+    """Минимальный aiogram Message: текст, чат, автор и answer(), который копит ответы."""
+    async def answer(self, text, **kwargs):
+        self.replies.append(text)
+
+
+@pytest.fixture
+def make_message():
+    def factory(text, *, chat_id, user, entities=()):
+        return FakeMessage(
+            text=text,
+            entities=list(entities),
+            message_id=1,
+            chat=SimpleNamespace(id=chat_id, title="Test Chat", full_name="Test Chat"),
+            from_user=SimpleNamespace(id=user.id, username=user.username, first_name=user.first_name),
+            replies=[],
+        )
+    return factory
+
@@ -0,0 +1,74 @@
+# tests/test_async_layer.py
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from models.crud.unit_of_work import async_unit_of_work
+from models.users import User
+from repositories import AsyncUsersRepo, AsyncDebtsRepo
+from services.async_services import build_async_services
+
+
+def test_async_repo_mirrors_sync_methods(async_session, session, seed_chat):
+    users = AsyncUsersRepo(async_session)
+    debts = AsyncDebtsRepo(async_session)
+
+    async def scenario():
+        await users.create(id=1, username="a", first_name="А")
+        await debts.create(chat_id=seed_chat, user_id=1, amount=500)
+        # итераторы дочитываются внутри run_sync — снаружи greenlet ленивых запросов нет
+        return await users.get(1), await debts.iter_by_chat(chat_id=seed_chat)
+
+    user, rows = asyncio.run(scenario())
+    assert user.first_name == "А"
+    assert [(d.user_id, d.amount) for d in rows] == [(1, 500)]
+    assert session.get(User, 1) is not None
+
+
+def test_async_unit_of_work_rolls_back(async_session, session):
+    users = AsyncUsersRepo(async_session)
+
+    async def scenario():
+        async with async_unit_of_work(async_session):
+            await users.create(id=1, username="a", first_name=None)
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+    assert session.get(User, 1) is None
+
+
+def test_db_waits_do_not_block_event_loop(async_session, tx_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    for i in range(20):
+        tx_service.create_transaction_with_participants(
+            chat_id=seed_chat, creator_id=u1, amount=300, title=f"Покупка {i}",
+            participants=[(u2, None, None), (u3, None, None)],
+        )
+    services = build_async_services(async_session)
+
+    async def scenario():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def other_chat():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0)
+
+        async def rebuild():
+            try:
+                return await services.debts_service.rebuild(chat_id=seed_chat)
+            finally:
+                done.set()
+
+        rows, _ = await asyncio.gather(rebuild(), other_chat())
+        return rows, ticks
+
+    rows, ticks = asyncio.run(scenario())
+    assert {d.user_id: d.amount for d in rows} == {u1: 6000, u2: -3000, u3: -3000}
+    # Пока rebuild ждал aiosqlite, event loop крутил «другой чат»
+    assert ticks > 1
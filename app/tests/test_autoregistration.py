@@ -0,0 +1,179 @@
+# tests/test_autoregistration.py
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from bot.utils.ensure_ctx import ensure_user_and_chat
+from cache.known_chats import is_known_chat
+from cache.user_display import UserDisplay, user_display_cache
+from repositories import ChatMembersRepoSqlModel
+from services.autoregistration import AutoRegistration
+
+
+def tg_user(id, username, first_name):
+    return SimpleNamespace(id=id, username=username, first_name=first_name)
+
+
+def tg_chat(id, title=None, full_name=None):
+    return SimpleNamespace(id=id, title=title, full_name=full_name)
+
+
+@pytest.fixture
+def session_maker(async_engine):
+    return async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def statements(async_engine):
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    yield captured
+    event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+
+def flush(registration, session_maker):
+    async def scenario():
+        registration.start(session_maker)
+        try:
+            return await registration.flush()
+        finally:
+            await registration.stop()
+    return asyncio.run(scenario())
+
+
+def test_duplicates_collapse_and_flush_is_one_statement_per_table(session, session_maker, statements):
+    reg = AutoRegistration(batch_size=100)
+    chat = tg_chat(-500, title="Group")
+    for _ in range(3):
+        reg.add(tg_user(1, "anna", "Анна"), chat)
+    reg.add(tg_user(2, "boris", "Борис"), chat)
+    reg.add(tg_user(1, "anna", "Анна"), tg_chat(1, full_name="Анна"))  # личка — title из full_name
+    assert reg.pending == 3 and reg.stats()["deduped"] == 2
+
+    assert flush(reg, session_maker) == 3
+
+    writes = [s for s in statements if s.lstrip().upper().startswith("INSERT")]
+    assert len(writes) == 3
+    assert sorted(ChatMembersRepoSqlModel(session).member_ids(chat_id=-500)) == [1, 2]
+    assert ChatMembersRepoSqlModel(session).member_ids(chat_id=1) == [1]
+    assert reg.stats()["batches"] == 1 and reg.pending == 0
+
+
+def test_flushed_pairs_are_skipped_until_profile_changes(session, users_repo, session_maker):
+    reg = AutoRegistration()
+    chat = tg_chat(-500, title="Group")
+    reg.add(tg_user(1, "anna", "Анна"), chat)
+    flush(reg, session_maker)
+
+    reg.add(tg_user(1, "anna", "Анна"), chat)
+    assert reg.pending == 0 and reg.stats()["skipped"] == 1
+
+    reg.add(tg_user(1, "anna_k", "Анна"), chat)
+    assert reg.pending == 1
+    flush(reg, session_maker)
+    session.expire_all()
+    assert users_repo.get(1).username == "anna_k"
+
+
+def test_existing_rows_are_upserted(session, seed_users, seed_chat, users_repo, chats_repo, session_maker):
+    reg = AutoRegistration()
+    reg.add(tg_user(seed_users[0], "vasya_new", "Вася"), tg_chat(seed_chat, title=None))
+    flush(reg, session_maker)
+
+    session.expire_all()
+    assert users_repo.get(seed_users[0]).username == "vasya_new"
+    assert chats_repo.get(seed_chat).title == "Test Chat"  # пустой title не затирает известный
+
+
+def test_flush_fills_caches_so_ensure_ctx_skips_db(session, session_maker):
+    reg = AutoRegistration()
+    reg.add(tg_user(7, "vasiliy", "Василий"), tg_chat(-700, title="Group"))
+    flush(reg, session_maker)
+
+    assert user_display_cache.get(7) == UserDisplay(7, "vasiliy", "Василий")
+    assert is_known_chat(-700)
+    executed = []
+    listener = lambda *args: executed.append(args[2])
+    event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        ensure_user_and_chat(session, tg_user=tg_user(7, "vasiliy", "Василий"), tg_chat=tg_chat(-700, "Group"))
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert executed == []
+
+
+def test_failed_flush_keeps_entries_for_retry(session, session_maker):
+    def broken_maker():
+        raise RuntimeError("db is down")
+
+    reg = AutoRegistration()
+    reg.add(tg_user(1, "anna", "Анна"), tg_chat(-500, title="Group"))
+    assert flush(reg, broken_maker) == 0
+    assert reg.pending == 1 and reg.stats()["failures"] == 2  # flush() и дозапись в stop()
+
+    assert flush(reg, session_maker) == 1
+    assert ChatMembersRepoSqlModel(session).member_ids(chat_id=-500) == [1]
+
+
+def test_full_buffer_drops_new_pairs():
+    reg = AutoRegistration(max_pending=2)
+    chat = tg_chat(-500, title="Group")
+    for uid in (1, 2, 3):
+        reg.add(tg_user(uid, None, "U"), chat)
+    reg.add(tg_user(1, "anna", "Анна"), chat)  # уже в буфере — обновляется, не отбрасывается
+    assert reg.pending == 2 and reg.stats()["dropped"] == 1
+
+
+def test_batch_size_wakes_background_flush(session, session_maker):
+    reg = AutoRegistration(interval=60.0, batch_size=2)
+    chat = tg_chat(-500, title="Group")
+
+    async def scenario():
+        reg.start(session_maker)
+        try:
+            reg.add(tg_user(1, "anna", "Анна"), chat)
+            reg.add(tg_user(2, "boris", "Борис"), chat)
+            for _ in range(100):
+                if reg.stats()["batches"]:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await reg.stop()
+
+    asyncio.run(scenario())
+    assert reg.stats()["batches"] == 1
+    assert sorted(ChatMembersRepoSqlModel(session).member_ids(chat_id=-500)) == [1, 2]
+
+
+def test_stop_writes_remaining_entries(session, session_maker):
+    reg = AutoRegistration(interval=60.0)
+
+    async def scenario():
+        reg.start(session_maker)
+        reg.add(tg_user(1, "anna", "Анна"), tg_chat(-500, title="Group"))
+        await reg.stop()
+
+    asyncio.run(scenario())
+    assert ChatMembersRepoSqlModel(session).member_ids(chat_id=-500) == [1]
+
+
+def test_handler_only_buffers(monkeypatch):
+    from bot.handlers import autoregister, all_routers
+
+    reg = AutoRegistration()
+    monkeypatch.setattr(autoregister, "autoregistration", reg)
+    message = SimpleNamespace(from_user=tg_user(1, "anna", "Анна"), chat=tg_chat(-500, title="Group"))
+    asyncio.run(autoregister.auto_register(message))
+
+    assert reg.pending == 1
+    assert all_routers[-1] is autoregister.router
@@ -0,0 +1,168 @@
+# tests/test_balance_cache.py
+from __future__ import annotations
+
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import event, text
+from sqlmodel import Session, SQLModel, create_engine
+
+from repositories import (
+    ChatsRepoSqlModel,
+    DebtsRepoSqlModel,
+    TransactionParticipantsRepoSqlModel,
+    TransactionsRepoSqlModel,
+    UsersRepoSqlModel,
+)
+from services.balance_cache import (
+    NOTIFY_CHANNEL,
+    BalanceCache,
+    BalanceCacheListener,
+    balance_cache,
+    mark_chat_dirty,
+)
+from services.transactions_service import TransactionsService
+
+PG_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+def _other_replica(session, tx_repo, parts_repo, debts_repo):
+    """Та же БД, но свой кэш балансов — как у второй реплики бота."""
+    return TransactionsService(session=session, tx_repo=tx_repo, parts_repo=parts_repo, debts_repo=debts_repo,
+                               cache=BalanceCache())
+
+
+def test_repeated_reads_hit_cache_until_write(tx_service, debts_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=200, title="Кофе",
+        participants=[(u2, 100, "кофе"), (u3, 100, "кофе")],
+    )
+    misses = balance_cache.misses
+
+    first = debts_service.get_balances(chat_id)
+    plan = debts_service.optimize_settlements(chat_id)
+    assert balance_cache.misses == misses + 2
+
+    hits = balance_cache.hits
+    assert debts_service.get_balances(chat_id) == first
+    assert debts_service.optimize_settlements(chat_id) == plan
+    assert balance_cache.hits == hits + 2
+
+    # запись в чат меняет версию — следующее чтение идёт в БД
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u2, amount=100, title="Такси",
+        participants=[(u1, 100, "такси")],
+    )
+    updated = dict(debts_service.get_balances(chat_id))
+    assert updated == {u1: 100, u2: 0, u3: -100}
+    assert len(debts_service.optimize_settlements(chat_id)) == 1
+
+
+def test_other_replica_writes_reach_cache_via_notify(session, tx_repo, parts_repo, debts_repo, tx_service,
+                                                     debts_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=200, title="Кофе", participants=[(u2, 100, "к"), (u3, 100, "к")],
+    )
+    cached = debts_service.get_balances(seed_chat)
+    assert dict(cached) == {u1: 200, u2: -100, u3: -100}
+    assert len(debts_service.optimize_settlements(seed_chat)) == 2
+
+    _other_replica(session, tx_repo, parts_repo, debts_repo).create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u3, amount=100, title="Такси", participants=[(u2, 100, "т")],
+    )
+    # Попадание в кэш балансов в БД не ходит — до уведомления видим своё закэшированное
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert debts_service.get_balances(seed_chat) == cached
+    assert statements == []
+    # План страхуется отпечатком debts и видит запись сразу
+    assert debts_service.optimize_settlements(seed_chat) == [(u2, u1, 200)]
+
+    # NOTIFY от другой реплики поднимает версию чата
+    BalanceCacheListener(balance_cache)._on_notify(None, 0, NOTIFY_CHANNEL, str(seed_chat))
+    assert dict(debts_service.get_balances(seed_chat)) == {u1: 200, u2: -200, u3: 0}
+
+
+@pytest.mark.skipif(not PG_URL, reason="нужен Postgres: TEST_POSTGRES_URL=postgresql+psycopg2://...")
+def test_commit_notifies_listening_replicas():
+    engine = create_engine(PG_URL)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    chat_id, u1, u2 = -1001, 111, 222
+    replica_cache = BalanceCache()
+    listener = BalanceCacheListener(replica_cache)
+
+    def write(rollback=False):
+        with Session(engine) as s:
+            service = TransactionsService(session=s, tx_repo=TransactionsRepoSqlModel(s),
+                                          parts_repo=TransactionParticipantsRepoSqlModel(s),
+                                          debts_repo=DebtsRepoSqlModel(s), cache=BalanceCache())
+            if rollback:
+                mark_chat_dirty(s, chat_id, BalanceCache())
+                s.execute(text("SELECT 1"))
+                s.rollback()
+                return
+            service.create_transaction_with_participants(
+                chat_id=chat_id, creator_id=u1, amount=100, title="Кофе", participants=[(u2, 100, "к")],
+            )
+
+    async def scenario():
+        await listener.start(PG_URL)
+        try:
+            await asyncio.to_thread(write, rollback=True)
+            await asyncio.to_thread(write)
+            for _ in range(100):
+                if listener.received:
+                    break
+                await asyncio.sleep(0.02)
+            await asyncio.sleep(0.05)
+        finally:
+            await listener.stop()
+
+    try:
+        with Session(engine) as s:
+            UsersRepoSqlModel(s).create(id=u1, username="vasya", first_name=None)
+            UsersRepoSqlModel(s).create(id=u2, username="petya", first_name=None)
+            ChatsRepoSqlModel(s).create(id=chat_id, title="PG")
+        asyncio.run(scenario())
+        # Откаченная транзакция уведомления не шлёт, закоммиченная — одно на чат
+        assert listener.stats() == {"received": 1, "reconnects": 0}
+        assert replica_cache.version(chat_id) > 0
+    finally:
+        SQLModel.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def test_settle_all_plans_from_database_not_cache(monkeypatch, session, tx_repo, parts_repo, debts_repo, tx_service,
+                                                  debts_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=200, title="Кофе", participants=[(u2, 100, "к"), (u3, 100, "к")],
+    )
+    stale = debts_service.optimize_settlements(seed_chat)
+    _other_replica(session, tx_repo, parts_repo, debts_repo).create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u3, amount=100, title="Такси", participants=[(u2, 100, "т")],
+    )
+    # Даже если кэш отдал бы устаревший план, settle_all его не спрашивает
+    monkeypatch.setattr(balance_cache, "get_or_compute", lambda *args: stale)
+
+    assert debts_service.settle_all_debts_via_transactions(seed_chat) == [(u2, u1, 200)]
+    assert set(debts_repo.amounts_by_chat(chat_id=seed_chat).values()) == {0}
+
+
+def test_lru_cache_limits_and_counters():
+    from cache.lru import LRUCache
+
+    cache = LRUCache(maxsize=2, ttl=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)          # вытесняет «b» — к нему дольше всех не обращались
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.hits == 1 and cache.misses == 1
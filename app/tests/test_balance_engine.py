@@ -0,0 +1,107 @@
+# tests/test_balance_engine.py
+from __future__ import annotations
+
+import random
+import struct
+
+import pytest
+
+from services.balance_engine import BalanceEngine, fold_dict
+
+
+def _seed_history(tx_service, seed_users, chat_id):
+    u1, u2, u3 = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=900, title="Ужин",
+        participants=[(u2, 450, "ужин"), (u3, 450, "ужин")],
+    )
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u2, amount=300, title="Такси",
+        participants=[(u1, 300, "такси")],
+    )
+    tx_service.create_transaction(chat_id=chat_id, creator_id=u3, amount=100, title="Пусто")
+
+
+def _copy_buffer(rows):
+    """Вывод COPY (FORMAT binary) для строк из трёх BIGINT."""
+    buf = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+    for row in rows:
+        buf += struct.pack(">h", 3) + b"".join(struct.pack(">iq", 8, v) for v in row)
+    return buf + struct.pack(">h", -1)
+
+
+class _CopyOnlyRepo:
+    """Репозиторий «как Postgres»: строки отдаются только через COPY, счётчик запросов — в copies."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.copies = 0
+
+    def supports_binary_copy(self):
+        return True
+
+    def copy_share_rows_binary(self, *, chat_id, after_id=None):
+        self.copies += 1
+        return _copy_buffer(self.rows)
+
+
+def test_engine_source_matches_sql_aggregation(tx_service, debts_service, tx_repo, seed_users, seed_chat):
+    _seed_history(tx_service, seed_users, seed_chat)
+
+    sql = tx_repo.balances_by_chat(chat_id=seed_chat)
+    debts_service.balance_source = "engine"
+
+    assert debts_service.compute_balances(seed_chat) == sql
+    assert tx_repo.count_share_rows(chat_id=seed_chat) == 4
+
+
+def test_numpy_fold_matches_dict_fold():
+    np = pytest.importorskip("numpy")
+    from services.balance_engine import fold_numpy
+
+    rnd = random.Random(3)
+    rows = [(rnd.randint(1, 40) * 10 ** 9, rnd.randint(1, 40) * 10 ** 9, rnd.randint(0, 10 ** 6)) for _ in range(5000)]
+    creators, users, shares = (np.array(col, dtype=np.int64) for col in zip(*rows))
+
+    assert fold_numpy(creators, users, shares) == fold_dict(rows)
+
+
+def test_parse_copy_binary_roundtrip():
+    np = pytest.importorskip("numpy")
+    from services.balance_engine import parse_copy_binary
+
+    rows = [(1, 2, 150), (2, 1, -7), (-(2 ** 40), 3, 2 ** 40)]
+    creators, users, shares = parse_copy_binary(_copy_buffer(rows))
+    assert list(zip(creators.tolist(), users.tolist(), shares.tolist())) == rows
+
+
+def test_engine_threshold():
+    engine = BalanceEngine(numpy_min_rows=100)
+    assert not engine.uses_numpy(99)
+    pytest.importorskip("numpy")
+    assert engine.uses_numpy(100)
+
+
+def test_engine_offloads_large_folds(tx_service, tx_repo, seed_users, seed_chat):
+    _seed_history(tx_service, seed_users, seed_chat)
+    offloaded = []
+
+    def offload(fn, *args):
+        offloaded.append(fn)
+        return fn(*args)
+
+    small = BalanceEngine(offload=offload, offload_min_rows=5).compute(tx_repo, seed_chat)
+    large = BalanceEngine(offload=offload, offload_min_rows=4).compute(tx_repo, seed_chat)
+    assert small == large == tx_repo.balances_by_chat(chat_id=seed_chat)
+    assert offloaded == [fold_dict]
+
+
+@pytest.mark.parametrize("numpy_min_rows", [1, 1000])
+def test_engine_reads_postgres_history_in_one_copy(numpy_min_rows):
+    pytest.importorskip("numpy")
+    rows = [(1, 2, 150), (2, 3, 70), (3, 1, 20)]
+    repo = _CopyOnlyRepo(rows)
+
+    # Ни COUNT, ни share_rows у репозитория нет: число строк берётся из буфера COPY
+    assert BalanceEngine(numpy_min_rows=numpy_min_rows).compute(repo, chat_id=1) == fold_dict(rows)
+    assert repo.copies == 1
@@ -0,0 +1,125 @@
+# tests/test_checkpoints.py
+from __future__ import annotations
+
+import pytest
+from sqlmodel import select
+
+from models.balance_checkpoints import BalanceCheckpoint
+from repositories import BalanceCheckpointsRepoSqlModel
+from services.checkpoints_service import CheckpointsService
+from services.transactions_service import TransactionsService
+from services.debts_service import DebtsService
+
+
+@pytest.fixture
+def checkpoints(session, tx_repo):
+    return CheckpointsService(BalanceCheckpointsRepoSqlModel(session), tx_repo, every=2, keep=2)
+
+
+@pytest.fixture
+def services(session, tx_repo, parts_repo, debts_repo, users_repo, checkpoints):
+    tx_service = TransactionsService(
+        session=session, tx_repo=tx_repo, parts_repo=parts_repo, debts_repo=debts_repo, checkpoints=checkpoints,
+    )
+    debts_service = DebtsService(
+        session=session, debts_repo=debts_repo, tx_repo=tx_repo, parts_repo=parts_repo, users_repo=users_repo,
+        checkpoints=checkpoints,
+    )
+    return tx_service, debts_service
+
+
+def _add(tx_service, chat_id, creator_id, debtor_id, amount):
+    tx, _ = tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=creator_id, amount=amount, title="Покупка",
+        participants=[(debtor_id, amount, "покупка")],
+    )
+    return tx
+
+
+def test_checkpoint_written_every_n_transactions(services, checkpoints, tx_repo, seed_users, seed_chat):
+    tx_service, debts_service = services
+    u1, u2, u3 = seed_users
+
+    txs = [_add(tx_service, seed_chat, u1, u2, 100), _add(tx_service, seed_chat, u2, u3, 300)]
+    as_of, balances = checkpoints.latest(seed_chat)
+    assert as_of == txs[1].id
+    assert balances == {u1: 100, u2: 200, u3: -300}
+
+    txs.append(_add(tx_service, seed_chat, u3, u1, 50))
+    assert checkpoints.latest(seed_chat)[0] == txs[1].id  # одна транзакция после чекпоинта — рано
+
+    rows = debts_service.rebuild(seed_chat)
+    assert {d.user_id: d.amount for d in rows} == tx_repo.balances_by_chat(chat_id=seed_chat)
+
+
+def test_rebuild_replays_only_tail_after_checkpoint(services, checkpoints, tx_repo, seed_users, seed_chat):
+    tx_service, debts_service = services
+    u1, u2, _ = seed_users
+
+    _add(tx_service, seed_chat, u1, u2, 100)
+    checkpoint_tx = _add(tx_service, seed_chat, u1, u2, 100)
+    _add(tx_service, seed_chat, u2, u1, 30)
+
+    # Подменяем чекпоинт: если rebuild честно берёт его за основу, подмена видна в результате
+    checkpoints.checkpoints.delete_from(chat_id=seed_chat, tx_id=checkpoint_tx.id)
+    checkpoints.checkpoints.write(chat_id=seed_chat, as_of_tx_id=checkpoint_tx.id, balances={u1: 1, u2: -1})
+
+    for source in ("sql", "stream", "engine"):
+        debts_service.balance_source = source
+        assert debts_service.compute_balances(seed_chat) == {u1: -29, u2: 29}
+
+
+def test_deleting_old_transaction_invalidates_checkpoint(services, checkpoints, tx_repo, seed_users, seed_chat):
+    tx_service, debts_service = services
+    u1, u2, u3 = seed_users
+
+    first = _add(tx_service, seed_chat, u1, u2, 100)
+    second = _add(tx_service, seed_chat, u2, u3, 300)
+    later = _add(tx_service, seed_chat, u3, u1, 50)
+    assert checkpoints.latest(seed_chat)[0] == second.id
+
+    # транзакция после чекпоинта — чекпоинт остаётся
+    tx_service.delete_transaction(transaction_id=later.id)
+    assert checkpoints.latest(seed_chat)[0] == second.id
+
+    # транзакция внутри чекпоинта — чекпоинт удаляется
+    tx_service.delete_transaction(transaction_id=first.id)
+    assert checkpoints.latest(seed_chat) == (None, {})
+
+    rows = debts_service.rebuild(seed_chat)
+    assert {d.user_id: d.amount for d in rows} == {u2: 300, u3: -300}
+
+
+def test_foreign_ids_do_not_invalidate_checkpoint(services, checkpoints, chats_repo, seed_users, seed_chat):
+    tx_service, _ = services
+    u1, u2, u3 = seed_users
+    other_chat = chats_repo.create(id=-2002, title="Other Chat").id
+
+    foreign = _add(tx_service, other_chat, u1, u2, 70)
+    _add(tx_service, seed_chat, u1, u2, 100)
+    second = _add(tx_service, seed_chat, u2, u3, 300)
+    later = _add(tx_service, seed_chat, u3, u1, 50)
+    assert checkpoints.latest(seed_chat)[0] == second.id
+
+    # Чужой id меньше чекпоинта и несуществующий id: удаляется только later, чекпоинт остаётся
+    assert tx_service.delete_transactions(
+        chat_id=seed_chat, transaction_ids=[foreign.id, later.id, later.id + 100],
+    ) == [later.id]
+    assert checkpoints.latest(seed_chat)[0] == second.id
+
+    # Ничего не удалено — чекпоинт тоже не трогаем
+    assert tx_service.delete_transactions(chat_id=seed_chat, transaction_ids=[foreign.id]) == []
+    assert checkpoints.latest(seed_chat)[0] == second.id
+
+
+def test_old_checkpoints_are_pruned(services, checkpoints, seed_users, seed_chat, session):
+    tx_service, _ = services
+    u1, u2, _ = seed_users
+
+    written = []
+    for _ in range(3):
+        _add(tx_service, seed_chat, u1, u2, 10)
+        written.append(_add(tx_service, seed_chat, u1, u2, 10).id)
+
+    as_of_ids = sorted(set(session.exec(select(BalanceCheckpoint.as_of_tx_id))))
+    assert as_of_ids == written[-2:]
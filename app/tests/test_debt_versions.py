@@ -0,0 +1,358 @@
+# tests/test_debt_versions.py
+from __future__ import annotations
+
+import os
+import random
+import threading
+
+import pytest
+from sqlalchemy import event, text
+from sqlmodel import SQLModel, Session, create_engine
+
+import repositories.debts_repo as debts_repo_module
+from database.migrations import run_migrations
+from models.crud.locks import lock_chat
+from repositories import (
+    BalanceCheckpointsRepoSqlModel, ChatsRepoSqlModel, DebtsRepoSqlModel,
+    TransactionParticipantsRepoSqlModel, TransactionsRepoSqlModel, UsersRepoSqlModel,
+)
+from services.checkpoints_service import CheckpointsService
+from services.debts_service import DebtsService
+from services.transactions_service import TransactionsService
+
+
+def test_every_write_bumps_version(debts_repo, seed_users, seed_chat):
+    u1, u2, _ = seed_users
+    debts_repo.apply_deltas(chat_id=seed_chat, deltas={u1: 100, u2: -100})
+    debt = debts_repo.get_by_chat_user(chat_id=seed_chat, user_id=u1)
+    assert debt.version == 0  # вставка
+
+    debts_repo.apply_deltas(chat_id=seed_chat, deltas={u1: 50})
+    assert debts_repo.get_by_chat_user(chat_id=seed_chat, user_id=u1).version == 1
+
+    debts_repo.bulk_upsert(chat_id=seed_chat, balances={u1: 10, u2: -10})
+    assert debts_repo.get_by_chat_user(chat_id=seed_chat, user_id=u1).version == 2
+
+    debts_repo.update(id=debt.id, amount=0)
+    assert debts_repo.get(debt.id).version == 3
+
+
+def test_upsert_delta_is_atomic_increment(debts_repo, seed_users, seed_chat):
+    u1, _, _ = seed_users
+    assert debts_repo.upsert_delta(chat_id=seed_chat, user_id=u1, delta=100).amount == 100
+    debt = debts_repo.upsert_delta(chat_id=seed_chat, user_id=u1, delta=-30)
+    assert (debt.amount, debt.version) == (70, 1)
+
+
+def test_chat_lock_is_noop_on_sqlite(session, debts_repo, seed_chat):
+    executed = []
+    listener = lambda *args: executed.append(args[2])
+    event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert lock_chat(session, seed_chat) is False
+        assert debts_repo.lock_chat(chat_id=seed_chat) is False
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert executed == []
+
+
+def test_balance_writes_take_chat_lock(monkeypatch, tx_service, debts_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    locked = []
+    monkeypatch.setattr(debts_repo_module, "lock_chat", lambda session, chat_id: locked.append(chat_id) or True)
+
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=300, title="Пицца",
+        participants=[(u2, None, None), (u3, None, None)],
+    )
+    debts_service.rebuild(chat_id=seed_chat)
+    debts_service.settle_all_debts_via_transactions(seed_chat)
+    assert locked and set(locked) == {seed_chat}
+    assert len(locked) >= 3
+
+
+def test_every_balance_write_locks_chat_before_first_write(monkeypatch, engine, tx_service, debts_service,
+                                                           seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    log = []
+    monkeypatch.setattr(debts_repo_module, "lock_chat", lambda session, chat_id: log.append("LOCK") or True)
+    listener = lambda *args: log.append(args[2].split()[0]) if args[2].split()[0] in ("INSERT", "UPDATE", "DELETE") \
+        else None
+    event.listen(engine, "before_cursor_execute", listener)
+
+    def locked_first(call):
+        log.clear()
+        result = call()
+        assert log and log[0] == "LOCK", log
+        return result
+
+    try:
+        tx, _ = locked_first(lambda: tx_service.create_transaction_with_participants(
+            chat_id=seed_chat, creator_id=u1, amount=300, title="Пицца", participants=[(u2, None, None)],
+        ))
+        locked_first(lambda: tx_service.create_transaction(chat_id=seed_chat, creator_id=u2, amount=0, title="Пусто"))
+        part = locked_first(lambda: tx_service.add_participant(transaction_id=tx.id, user_id=u3, share_amount=50))
+        locked_first(lambda: tx_service.remove_participant(participant_id=part.id))
+        locked_first(lambda: debts_service.rebuild(chat_id=seed_chat))
+        locked_first(lambda: debts_service.settle_all_debts_via_transactions(seed_chat))
+        locked_first(lambda: tx_service.delete_transactions(chat_id=seed_chat, transaction_ids=[tx.id]))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+class ThreadChatLocks:
+    """
+    pg_advisory_xact_lock на threading.Lock — чтобы гонки реплик проверялись и на SQLite:
+    блокировка чата держится до commit/rollback сессии, повторный вызов в той же транзакции не ждёт.
+    waits — сколько раз писателю пришлось ждать чужую блокировку.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+        self.waits = 0
+
+    def __call__(self, session, chat_id):
+        held = session.info.setdefault("test_chat_locks", set())
+        if chat_id in held:
+            return True
+        with self._guard:
+            lock = self._locks.setdefault(chat_id, threading.Lock())
+        if not lock.acquire(blocking=False):
+            with self._guard:
+                self.waits += 1
+            lock.acquire()
+        held.add(chat_id)
+        if not session.info.get("test_chat_locks_listening"):
+            session.info["test_chat_locks_listening"] = True
+            event.listen(session, "after_commit", self._release)
+            event.listen(session, "after_soft_rollback", lambda s, previous: self._release(s))
+        return True
+
+    def _release(self, session):
+        for chat_id in session.info.pop("test_chat_locks", ()):
+            self._locks[chat_id].release()
+
+
+def _replica_services(session, checkpoint_every=0):
+    """Сервисы одной «реплики» на своей сессии (без общего кэша балансов)."""
+    txs = TransactionsRepoSqlModel(session)
+    parts = TransactionParticipantsRepoSqlModel(session)
+    debts = DebtsRepoSqlModel(session)
+    checkpoints = CheckpointsService(BalanceCheckpointsRepoSqlModel(session), txs, every=checkpoint_every, keep=2) \
+        if checkpoint_every else None
+    return (TransactionsService(session=session, tx_repo=txs, parts_repo=parts, debts_repo=debts,
+                                checkpoints=checkpoints),
+            DebtsService(session=session, debts_repo=debts, tx_repo=txs, parts_repo=parts,
+                         users_repo=UsersRepoSqlModel(session), checkpoints=checkpoints))
+
+
+def _seed(engine, chat_id, user_ids):
+    with Session(engine) as s:
+        for uid in user_ids:
+            UsersRepoSqlModel(s).create(id=uid, username=None, first_name=None)
+        ChatsRepoSqlModel(s).create(id=chat_id, title="Test Chat")
+
+
+def _nonzero(balances):
+    return {user_id: amount for user_id, amount in balances.items() if amount}
+
+
+def test_delta_waits_for_rebuild_instead_of_being_overwritten(monkeypatch, engine):
+    """
+    Вместо CAS по debts.version записи сериализуются блокировкой чата. Пересчёт прочитал историю;
+    дельта второй «реплики» не должна закоммититься до его записи — иначе upsert пересчёта её затрёт.
+    """
+    locks = ThreadChatLocks()
+    monkeypatch.setattr(debts_repo_module, "lock_chat", locks)
+    chat_id, u1, u2, u3 = -1001, 111, 222, 333
+    _seed(engine, chat_id, (u1, u2, u3))
+    with Session(engine) as s:
+        _replica_services(s)[0].create_transaction_with_participants(
+            chat_id=chat_id, creator_id=u1, amount=100, title="A", participants=[(u2, 100, None)])
+
+    computed, go, errors = threading.Event(), threading.Event(), []
+
+    def rebuilder():
+        try:
+            with Session(engine) as s:
+                _, debts_service = _replica_services(s)
+                compute = debts_service.compute_balances
+
+                def paused(chat):
+                    result = compute(chat)
+                    computed.set()
+                    go.wait(1)
+                    return result
+
+                debts_service.compute_balances = paused
+                debts_service.rebuild(chat_id)
+        except Exception as exc:
+            errors.append(exc)
+
+    def writer():
+        try:
+            with Session(engine) as s:
+                _replica_services(s)[0].create_transaction_with_participants(
+                    chat_id=chat_id, creator_id=u2, amount=300, title="B", participants=[(u3, 300, None)])
+        except Exception as exc:
+            errors.append(exc)
+
+    r = threading.Thread(target=rebuilder)
+    r.start()
+    assert computed.wait(5)
+    w = threading.Thread(target=writer)
+    w.start()
+    w.join(0.3)
+    w_waited = w.is_alive()
+    go.set()
+    r.join(10)
+    w.join(10)
+    assert not errors
+
+    with Session(engine) as s:
+        debts = {d.user_id: d.amount for d in DebtsRepoSqlModel(s).list_by_chat(chat_id=chat_id)}
+        history = TransactionsRepoSqlModel(s).balances_by_chat(chat_id=chat_id)
+    assert debts == history == {u1: 100, u2: 200, u3: -300}
+    assert w_waited and locks.waits >= 1
+
+
+def test_concurrent_writers_keep_debts_equal_to_history(monkeypatch, engine):
+    locks = ThreadChatLocks()
+    monkeypatch.setattr(debts_repo_module, "lock_chat", locks)
+    chat_id, users = -1001, [111, 222, 333, 444]
+    _seed(engine, chat_id, users)
+    created, errors = [], []
+
+    def replica(seed):
+        rnd = random.Random(seed)
+        try:
+            for _ in range(15):
+                # Как апдейт бота: своя сессия на каждую операцию
+                with Session(engine, expire_on_commit=False) as s:
+                    tx_service, debts_service = _replica_services(s, checkpoint_every=3)
+                    op = rnd.random()
+                    if op < 0.6 or not created:
+                        creator, *debtors = rnd.sample(users, 3)
+                        tx, _ = tx_service.create_transaction_with_participants(
+                            chat_id=chat_id, creator_id=creator, amount=rnd.randint(1, 500) * 3, title="T",
+                            participants=[(uid, None, None) for uid in debtors])
+                        created.append(tx.id)
+                    elif op < 0.9:
+                        # Другие реплики могут удалять те же id — откат вклада должен случиться один раз
+                        tx_service.delete_transactions(chat_id=chat_id, transaction_ids=rnd.sample(created, 2)
+                                                       if len(created) > 1 else created[:1])
+                    else:
+                        debts_service.rebuild(chat_id)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=replica, args=(seed,)) for seed in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    assert not errors
+
+    with Session(engine) as s:
+        tx_service, debts_service = _replica_services(s, checkpoint_every=3)
+        history = debts_service.txs.balances_by_chat(chat_id=chat_id)
+        # Дельты могут оставить нулевую строку пользователю, выпавшему из истории (её уберёт rebuild)
+        debts = {d.user_id: d.amount for d in debts_service.debts.list_by_chat(chat_id=chat_id)}
+        assert _nonzero(debts) == _nonzero(history)
+        # Чекпоинты, записанные под той же блокировкой, полны: rebuild от них даёт ту же историю
+        assert {d.user_id: d.amount for d in debts_service.rebuild(chat_id)} == history
+
+
+PG_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+@pytest.mark.skipif(not PG_URL, reason="нужен Postgres: TEST_POSTGRES_URL=postgresql+psycopg2://...")
+def test_interleaved_writers_keep_checkpoint_complete():
+    """
+    Писатель A вставил транзакцию N и ещё не закоммитил; писатель B (чекпоинт на каждую транзакцию)
+    не должен успеть записать N+1 и чекпоинт без N — он ждёт блокировку чата до вставки.
+    """
+    engine = create_engine(PG_URL)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    chat_id, u1, u2, u3 = -1001, 111, 222, 333
+
+    def services(session):
+        txs = TransactionsRepoSqlModel(session)
+        parts = TransactionParticipantsRepoSqlModel(session)
+        debts = DebtsRepoSqlModel(session)
+        checkpoints = CheckpointsService(BalanceCheckpointsRepoSqlModel(session), txs, every=1, keep=2)
+        return (TransactionsService(session=session, tx_repo=txs, parts_repo=parts, debts_repo=debts,
+                                    checkpoints=checkpoints),
+                DebtsService(session=session, debts_repo=debts, tx_repo=txs, parts_repo=parts,
+                             users_repo=UsersRepoSqlModel(session), checkpoints=checkpoints))
+
+    inserted, go, errors = threading.Event(), threading.Event(), []
+
+    def writer_a():
+        try:
+            with Session(engine) as s:
+                tx_service, _ = services(s)
+                create = tx_service.txs.create_with_participants
+
+                def paused(**kwargs):
+                    result = create(**kwargs)
+                    inserted.set()
+                    go.wait(5)
+                    return result
+
+                tx_service.txs.create_with_participants = paused
+                tx_service.create_transaction_with_participants(
+                    chat_id=chat_id, creator_id=u1, amount=100, title="A", participants=[(u2, 100, None)])
+        except Exception as exc:
+            errors.append(exc)
+
+    def writer_b():
+        try:
+            with Session(engine) as s:
+                services(s)[0].create_transaction_with_participants(
+                    chat_id=chat_id, creator_id=u2, amount=300, title="B", participants=[(u3, 300, None)])
+        except Exception as exc:
+            errors.append(exc)
+
+    try:
+        with Session(engine) as s:
+            for uid in (u1, u2, u3):
+                UsersRepoSqlModel(s).create(id=uid, username=None, first_name=None)
+            ChatsRepoSqlModel(s).create(id=chat_id, title="Test Chat")
+
+        a = threading.Thread(target=writer_a)
+        a.start()
+        assert inserted.wait(5)
+        b = threading.Thread(target=writer_b)
+        b.start()
+        b.join(0.5)
+        b_waited = b.is_alive()
+        go.set()
+        a.join(10)
+        b.join(10)
+        assert not errors
+
+        with Session(engine) as s:
+            _, debts_service = services(s)
+            rebuilt = {d.user_id: d.amount for d in debts_service.rebuild(chat_id)}
+            full = debts_service.txs.balances_by_chat(chat_id=chat_id)
+        assert rebuilt == full == {u1: 100, u2: 200, u3: -300}
+        assert b_waited
+    finally:
+        SQLModel.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def test_existing_database_gets_version_column(engine):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE debts DROP COLUMN version"))
+        conn.execute(text("INSERT INTO chats (id, title) VALUES (1, 'c')"))
+        conn.execute(text("INSERT INTO users (id) VALUES (1)"))
+        conn.execute(text("INSERT INTO debts (chat_id, user_id, amount, updated_at) VALUES (1, 1, 5, '2024-01-01')"))
+
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT amount, version FROM debts")).one() == (5, 0)
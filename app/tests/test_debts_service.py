@@ -0,0 +1,136 @@
+# tests/test_debts_service.py
+from __future__ import annotations
+
+
+def test_rebuild_matches_streamed_history(tx_service, debts_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=900, title="Ужин",
+        participants=[(u2, 450, "ужин"), (u3, 450, "ужин")],
+    )
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u2, amount=300, title="Такси",
+        participants=[(u1, 300, "такси")],
+    )
+    # транзакция без участников: создатель всё равно получает строку с нулём
+    tx_service.create_transaction(chat_id=chat_id, creator_id=u3, amount=100, title="Пусто")
+
+    expected = debts_service._balances_streamed(chat_id)
+    rows = debts_service.rebuild(chat_id)
+
+    assert {d.user_id: d.amount for d in rows} == expected
+    assert {d.user_id: d.amount for d in rows} == {u1: 600, u2: -150, u3: -450}
+
+
+def test_rebuild_updates_existing_rows(tx_service, debts_service, debts_repo, seed_users, seed_chat):
+    u1, u2, _ = seed_users
+    chat_id = seed_chat
+
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=200, title="Кофе",
+        participants=[(u2, 200, "кофе")],
+    )
+    debts_service.rebuild(chat_id)
+    debts_service.rebuild(chat_id)
+
+    rows = debts_repo.list_by_chat(chat_id=chat_id)
+    assert sorted((d.user_id, d.amount) for d in rows) == [(u1, 200), (u2, -200)]
+
+
+def test_incremental_deltas_match_full_rebuild(tx_service, debts_service, debts_repo, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+
+    tx1, _ = tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=900, title="Ужин",
+        participants=[(u2, 450, "ужин"), (u3, 450, "ужин")],
+    )
+    tx2, _ = tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u2, amount=600, title="Бензин",
+        participants=[(u1, 300, "бензин"), (u2, 300, "бензин")],
+    )
+    added = tx_service.add_participant(transaction_id=tx2.id, user_id=u3, share_amount=100, tag="бензин")
+    tx_service.remove_participant(participant_id=added.id)
+    tx_service.delete_transaction(transaction_id=tx1.id)
+
+    incremental = {d.user_id: d.amount for d in debts_repo.list_by_chat(chat_id=chat_id)}
+    assert incremental == {u1: -300, u2: 300, u3: 0}
+
+    # Дельты оставляют u3 нулевую строку; rebuild удаляет её — u3 выпал из истории
+    rebuilt = {d.user_id: d.amount for d in debts_service.rebuild(chat_id)}
+    assert rebuilt == {u1: -300, u2: 300}
+    assert incremental == {**rebuilt, u3: 0}
+
+
+def test_bulk_upsert_inserts_updates_and_drops_stale(debts_repo, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+
+    debts_repo.bulk_upsert(chat_id=chat_id, balances={u1: 100, u2: -60, u3: -40})
+    rows = debts_repo.bulk_upsert(chat_id=chat_id, balances={u1: 50, u2: -50})
+
+    assert sorted((d.user_id, d.amount) for d in rows) == [(u1, 50), (u2, -50)]
+    assert debts_repo.get_by_chat_user(chat_id=chat_id, user_id=u3) is None
+
+
+def test_streamed_balances_cross_page_boundaries(tx_service, debts_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+
+    for i in range(7):
+        tx_service.create_transaction_with_participants(
+            chat_id=chat_id, creator_id=(u1, u2, u3)[i % 3], amount=300, title=f"tx{i}",
+            participants=[(u1, 100, "t"), (u2, 100, "t"), (u3, 100, "t")],
+        )
+    tx_service.create_transaction(chat_id=chat_id, creator_id=u1, amount=50, title="Пусто")
+
+    debts_service.stream_batch_size = 3
+    streamed = debts_service._balances_streamed(chat_id)
+    assert streamed == debts_service.txs.balances_by_chat(chat_id=chat_id)
+    assert streamed == {u1: 200, u2: -100, u3: -100}
+
+
+def test_uneven_split_is_exact_in_minor_units(tx_service, debts_service, parts_repo, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+
+    # 100.00 на троих: 33.34 + 33.33 + 33.33, ни копейки не теряется
+    tx, _ = tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=10000, title="Пицца",
+        participants=[(u1, None, "пицца"), (u2, None, "пицца"), (u3, None, "пицца")],
+    )
+    shares = sorted(p.share_amount for p in parts_repo.list_by_transaction(transaction_id=tx.id))
+    assert shares == [3333, 3333, 3334]
+
+    balances = {d.user_id: d.amount for d in debts_service.rebuild(chat_id)}
+    assert sum(balances.values()) == 0
+    assert debts_service.optimize_settlements(chat_id, mode="greedy") == [(u2, u1, 3333), (u3, u1, 3333)]
+
+
+def test_settle_all_is_one_commit_and_idempotent(tx_service, debts_service, debts_repo, tx_repo, session,
+                                                 seed_users, seed_chat):
+    from sqlalchemy import event
+
+    u1, u2, u3 = seed_users
+    chat_id = seed_chat
+    tx_service.create_transaction_with_participants(
+        chat_id=chat_id, creator_id=u1, amount=900, title="Ужин",
+        participants=[(u2, 450, "ужин"), (u3, 450, "ужин")],
+    )
+
+    commits = []
+    event.listen(session, "after_commit", lambda s: commits.append(1))
+    plan = debts_service.settle_all_debts_via_transactions(chat_id, batch_id="b1")
+    assert len(commits) == 1
+    assert sorted(plan) == [(u2, u1, 450), (u3, u1, 450)]
+
+    # балансы обнулены дельтами и совпадают с пересчётом по истории
+    assert {d.user_id: d.amount for d in debts_repo.list_by_chat(chat_id=chat_id)} == {u1: 0, u2: 0, u3: 0}
+    assert tx_repo.balances_by_chat(chat_id=chat_id) == {u1: 0, u2: 0, u3: 0}
+
+    # повтор с тем же batch_id ничего не пишет и возвращает тот же план
+    tx_count = len(tx_repo.list_by_chat(chat_id=chat_id))
+    assert debts_service.settle_all_debts_via_transactions(chat_id, batch_id="b1") == plan
+    assert len(tx_repo.list_by_chat(chat_id=chat_id)) == tx_count
@@ -0,0 +1,73 @@
+# tests/test_ensure_ctx.py
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+
+from bot.utils.ensure_ctx import ensure_user_and_chat, ensure_user_and_chat_async
+from cache.known_chats import is_known_chat
+from cache.user_display import UserDisplay, user_display_cache
+from models.chats import Chat
+from models.crud.unit_of_work import unit_of_work
+from models.users import User
+
+CHAT = SimpleNamespace(id=-42, title="Дача", full_name="Дача")
+
+
+def _tg_user(first_name="Вася", username="vasya"):
+    return SimpleNamespace(id=7, username=username, first_name=first_name)
+
+
+@pytest.fixture
+def statements(engine):
+    captured = []
+    event.listen(engine, "before_cursor_execute", lambda *args: captured.append(args[2]))
+    return captured
+
+
+def test_known_user_and_chat_skip_the_database(session, statements):
+    ensure_user_and_chat(session, tg_user=_tg_user(), tg_chat=CHAT)
+    assert session.get(User, 7) and session.get(Chat, -42)
+
+    statements.clear()
+    ensure_user_and_chat(session, tg_user=_tg_user(), tg_chat=CHAT)
+    assert statements == []
+
+
+def test_changed_profile_is_synced(session, statements):
+    ensure_user_and_chat(session, tg_user=_tg_user(), tg_chat=CHAT)
+    statements.clear()
+
+    ensure_user_and_chat(session, tg_user=_tg_user(first_name="Василий", username="vasiliy"), tg_chat=CHAT)
+
+    assert any(s.startswith("UPDATE users") for s in statements)
+    assert not any("FROM chats" in s for s in statements)
+    session.expire_all()
+    assert (session.get(User, 7).first_name, session.get(User, 7).username) == ("Василий", "vasiliy")
+    assert user_display_cache.get(7) == UserDisplay(7, "vasiliy", "Василий")
+
+
+def test_rolled_back_registration_is_not_cached(session):
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            ensure_user_and_chat(session, tg_user=_tg_user(), tg_chat=CHAT)
+            assert not is_known_chat(CHAT.id)  # до commit в кэш не попадаем
+            raise RuntimeError("boom")
+
+    assert user_display_cache.get(7) is None and not is_known_chat(CHAT.id)
+    with unit_of_work(session):
+        ensure_user_and_chat(session, tg_user=_tg_user(), tg_chat=CHAT)
+    assert is_known_chat(CHAT.id) and user_display_cache.get(7) is not None
+
+
+def test_async_variant_skips_run_sync_when_known(async_session, session, monkeypatch):
+    asyncio.run(ensure_user_and_chat_async(async_session, tg_user=_tg_user(), tg_chat=CHAT))
+    assert session.get(User, 7) is not None
+
+    def fail(*args, **kwargs):
+        raise AssertionError("known entities must not touch the database")
+    monkeypatch.setattr(async_session, "run_sync", fail)
+    asyncio.run(ensure_user_and_chat_async(async_session, tg_user=_tg_user(), tg_chat=CHAT))
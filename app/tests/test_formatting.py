@@ -0,0 +1,48 @@
+# tests/test_formatting.py
+from __future__ import annotations
+
+from sqlalchemy import event
+
+from bot.utils.formatting import UserNames, format_user
+
+
+def test_user_names_loads_once_and_serves_from_map(session, engine, users_repo, seed_users):
+    u1, u2, u3 = seed_users
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    names = UserNames(users_repo).load([u1, u2, u3, 404, u1])
+    assert len(statements) == 1
+
+    names.load([u2, 404])  # всё уже известно — в БД не идём
+    labels = [format_user(uid, names) for uid in (u1, u2, u3, 404, u1)]
+    assert len(statements) == 1
+    assert labels == ["<b>Вася</b>", "<b>Петя</b>", "<b>Маша</b>", "❓404", "<b>Вася</b>"]
+
+
+def test_user_names_is_shared_per_session(session):
+    assert UserNames.for_session(session) is UserNames.for_session(session)
+
+
+def test_format_user_is_pure_over_map():
+    assert format_user(7, {}) == "❓7"
+
+
+def test_balance_handler_resolves_names_in_one_query(async_engine, tx_service, users_repo, seed_users, seed_chat,
+                                                      make_message, run_handler):
+    from bot.handlers.basic import cmd_balance
+
+    u1, u2, u3 = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=900, title="Ужин",
+        participants=[(u2, 450, "ужин"), (u3, 450, "ужин")],
+    )
+
+    user_selects = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute",
+                 lambda *args: user_selects.append(args[2]) if "FROM users" in args[2] else None)
+    message = make_message("/balance", chat_id=seed_chat, user=users_repo.get(u1))
+    replies = run_handler(cmd_balance, message)
+
+    assert len(user_selects) == 1
+    assert "<b>Петя</b>: -4.50" in replies[0]
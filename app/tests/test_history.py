@@ -0,0 +1,72 @@
+# tests/test_history.py
+from __future__ import annotations
+
+from sqlalchemy import event
+
+
+def _seed(tx_service, users_repo, chat_id, creator_id, count):
+    guests = [users_repo.create(id=2000 + i, username=f"guest{i}", first_name=None).id for i in range(5)]
+    for i in range(count):
+        tx_service.create_transaction_with_participants(
+            chat_id=chat_id, creator_id=creator_id if i % 2 else guests[0], amount=500, title=f"Покупка {i}",
+            participants=[(uid, None, None) for uid in guests],
+        )
+
+
+def test_list_with_participants_newest_first(tx_service, tx_repo, users_repo, seed_users, seed_chat):
+    _seed(tx_service, users_repo, seed_chat, seed_users[0], 5)
+
+    page = tx_repo.list_with_participants(chat_id=seed_chat, limit=3)
+    assert [t.title for t in page] == ["Покупка 4", "Покупка 3", "Покупка 2"]
+
+    older = tx_repo.list_with_participants(chat_id=seed_chat, limit=3, before_id=page[-1].id)
+    assert [t.title for t in older] == ["Покупка 1", "Покупка 0"]
+
+
+def test_history_query_count_does_not_grow(async_engine, tx_service, users_repo, seed_users, seed_chat,
+                                           make_message, run_handler):
+    from bot.handlers.transactions import cmd_history
+
+    _seed(tx_service, users_repo, seed_chat, seed_users[0], 30)
+    me = users_repo.get(seed_users[0])
+
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def run(limit):
+        statements.clear()
+        message = make_message(f"/history {limit}", chat_id=seed_chat, user=me)
+        return len(statements), run_handler(cmd_history, message)[0]
+
+    small, _ = run(2)
+    big, text = run(30)
+    assert small == big
+    assert "Покупка 29" in text and "@guest4" in text and "<b>Вася</b>" in text
+
+
+def test_history_pages_with_opaque_cursor(tx_service, users_repo, seed_users, seed_chat, make_message, run_handler):
+    from bot.handlers.transactions import cmd_history
+
+    _seed(tx_service, users_repo, seed_chat, seed_users[0], 5)
+    me = users_repo.get(seed_users[0])
+
+    first = make_message("/history 2", chat_id=seed_chat, user=me)
+    text = run_handler(cmd_history, first)[0]
+    assert "Покупка 4" in text and "Покупка 3" in text and "Покупка 2" not in text
+    next_cmd = text.rsplit("Дальше: ", 1)[1]
+
+    pages = [text]
+    while "Дальше: " in pages[-1]:
+        message = make_message(pages[-1].rsplit("Дальше: ", 1)[1], chat_id=seed_chat, user=me)
+        pages.append(run_handler(cmd_history, message)[0])
+
+    assert next_cmd.startswith("/history 2 ")
+    assert len(pages) == 3
+    assert "Покупка 1" in pages[1] and "Покупка 0" in pages[2]
+
+
+def test_history_rejects_garbage_cursor(users_repo, seed_users, seed_chat, make_message, run_handler):
+    from bot.handlers.transactions import cmd_history
+
+    message = make_message("/history 5 !!!", chat_id=seed_chat, user=users_repo.get(seed_users[0]))
+    assert "курсор" in run_handler(cmd_history, message)[0]
@@ -0,0 +1,123 @@
+# tests/test_migrations.py
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import Integer, event, inspect, text
+
+from database.migrations import MIGRATIONS, run_migrations, applied_versions, migration
+from models.crud.crud_users import get_users_by_usernames
+from models.crud.crud_debts import list_debts
+from models.crud.crud_transactions import list_transactions_with_participants
+
+HOT_INDEXES = {
+    "transactions": "ix_transactions_chat_id_id",
+    "transaction_participants": "ix_transaction_participants_transaction_id",
+    "users": "ix_users_username_lower",
+}
+
+
+def _index_names(engine, table):
+    # inspect() не отражает индексы по выражениям (lower(username)), читаем sqlite_master напрямую
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t"), {"t": table})
+        return {name for (name,) in rows}
+
+
+def _plans(engine, session, call, marker):
+    """Выполнить call() и вернуть EXPLAIN QUERY PLAN для каждого SQL, где встречается marker."""
+    captured = []
+    listener = lambda conn, cursor, statement, params, *args: captured.append((statement, params))
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    plans = []
+    for statement, params in captured:
+        if marker in statement and not statement.startswith("EXPLAIN"):
+            rows = session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+            plans.append(" | ".join(row[-1] for row in rows))
+    assert plans, f"no statements matching {marker!r}"
+    return plans
+
+
+def test_fresh_database_marks_all_migrations_applied(engine):
+    assert run_migrations(engine) == [m.version for m in MIGRATIONS]
+    assert run_migrations(engine) == []
+    with engine.connect() as conn:
+        assert set(applied_versions(conn)) == {m.version for m in MIGRATIONS}
+
+
+def test_existing_database_gets_indexes(engine):
+    # «Старая» база: таблицы есть, индексов горячих путей нет
+    with engine.begin() as conn:
+        for name in HOT_INDEXES.values():
+            conn.execute(text(f"DROP INDEX {name}"))
+    assert all(name not in _index_names(engine, table) for table, name in HOT_INDEXES.items())
+
+    run_migrations(engine)
+
+    assert all(name in _index_names(engine, table) for table, name in HOT_INDEXES.items())
+
+
+def test_sqlite_money_columns_are_converted_to_minor_units(engine, session, tx_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=1250, title="Ужин", participants=[(u2, 625, "у"), (u3, 625, "у")],
+    )
+    session.close()
+    # «Старая» база: деньги во float-колонках и в рублях
+    money = (("transactions", "amount"), ("transaction_participants", "share_amount"), ("debts", "amount"))
+    with engine.begin() as conn:
+        for table, column in money:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}_old FLOAT NOT NULL DEFAULT 0"))
+            conn.execute(text(f"UPDATE {table} SET {column}_old = {column} / 100.0"))
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+            conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {column}_old TO {column}"))
+
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        insp = inspect(conn)
+        for table, column in money:
+            assert isinstance(next(c for c in insp.get_columns(table) if c["name"] == column)["type"], Integer)
+        assert conn.execute(text("SELECT amount FROM transactions")).scalar_one() == 1250
+        assert sorted(conn.execute(text("SELECT share_amount FROM transaction_participants")).scalars()) == [625, 625]
+        rows = sorted(conn.execute(text("SELECT user_id, amount FROM debts")).all())
+    assert rows == [(u1, 1250), (u2, -625), (u3, -625)]
+    assert all(type(amount) is int for _, amount in rows)
+
+
+def test_duplicate_migration_version_is_rejected():
+    with pytest.raises(ValueError):
+        migration(MIGRATIONS[0].version, "duplicate")(lambda conn: None)
+
+
+def test_history_query_uses_chat_id_desc_index(engine, session, seed_chat):
+    run_migrations(engine)
+    call = lambda: list_transactions_with_participants(session, chat_id=seed_chat, limit=20, before_id=100)
+    plans = _plans(engine, session, call, "FROM transactions")
+    assert "ix_transactions_chat_id_id" in plans[0]
+    assert "TEMP B-TREE FOR ORDER BY" not in plans[0]
+
+
+def test_participants_lookup_uses_transaction_id_index(engine, session, tx_service, seed_users, seed_chat):
+    u1, u2, _ = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=200, title="Кофе", participants=[(u2, 100, "кофе")],
+    )
+    session.expunge_all()
+    call = lambda: list_transactions_with_participants(session, chat_id=seed_chat)
+    plans = _plans(engine, session, call, "FROM transaction_participants")
+    assert "ix_transaction_participants_transaction_id" in plans[0]
+
+
+def test_username_lookup_uses_lower_index(engine, session):
+    plans = _plans(engine, session, lambda: get_users_by_usernames(session, ["@Vasya", "petya"]), "FROM users")
+    assert "ix_users_username_lower" in plans[0]
+
+
+def test_debts_by_chat_uses_unique_key(engine, session, seed_chat):
+    # На SQLite UniqueConstraint из модели живёт как sqlite_autoindex_debts_N, на Postgres — uq_debts_chat_user
+    plans = _plans(engine, session, lambda: list_debts(session, seed_chat), "FROM debts")
+    assert "USING INDEX" in plans[0] and "(chat_id=?)" in plans[0]
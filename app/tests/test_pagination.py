@@ -0,0 +1,63 @@
+# tests/test_pagination.py
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import event
+
+from bot.utils.pagination import encode_cursor, decode_cursor
+from database.migrations import run_migrations
+
+
+def _walk(fetch, cursor_kw):
+    """Пройти все страницы, передавая id последней строки как курсор."""
+    seen, cursor = [], None
+    while True:
+        page = fetch(**{cursor_kw: cursor})
+        if not page:
+            return seen
+        seen.extend(row.id for row in page)
+        cursor = page[-1].id
+
+
+def test_transactions_keyset_both_directions(tx_repo, seed_users, seed_chat):
+    ids = [tx_repo.create(chat_id=seed_chat, creator_id=seed_users[0], amount=100, title=str(i)).id
+           for i in range(7)]
+
+    forward = _walk(lambda after_id: tx_repo.page_by_chat(chat_id=seed_chat, limit=3, after_id=after_id), "after_id")
+    backward = _walk(lambda before_id: tx_repo.page_by_chat(chat_id=seed_chat, limit=3, before_id=before_id,
+                                                            newest_first=True), "before_id")
+    assert forward == ids
+    assert backward == ids[::-1]
+
+
+def test_debts_and_users_keyset(debts_repo, users_repo, seed_users, seed_chat):
+    for uid in seed_users:
+        debts_repo.create(chat_id=seed_chat, user_id=uid, amount=0)
+
+    debts = _walk(lambda after_id: debts_repo.page_by_chat(chat_id=seed_chat, limit=2, after_id=after_id), "after_id")
+    users = _walk(lambda after_id: users_repo.page(limit=2, after_id=after_id), "after_id")
+    assert len(debts) == 3
+    assert users == sorted(seed_users)
+
+
+def test_deep_page_is_an_index_seek(engine, session, tx_repo, debts_repo, seed_chat):
+    run_migrations(engine)
+    captured = []
+    listener = lambda conn, cur, stmt, params, *a: captured.append((stmt, params))
+    event.listen(engine, "before_cursor_execute", listener)
+    tx_repo.page_by_chat(chat_id=seed_chat, limit=20, before_id=10_000, newest_first=True)
+    debts_repo.page_by_chat(chat_id=seed_chat, limit=20, after_id=10_000)
+    event.remove(engine, "before_cursor_execute", listener)
+
+    plans = [" | ".join(row[-1] for row in session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + s, p))
+             for s, p in captured if "LIMIT" in s]
+    assert "ix_transactions_chat_id_id (chat_id=? AND id<?)" in plans[0]
+    assert "ix_debts_chat_id_id (chat_id=? AND id>?)" in plans[1]
+    assert all("TEMP B-TREE" not in plan for plan in plans)
+
+
+def test_cursor_roundtrip_and_rejects_garbage():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+    for token in ("", "!!!", encode_cursor(1)[:-1] + "*", "eDEy"):
+        with pytest.raises(ValueError):
+            decode_cursor(token)
@@ -0,0 +1,203 @@
+# tests/test_rebuild_scheduler.py
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from services.rebuild_scheduler import RebuildScheduler
+from services.worker_pool import WorkerPool
+
+
+@pytest.fixture
+def session_maker(async_engine):
+    return async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def scheduler(session_maker):
+    scheduler = RebuildScheduler(wait_timeout=5.0, retry_delay=0.01)
+    scheduler.start(session_maker, WorkerPool(kind="off"))
+    yield scheduler
+    asyncio.run(scheduler.stop())
+
+
+def add_tx(tx_service, seed_users, seed_chat, amount=300):
+    u1, u2, u3 = seed_users
+    tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=amount, title="Покупка",
+        participants=[(u2, None, None), (u3, None, None)],
+    )
+
+
+def slow_rebuild(scheduler, log, delay=0.05, during=None):
+    """Подмена одного прохода: фиксирует параллельность; during() выполняется посреди первого прохода."""
+    state = {"running": 0, "max": 0}
+
+    async def fake(chat_id):
+        scheduler.runs += 1
+        state["running"] += 1
+        state["max"] = max(state["max"], state["running"])
+        log.append(chat_id)
+        await asyncio.sleep(delay / 2)
+        if during is not None and len(log) == 1:
+            during()
+        await asyncio.sleep(delay / 2)
+        state["running"] -= 1
+        return True
+
+    scheduler._rebuild = fake
+    return state
+
+
+def test_burst_of_requests_runs_one_rebuild(scheduler, debts_repo, tx_service, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    add_tx(tx_service, seed_users, seed_chat)
+    debts_repo.bulk_upsert(chat_id=seed_chat, balances={u1: 1})  # «разъехавшиеся» балансы
+
+    async def scenario():
+        merged = [scheduler.request(seed_chat) for _ in range(5)]
+        assert scheduler.is_dirty(seed_chat)
+        assert await scheduler.wait(seed_chat)
+        return merged
+
+    assert asyncio.run(scenario()) == [True, False, False, False, False]
+    assert scheduler.stats() == {"active": 0, "requested": 5, "coalesced": 4, "runs": 1, "failures": 0,
+                                 "deferred": 0, "abandoned": 0}
+    rows = {d.user_id: d.amount for d in debts_repo.list_by_chat(chat_id=seed_chat)}
+    assert rows == {u1: 300, u2: -150, u3: -150}
+
+
+def test_request_during_rebuild_runs_once_more_never_in_parallel(scheduler):
+    log = []
+    state = slow_rebuild(scheduler, log)
+
+    async def scenario():
+        scheduler.request(-1)
+        await asyncio.sleep(0.01)  # первый проход уже идёт
+        scheduler.request(-1)
+        scheduler.request(-1)
+        scheduler.request(-2)
+        await asyncio.gather(scheduler.wait(-1), scheduler.wait(-2))
+
+    asyncio.run(scenario())
+    assert sorted(log) == [-2, -1, -1]
+    # Разные чаты могут идти одновременно, один и тот же — только по очереди
+    assert state["max"] == 2
+    assert scheduler.stats()["coalesced"] == 1
+
+
+def test_commit_to_chat_during_rebuild_schedules_follow_up(scheduler, tx_service, seed_users, seed_chat):
+    log = []
+    slow_rebuild(scheduler, log, during=lambda: add_tx(tx_service, seed_users, seed_chat))
+
+    async def scenario():
+        scheduler.request(seed_chat)
+        await scheduler.wait(seed_chat)
+
+    asyncio.run(scenario())
+    # /addtx закоммитил дельту, пока шёл первый проход — второй проход её учтёт
+    assert log == [seed_chat, seed_chat]
+
+
+def test_commits_without_rebuild_do_not_schedule(scheduler, tx_service, seed_users, seed_chat):
+    add_tx(tx_service, seed_users, seed_chat)
+    assert not scheduler.is_dirty(seed_chat)
+    assert scheduler.stats()["runs"] == 0
+
+
+def test_wait_returns_false_on_timeout(scheduler):
+    slow_rebuild(scheduler, [], delay=0.2)
+
+    async def scenario():
+        assert await scheduler.wait(-1, timeout=0)  # чистый чат — без ожидания
+        scheduler.request(-1)
+        slow = await scheduler.wait(-1, timeout=0.01)
+        done = await scheduler.wait(-1)
+        return slow, done
+
+    assert asyncio.run(scenario()) == (False, True)
+
+
+def test_busy_pool_retries(scheduler):
+    attempts = []
+
+    async def flaky(chat_id):
+        attempts.append(chat_id)
+        return len(attempts) > 1
+
+    scheduler._rebuild = flaky
+
+    async def scenario():
+        scheduler.request(-1)
+        await scheduler.wait(-1)
+
+    asyncio.run(scenario())
+    assert attempts == [-1, -1]
+    assert scheduler.stats()["deferred"] == 1
+
+
+def test_saturated_pool_backs_off_and_gives_up(scheduler, monkeypatch):
+    attempts = []
+    pauses = []
+    sleep = asyncio.sleep
+
+    async def busy(chat_id):
+        attempts.append(chat_id)
+        return False
+
+    async def record_sleep(delay):
+        pauses.append(delay)
+        await sleep(0)
+
+    scheduler._rebuild = busy
+    monkeypatch.setattr("services.rebuild_scheduler.asyncio.sleep", record_sleep)
+
+    async def scenario():
+        scheduler.request(-1)
+        return await scheduler.wait(-1)
+
+    # Читатель дожидается снятия пересчёта, а не висит на каждом запросе до таймаута
+    assert asyncio.run(scenario()) is True
+    assert not scheduler.is_dirty(-1)
+    assert len(attempts) == scheduler.max_retries + 1
+    assert pauses == [0.01, 0.02, 0.04]
+    stats = scheduler.stats()
+    assert (stats["deferred"], stats["abandoned"], stats["active"]) == (4, 1, 0)
+
+    # Снятый пересчёт не мешает новому запросу
+    scheduler._rebuild = lambda chat_id: sleep(0, result=True)
+
+    async def again():
+        assert scheduler.request(-1)
+        return await scheduler.wait(-1)
+
+    assert asyncio.run(again()) is True
+
+
+def test_rebuild_handler_replies_immediately_and_balance_waits(scheduler, monkeypatch, async_session, make_message,
+                                                               users_repo, seed_users, seed_chat):
+    from bot.handlers import basic
+
+    monkeypatch.setattr(basic, "rebuild_scheduler", scheduler)
+    log = []
+    slow_rebuild(scheduler, log, delay=0.1)
+    user = users_repo.get(seed_users[0])
+    first = make_message("/rebuild", chat_id=seed_chat, user=user)
+    second = make_message("/rebuild", chat_id=seed_chat, user=user)
+    balance = make_message("/balance", chat_id=seed_chat, user=user)
+
+    async def scenario():
+        await basic.cmd_rebuild(first, async_session)
+        await basic.cmd_rebuild(second, async_session)
+        assert scheduler.is_dirty(seed_chat)
+        await basic.cmd_balance(balance, async_session)
+        return scheduler.is_dirty(seed_chat)
+
+    assert asyncio.run(scenario()) is False
+    assert "Пересчитываю" in first.replies[0]
+    assert "уже в очереди" in second.replies[0]
+    assert log == [seed_chat]
+    assert balance.replies and basic.REBUILDING_NOTE not in balance.replies[0]
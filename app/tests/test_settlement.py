@@ -0,0 +1,49 @@
+# tests/test_settlement.py
+from __future__ import annotations
+
+import random
+
+from services.settlement import exact_settlements, greedy_settlements, solve_settlements
+
+
+def _apply(balances, plan):
+    net = dict(balances)
+    for debtor_id, creditor_id, amount in plan:
+        net[debtor_id] += amount
+        net[creditor_id] -= amount
+    return net
+
+
+def test_exact_beats_greedy_on_zero_sum_subgroups():
+    # {5: +6, 1: -6} и {4: +3, 6: +6, 9: -8, 8: +5, 7: -6}: жадный путает группы
+    balances = {1: -600, 4: 300, 5: 600, 6: 600, 7: -600, 8: 500, 9: -800}
+
+    exact = exact_settlements(balances)
+    greedy = greedy_settlements(balances)
+
+    assert len(exact) < len(greedy)
+    assert all(v == 0 for v in _apply(balances, exact).values())
+    assert all(v == 0 for v in _apply(balances, greedy).values())
+
+
+def test_exact_is_never_worse_than_greedy():
+    rnd = random.Random(7)
+    for _ in range(200):
+        values = [rnd.randint(-900, 900) for _ in range(rnd.randint(2, 9))]
+        values.append(-sum(values))
+        balances = {uid: v for uid, v in enumerate(values, start=1)}
+
+        exact = exact_settlements(balances)
+        assert len(exact) <= len(greedy_settlements(balances))
+        assert all(v == 0 for v in _apply(balances, exact).values())
+
+
+def test_solver_falls_back_to_greedy_outside_budget():
+    rnd = random.Random(3)
+    values = [rnd.randint(-5000, 5000) for _ in range(29)]
+    values.append(-sum(values))
+    balances = {uid: v for uid, v in enumerate(values, start=1)}
+
+    greedy = greedy_settlements(balances)
+    assert solve_settlements(balances, mode="auto", max_members=10) == greedy
+    assert solve_settlements(balances, mode="exact", time_budget=0.0) == greedy
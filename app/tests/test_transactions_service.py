@@ -125,4 +125,122 @@ def test_delete_transaction(tx_service, parts_repo, seed_users, seed_chat, tx_re
     assert len(parts2) == 0
 
     # И транзакции тоже нет
-    assert tx_repo.get(tx.id) is None
\ No newline at end of file
+    assert tx_repo.get(tx.id) is None
+
+def test_participants_cost_constant_number_of_statements(tx_service, users_repo, parts_repo, engine, seed_users,
+                                                         seed_chat):
+    from sqlalchemy import event
+
+    for uid in range(1000, 1030):
+        users_repo.create(id=uid, username=f"guest{uid}", first_name=None)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def count_for(participant_ids):
+        statements.clear()
+        tx, parts = tx_service.create_transaction_with_participants(
+            chat_id=seed_chat, creator_id=seed_users[0], amount=3000, title="Ужин",
+            participants=[(uid, None, None) for uid in participant_ids],
+        )
+        assert len(parts) == len(participant_ids)
+        return len(statements)
+
+    small = count_for(seed_users[1:])
+    big = count_for(range(1000, 1030))
+    assert small == big
+
+    shares = [p.share_amount for p in parts_repo.list_by_transaction(transaction_id=parts_repo.get(1).transaction_id)]
+    assert sum(shares) == 3000
+
+
+def test_create_many_returns_rows_in_order(tx_repo, parts_repo, seed_users, seed_chat):
+    u1, u2, u3 = seed_users
+    tx = tx_repo.create(chat_id=seed_chat, creator_id=u1, amount=300, title="Кофе")
+
+    parts = parts_repo.create_many(transaction_id=tx.id, rows=[(u3, 100, "кофе"), (u2, 200, "кофе")])
+
+    assert [(p.user_id, p.share_amount) for p in parts] == [(u3, 100), (u2, 200)]
+    assert [p.id for p in parts_repo.list_by_transaction(transaction_id=tx.id)] == [p.id for p in parts]
+
+
+def test_delete_many_is_one_statement_with_cascade(tx_service, tx_repo, parts_repo, debts_repo, engine,
+                                                   seed_users, seed_chat):
+    from sqlalchemy import event
+
+    u1, u2, u3 = seed_users
+    txs = [
+        tx_service.create_transaction_with_participants(
+            chat_id=seed_chat, creator_id=creator, amount=600, title="Обед",
+            participants=[(u2, 300, "обед"), (u3, 300, "обед")],
+        )[0]
+        for creator in (u1, u1, u2)
+    ]
+    keep = txs[2].id
+
+    deletes = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda *args: deletes.append(args[2]) if args[2].startswith("DELETE") else None)
+    deleted = tx_service.delete_transactions(chat_id=seed_chat, transaction_ids=[txs[0].id, txs[1].id, 999_999])
+
+    assert deleted == [txs[0].id, txs[1].id]
+    assert len(deletes) == 1
+    assert parts_repo.list_by_transaction(transaction_id=txs[0].id) == []
+    assert [t.id for t in tx_repo.list_by_chat(chat_id=seed_chat)] == [keep]
+    assert {d.user_id: d.amount for d in debts_repo.list_by_chat(chat_id=seed_chat)} == \
+        tx_repo.balances_by_chat(chat_id=seed_chat) | {u1: 0}
+
+
+def test_overlapping_delete_reverses_only_what_it_deleted(tx_service, tx_repo, debts_repo, session,
+                                                          seed_users, seed_chat):
+    from sqlalchemy import text
+
+    u1, u2, u3 = seed_users
+    txs = [
+        tx_service.create_transaction_with_participants(
+            chat_id=seed_chat, creator_id=u1, amount=200 * (i + 1), title="Обед",
+            participants=[(u2, 100 * (i + 1), "обед"), (u3, 100 * (i + 1), "обед")],
+        )[0].id
+        for i in range(3)
+    ]
+    real_delete_many = tx_repo.delete_many
+
+    def delete_after_other_replica(*, chat_id, ids):
+        # Между чтением вкладов и DELETE транзакцию txs[1] уже удалил и откатил другой /del
+        other = tx_repo.balances_by_chat(chat_id=chat_id, ids=[txs[1]])
+        session.execute(text("DELETE FROM transactions WHERE id = :id"), {"id": txs[1]})
+        debts_repo.apply_deltas(chat_id=chat_id, deltas={uid: -amount for uid, amount in other.items()})
+        return real_delete_many(chat_id=chat_id, ids=ids)
+
+    tx_repo.delete_many = delete_after_other_replica
+    assert tx_service.delete_transactions(chat_id=seed_chat, transaction_ids=txs[:2]) == [txs[0]]
+
+    balances = {d.user_id: d.amount for d in debts_repo.list_by_chat(chat_id=seed_chat)}
+    assert balances == tx_repo.balances_by_chat(chat_id=seed_chat) == {u1: 600, u2: -300, u3: -300}
+
+
+def test_delete_locks_chat_before_reading(monkeypatch, tx_service, tx_repo, seed_users, seed_chat):
+    import repositories.debts_repo as debts_repo_module
+
+    u1, u2, _ = seed_users
+    tx, _ = tx_service.create_transaction_with_participants(
+        chat_id=seed_chat, creator_id=u1, amount=100, title="Кофе", participants=[(u2, 100, "кофе")],
+    )
+    calls = []
+    monkeypatch.setattr(debts_repo_module, "lock_chat", lambda session, chat_id: calls.append("lock") or True)
+    real_contributions = tx_repo.balances_by_transaction
+    tx_repo.balances_by_transaction = lambda **kw: calls.append("read") or real_contributions(**kw)
+
+    tx_service.delete_transactions(chat_id=seed_chat, transaction_ids=[tx.id])
+    assert calls[:2] == ["lock", "read"]
+
+
+def test_parse_transaction_ids():
+    import pytest
+    from bot.handlers.transactions import parse_transaction_ids
+
+    assert parse_transaction_ids("12 15 20-23") == [12, 15, 20, 21, 22, 23]
+    assert parse_transaction_ids("5,3, 3") == [3, 5]
+    for bad in ("", "abc", "30-20", "1-100000"):
+        with pytest.raises(ValueError):
+            parse_transaction_ids(bad)
@@ -0,0 +1,84 @@
+# tests/test_unit_of_work.py
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+from aiogram.enums import MessageEntityType
+from sqlalchemy import event, func, select
+
+from models.crud.unit_of_work import committing_unit_of_work, unit_of_work
+from models.transactions import Transaction
+from models.users import User
+
+
+@pytest.fixture
+def commits(session):
+    counter = []
+    event.listen(session, "after_commit", lambda s: counter.append(1))
+    return counter
+
+
+def _mentions(text):
+    return [
+        SimpleNamespace(type=MessageEntityType.MENTION, offset=text.index(word), length=len(word), user=None)
+        for word in text.split() if word.startswith("@")
+    ]
+
+
+def test_crud_only_flushes_inside_unit_of_work(session, users_repo, commits):
+    with unit_of_work(session):
+        user = users_repo.create(id=1, username="a", first_name=None)
+        users_repo.update(id=1, first_name="А")
+        assert user.id == 1 and commits == []
+    assert len(commits) == 1
+    assert session.get(User, 1).first_name == "А"
+
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            users_repo.create(id=2, username="b", first_name=None)
+            raise RuntimeError("boom")
+    assert session.get(User, 2) is None
+
+
+def test_committing_unit_of_work_commits_inside_outer(session, users_repo, commits):
+    with unit_of_work(session):
+        users_repo.create(id=1, username="a", first_name=None)
+        with committing_unit_of_work(session):
+            users_repo.create(id=2, username="b", first_name=None)
+        assert len(commits) == 1
+        users_repo.create(id=3, username="c", first_name=None)
+    assert len(commits) == 2
+    assert [session.get(User, uid) is not None for uid in (1, 2, 3)] == [True, True, True]
+
+
+def test_autocommit_stays_outside_unit_of_work(users_repo, commits):
+    users_repo.create(id=1, username="a", first_name=None)
+    users_repo.update(id=1, first_name="А")
+    assert len(commits) == 2
+
+
+def test_addtx_handler_commits_before_replying(engine, async_session, users_repo, debts_repo, seed_users, seed_chat,
+                                               make_message, run_handler):
+    from bot.handlers.basic import cmd_addtx
+
+    u1, u2, u3 = seed_users
+    events = []
+    event.listen(async_session.sync_session, "after_commit", lambda s: events.append("commit"))
+    text = "/addtx 300 Пицца @vasya @petya @masha"
+    message = make_message(text, chat_id=seed_chat, user=users_repo.get(u1), entities=_mentions(text))
+    answer = message.answer
+
+    async def answer_and_peek(text, **kwargs):
+        # Другое соединение уже видит транзакцию: запись (и блокировка чата) закрыта до ответа в Telegram
+        with engine.connect() as conn:
+            events.append(("answer", conn.execute(select(func.count()).select_from(Transaction)).scalar_one()))
+        return await answer(text, **kwargs)
+
+    message.answer = answer_and_peek
+
+    assert run_handler(cmd_addtx, message) == ["Ок! Добавил транзакцию: 300.00 — Пицца"]
+    assert events[:2] == ["commit", ("answer", 1)]
+    assert {d.user_id: d.amount for d in debts_repo.list_by_chat(chat_id=seed_chat)} == {
+        u1: 20000, u2: -10000, u3: -10000,
+    }
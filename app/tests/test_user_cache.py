@@ -0,0 +1,101 @@
+# tests/test_user_cache.py
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from aiogram.enums import MessageEntityType
+from sqlalchemy import event
+
+from cache.lru import LRUCache
+from cache.user_display import UserDisplay, user_display_cache, user_cache_stats
+from bot.utils.formatting import UserNames
+from bot.utils.ensure_ctx import ensure_user_and_chat
+from repositories import UsersRepoSqlModel
+
+
+def _user_selects(engine):
+    selects = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda *args: selects.append(args[2]) if "FROM users" in args[2] else None)
+    return selects
+
+
+def test_display_cache_is_shared_across_sessions(session, engine, users_repo, seed_users):
+    u1, u2, _ = seed_users
+    selects = _user_selects(engine)
+    hits_before = user_cache_stats()["hits"]
+
+    assert users_repo.get_display_many([u1, u2, 404]) == {
+        u1: UserDisplay(u1, "vasya", "Вася"),
+        u2: UserDisplay(u2, "petya", "Петя"),
+    }
+    assert len(selects) == 1
+
+    # Новый апдейт — новый UserNames, но имена уже в кэше процесса
+    names = UserNames(users_repo).load([u1, u2])
+    assert names[u1].first_name == "Вася"
+    assert len(selects) == 1
+
+    stats = user_cache_stats()
+    assert stats["hits"] - hits_before == 2 and stats["hit_ratio"] > 0
+
+
+def test_update_invalidates_cached_name(session, users_repo, seed_users):
+    u1, _, _ = seed_users
+    users_repo.get_display_many([u1])
+    assert user_display_cache.get(u1) is not None
+
+    users_repo.update(id=u1, first_name="Василий")
+
+    assert user_display_cache.get(u1) is None
+    assert users_repo.get_display_many([u1])[u1].first_name == "Василий"
+
+
+def test_uncommitted_change_is_not_cached_until_commit(session, seed_users):
+    u1, _, _ = seed_users
+    repo = UsersRepoSqlModel(session)
+    session.info["uow_deferred_commit"] = True  # как внутри unit_of_work: изменения только flush
+    repo.update(id=u1, first_name="Василий")
+
+    assert repo.get_display_many([u1])[u1].first_name == "Василий"
+    assert user_display_cache.get(u1) is None
+
+    session.info.pop("uow_deferred_commit")
+    session.commit()
+    repo.get_display_many([u1])
+    assert user_display_cache.get(u1) == UserDisplay(u1, "vasya", "Василий")
+
+
+def test_lru_bound_counts_evictions(session, seed_users):
+    cache = LRUCache(maxsize=2, ttl=60)
+    repo = UsersRepoSqlModel(session, cache=cache)
+    repo.get_display_many(seed_users)
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ensure_user_and_chat_replaces_stale_user(session, seed_chat):
+    user_display_cache.set(555, UserDisplay(555, "old", "Старое"))
+    ensure_user_and_chat(
+        session,
+        tg_user=SimpleNamespace(id=555, username="new", first_name="Новое"),
+        tg_chat=SimpleNamespace(id=seed_chat, title="Test Chat", full_name="Test Chat"),
+    )
+    assert user_display_cache.get(555) == UserDisplay(555, "new", "Новое")
+
+
+def test_addtx_text_mention_upserts_and_invalidates(users_repo, seed_users, seed_chat, make_message, run_handler):
+    from bot.handlers.basic import cmd_addtx
+
+    u1, u2, _ = seed_users
+    users_repo.get_display_many([u2])
+    renamed = SimpleNamespace(id=u2, username="petya", first_name="Пётр")
+    text = "/addtx 200 Кофе Пётр"
+    mention = SimpleNamespace(type=MessageEntityType.TEXT_MENTION, user=renamed,
+                              offset=text.index("Пётр"), length=len("Пётр"))
+    message = make_message(text, chat_id=seed_chat, user=users_repo.get(u1), entities=[mention])
+
+    run_handler(cmd_addtx, message)
+
+    assert users_repo.get(u2).first_name == "Пётр"
+    assert users_repo.get_display_many([u2])[u2].first_name == "Пётр"
@@ -0,0 +1,229 @@
+# tests/test_webhook.py
+from __future__ import annotations
+
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiohttp import web
+
+from bot.handlers import autoregister
+from bot.webhook import WEBHOOK_HANDLER, BoundedRequestHandler, build_webhook_app
+from services.autoregistration import AutoRegistration
+
+SECRET = "s3cret-token"
+PATH = "/webhook"
+
+
+def fake_update(update_id, *, chat_id=-100, user_id=1000):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "group", "title": "Group"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U", "username": f"u{user_id}"},
+            "text": "привет",
+        },
+    }
+
+
+def make_dispatcher(handler):
+    # Отдельный Router: роутеры бота уже могут быть привязаны к другому Dispatcher
+    router = Router()
+    router.message()(handler)
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}{PATH}"
+
+
+async def post(client, url, update, secret=SECRET):
+    async with client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as resp:
+        return resp.status
+
+
+def test_secret_is_required():
+    with pytest.raises(ValueError):
+        BoundedRequestHandler(Dispatcher(), Bot("42:TEST"), secret_token="")
+
+
+def test_burst_of_updates_through_local_server(monkeypatch):
+    registration = AutoRegistration()
+    monkeypatch.setattr(autoregister, "autoregistration", registration)
+    dp = make_dispatcher(autoregister.auto_register)
+    total, concurrency = 500, 16
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        app = build_webhook_app(dp, bot, path=PATH, secret_token=SECRET, max_concurrency=concurrency,
+                                max_pending=total)
+        runner, url = await serve(app)
+        handler = app[WEBHOOK_HANDLER]
+        try:
+            async with aiohttp.ClientSession() as client:
+                assert await post(client, url, fake_update(0), secret="wrong") == 401
+                statuses = await asyncio.gather(*(
+                    post(client, url, fake_update(i, chat_id=-100 - i % 10, user_id=1000 + i % 50))
+                    for i in range(1, total + 1)
+                ))
+                await handler.drain()
+        finally:
+            await runner.cleanup()
+        return statuses, handler.stats()
+
+    statuses, stats = asyncio.run(scenario())
+
+    assert statuses == [200] * total
+    assert stats["processed"] == total and stats["failed"] == 0 and stats["unauthorized"] == 1
+    assert stats["in_flight"] == 0 and 0 < stats["max_running"] <= concurrency
+    # 50 пользователей × 10 чатов, но пар (user, chat) ровно 50: i % 10 и i % 50 согласованы
+    assert registration.pending == 50 and registration.stats()["seen"] == total
+
+
+def test_method_returned_by_handler_is_sent(monkeypatch):
+    async def reply_in_webhook(message):
+        return message.answer("ok")
+
+    dp = make_dispatcher(reply_in_webhook)
+    sent = []
+
+    async def silent_call_request(bot, result):
+        sent.append(result)
+
+    monkeypatch.setattr(dp, "silent_call_request", silent_call_request)
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        app = build_webhook_app(dp, bot, path=PATH, secret_token=SECRET)
+        runner, url = await serve(app)
+        try:
+            async with aiohttp.ClientSession() as client:
+                status = await post(client, url, fake_update(1))
+                await app[WEBHOOK_HANDLER].drain()
+        finally:
+            await runner.cleanup()
+        return status
+
+    assert asyncio.run(scenario()) == 200
+    assert [m.text for m in sent] == ["ok"]
+
+
+def test_concurrency_is_bounded_and_overflow_gets_503():
+    active = {"now": 0, "max": 0}
+    release = asyncio.Event()
+
+    async def slow_handler(message):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await release.wait()
+        active["now"] -= 1
+
+    dp = make_dispatcher(slow_handler)
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        app = build_webhook_app(dp, bot, path=PATH, secret_token=SECRET, max_concurrency=3, max_pending=2)
+        runner, url = await serve(app)
+        handler = app[WEBHOOK_HANDLER]
+        try:
+            async with aiohttp.ClientSession() as client:
+                # Все 5 мест заняты (3 обрабатываются, 2 ждут) — 200 пришёл сразу, не дожидаясь обработки
+                accepted = [await post(client, url, fake_update(i)) for i in range(5)]
+                rejected = await post(client, url, fake_update(99))
+                await asyncio.sleep(0.05)
+                in_progress = active["now"]
+                release.set()
+                await handler.drain()
+        finally:
+            await runner.cleanup()
+        return accepted, rejected, in_progress, handler.stats()
+
+    accepted, rejected, in_progress, stats = asyncio.run(scenario())
+    assert accepted == [200] * 5 and rejected == 503
+    assert in_progress == 3 and active["max"] == 3
+    assert stats["processed"] == 5 and stats["rejected"] == 1
+    assert stats["max_running"] == 3 and stats["max_in_flight"] == 5
+
+
+def test_capacity_is_reserved_before_body_is_read():
+    release = asyncio.Event()
+
+    async def stuck_handler(message):
+        await release.wait()
+
+    dp = make_dispatcher(stuck_handler)
+
+    async def scenario():
+        bodies_sent = asyncio.Event()
+        bot = Bot("42:TEST")
+        app = build_webhook_app(dp, bot, path=PATH, secret_token=SECRET, max_concurrency=2, max_pending=1)
+        runner, url = await serve(app)
+        handler = app[WEBHOOK_HANDLER]
+
+        async def slow_body(update_id):
+            # Заголовки уже у сервера, тело — только после bodies_sent
+            await bodies_sent.wait()
+            yield json.dumps(fake_update(update_id)).encode()
+
+        async def post_slowly(client, update_id):
+            async with client.post(url, data=slow_body(update_id), headers={
+                "X-Telegram-Bot-Api-Secret-Token": SECRET, "Content-Type": "application/json",
+            }) as resp:
+                return resp.status
+
+        try:
+            async with aiohttp.ClientSession() as client:
+                requests = [asyncio.create_task(post_slowly(client, i)) for i in range(6)]
+                await asyncio.sleep(0.2)
+                bodies_sent.set()
+                statuses = await asyncio.gather(*requests)
+                release.set()
+                await handler.drain()
+        finally:
+            await runner.cleanup()
+        return statuses, handler.stats()
+
+    statuses, stats = asyncio.run(scenario())
+    # Мест 3 (2 + 1): остальные получают 503, хотя ни одно тело ещё не было прочитано при проверке
+    assert sorted(statuses) == [200] * 3 + [503] * 3
+    assert stats["max_in_flight"] == 3 and stats["rejected"] == 3
+    assert stats["in_flight"] == 0 and stats["processed"] == 3
+
+
+def test_malformed_body_is_dropped_without_redelivery():
+    dp = make_dispatcher(lambda message: None)
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        app = build_webhook_app(dp, bot, path=PATH, secret_token=SECRET)
+        runner, url = await serve(app)
+        handler = app[WEBHOOK_HANDLER]
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET, "Content-Type": "application/json"}
+        try:
+            async with aiohttp.ClientSession() as client:
+                statuses = []
+                for body in (b"{not json", b"[1, 2]"):
+                    async with client.post(url, data=body, headers=headers) as resp:
+                        statuses.append(resp.status)
+                statuses.append(await post(client, url, fake_update(1)))
+                await handler.drain()
+        finally:
+            await runner.cleanup()
+        return statuses, handler.stats()
+
+    statuses, stats = asyncio.run(scenario())
+    # 200 — чтобы Telegram не доставлял битое тело снова; место в очереди освобождено
+    assert statuses == [200, 200, 200]
+    assert stats["malformed"] == 2 and stats["accepted"] == 1 and stats["processed"] == 1
+    assert stats["in_flight"] == 0 and stats["failed"] == 0
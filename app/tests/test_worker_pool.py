@@ -0,0 +1,90 @@
+# tests/test_worker_pool.py
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+import services.async_services as async_services
+from services.settlement import solve_settlements
+from services.worker_pool import WorkerPool, WorkerPoolBusy
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(kind="thread", size=1, queue=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_submit_records_wait_and_run_time(pool):
+    async def scenario():
+        return await asyncio.gather(*(pool.submit(sum, range(n)) for n in (10, 100)))
+
+    assert asyncio.run(scenario()) == [45, 4950]
+    stats = pool.stats()
+    assert stats["completed"] == 2 and stats["in_flight"] == 0
+    assert stats["avg_run_ms"] >= 0 and stats["max_wait_ms"] >= 0
+
+
+def test_full_queue_is_rejected_not_queued(pool):
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.submit(release.wait, 5))
+        queued = asyncio.ensure_future(pool.submit(sum, [1, 2]))
+        await asyncio.sleep(0)
+        with pytest.raises(WorkerPoolBusy):
+            await pool.submit(sum, [3])
+        release.set()
+        return await running, await queued
+
+    assert asyncio.run(scenario()) == (True, 3)
+    assert pool.stats()["rejected"] == 1
+
+
+def test_failures_are_counted_and_raised(pool):
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(pool.submit(divmod, 1, 0))
+    assert pool.stats()["failed"] == 1 and pool.stats()["in_flight"] == 0
+
+
+def test_process_pool_runs_settlement_search():
+    pool = WorkerPool(kind="process", size=1, queue=0)
+    try:
+        plan = asyncio.run(pool.submit(solve_settlements, {1: 300, 2: -100, 3: -200}, mode="exact"))
+    finally:
+        pool.shutdown()
+    assert sorted(plan) == [(2, 1, 100), (3, 1, 200)]
+
+
+def _seed_group(tx_service, users_repo, chat_id, members):
+    ids = [users_repo.create(id=5000 + i, username=f"m{i}", first_name=None).id for i in range(members)]
+    for i, payer in enumerate(ids):
+        tx_service.create_transaction_with_participants(
+            chat_id=chat_id, creator_id=payer, amount=(i + 1) * 700, title=f"Покупка {i}",
+            participants=[(uid, None, None) for uid in ids[:3]],
+        )
+    return ids
+
+
+def test_optimize_offloads_large_groups(async_session, tx_service, users_repo, seed_chat, pool):
+    _seed_group(tx_service, users_repo, seed_chat, 14)
+    services = async_services.build_async_services(async_session, pool=pool)
+
+    plan = asyncio.run(services.debts_service.optimize_settlements(seed_chat, mode="greedy"))
+
+    assert plan and pool.stats()["completed"] == 1
+
+
+def test_busy_pool_gets_retry_reply(tx_service, users_repo, seed_chat, make_message, run_handler, monkeypatch):
+    from bot.handlers.basic import cmd_optimize, BUSY_TEXT
+
+    ids = _seed_group(tx_service, users_repo, seed_chat, 14)
+    saturated = WorkerPool(kind="thread", size=0, queue=0)
+    monkeypatch.setattr(async_services, "worker_pool", saturated)
+
+    message = make_message("/optimize greedy", chat_id=seed_chat, user=users_repo.get(ids[0]))
+    assert run_handler(cmd_optimize, message) == [BUSY_TEXT]
+    assert saturated.stats()["rejected"] == 1